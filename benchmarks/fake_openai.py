@@ -0,0 +1,361 @@
+# webapp/benchmarks/fake_openai.py
+
+import sys
+import json
+import math
+import time
+import zlib
+import base64
+import random
+import struct
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class Latency:
+    """
+    A latency distribution parsed from "fixed:S", "uniform:LOW,HIGH",
+    "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA" (seconds; a bare number
+    means fixed). Samples are never negative.
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, text: str):
+        kind, _, params = text.partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        if kind not in self.KINDS:
+            raise ValueError(f"unknown latency distribution '{kind}' (expected one of {', '.join(self.KINDS)})")
+        self.kind = kind
+        self.params = [float(value) for value in params.split(",")]
+        self.text = text
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            return p[0]
+        if self.kind == "uniform":
+            return rng.uniform(p[0], p[1])
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(p[0], p[1]))
+        return rng.lognormvariate(math.log(max(p[0], 1e-6)), p[1])
+
+
+def make_png(width: int, height: int, target_bytes: int) -> bytes:
+    """
+    A valid RGB PNG of the given size, about target_bytes long: enough rows
+    are random (incompressible) to reach the target, the rest are flat.
+    """
+    row_bytes = 1 + 3 * width
+    noisy_rows = max(1, min(height, target_bytes // row_bytes))
+    rng = random.Random(width * 31 + height)
+    flat_row = b"\x00" + b"\x80" * (3 * width)
+    raw = b"".join(
+        b"\x00" + rng.getrandbits(24 * width).to_bytes(3 * width, "little") if y < noisy_rows else flat_row
+        for y in range(height)
+    )
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+class FakeConfig:
+    def __init__(self, args: argparse.Namespace):
+        self.chat_latency = Latency(args.chat_latency)
+        self.image_latency = Latency(args.image_latency)
+        self.download_latency = Latency(args.download_latency)
+        self.error_rate = args.error_rate
+        self.error_statuses = [int(code) for code in args.error_statuses.split(",")]
+        self.images_per_spec = args.images_per_spec
+        self.sections = max(args.sections, 1)
+        self.html_bytes = args.html_bytes
+        self.image_bytes = args.image_bytes
+        self.prompt_churn = args.prompt_churn
+        self.stream_chunk_chars = args.stream_chunk_chars
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the parts of the OpenAI API the pipeline uses:
+    chat completions (plain and streamed structured outputs), image
+    generations (URL or b64_json) and the download of generated images.
+    Latency, error rate and payload sizes come from FakeConfig, and
+    GET /stats returns the number of requests served by kind.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], config: FakeConfig, seed: int = 0):
+        super().__init__(address, FakeHandler)
+        self.config = config
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats = {"chat": 0, "images": 0, "downloads": 0, "errors": 0, "bytes_sent": 0}
+        self.stats_lock = threading.Lock()
+        self._pngs: Dict[Tuple[int, int], bytes] = {}
+        self._png_lock = threading.Lock()
+
+    def sample(self, latency: Latency) -> float:
+        with self.rng_lock:
+            return latency.sample(self.rng)
+
+    def chance(self, probability: float) -> bool:
+        with self.rng_lock:
+            return self.rng.random() < probability
+
+    def choice(self, values: List[Any]) -> Any:
+        with self.rng_lock:
+            return self.rng.choice(values)
+
+    def bump(self, name: str, amount: int = 1):
+        with self.stats_lock:
+            self.stats[name] += amount
+
+    def png(self, width: int, height: int) -> bytes:
+        with self._png_lock:
+            key = (width, height)
+            if key not in self._pngs:
+                self._pngs[key] = make_png(width, height, self.config.image_bytes)
+            return self._pngs[key]
+
+    def website(self, sections: Optional[int] = None) -> Dict[str, Any]:
+        """
+        A synthetic page with a header, `sections` sections, images_per_spec
+        images spread over them and filler text up to html_bytes.
+        """
+        config = self.config
+        sections = sections or config.sections
+        images = []
+        for index in range(config.images_per_spec):
+            prompt = f"Photograph number {index} for the benchmark page"
+            if config.prompt_churn and self.chance(config.prompt_churn):
+                prompt += f", variant {self.choice(range(1_000_000))}"
+            images.append({"prompt": prompt, "filename": f"image_{index}.png"})
+
+        blocks = ['<header class="site-header"><h1>Benchmark</h1><nav><a href="#s0">Start</a></nav></header>']
+        for section in range(sections):
+            imgs = "".join(
+                f'<img src="images/{image["filename"]}" alt="Image {index}" class="photo">'
+                for index, image in enumerate(images) if index % sections == section
+            )
+            blocks.append(f'<section id="s{section}" class="block block-{section}"><h2>Section {section}</h2><p>Text.</p>{imgs}</section>')
+        body = "\n".join(blocks)
+        filler_needed = config.html_bytes - len(body)
+        if filler_needed > 0:
+            sentence = "This paragraph pads the page to a realistic size. "
+            body += "\n<footer><p>" + (sentence * (filler_needed // len(sentence) + 1))[:filler_needed] + "</p></footer>"
+        html = (
+            '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="UTF-8">\n<title>Benchmark</title>\n'
+            '<link rel="stylesheet" href="styles.css">\n</head>\n<body>\n' + body + '\n<script src="main.js"></script>\n</body>\n</html>'
+        )
+        css = "\n".join(
+            [".site-header { display: flex; padding: 1rem; }", ".photo { width: 100%; max-width: 480px; }"]
+            + [f".block-{section} {{ padding: {section + 1}rem; color: #333; }}" for section in range(sections)]
+        )
+        js = "document.querySelectorAll('.photo').forEach(function (img) { img.addEventListener('click', function () { img.classList.toggle('open'); }); });"
+        return {"html": html, "css": css, "js": js, "images": images}
+
+
+def _fill_schema(schema: Dict[str, Any], defs: Dict[str, Any]) -> Any:
+    if "$ref" in schema:
+        return _fill_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "anyOf" in schema:
+        return _fill_schema(schema["anyOf"][0], defs)
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _fill_schema(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return []
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    return ""
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeOpenAIServer
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.bump("bytes_sent", len(body))
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        self._send(status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+    def _maybe_fail(self) -> bool:
+        """
+        Answers with an error instead of a result at the configured error rate.
+        """
+        config = self.server.config
+        if not config.error_rate or not self.server.chance(config.error_rate):
+            return False
+        self.server.bump("errors")
+        status = self.server.choice(config.error_statuses)
+        headers = {"retry-after-ms": "200"} if status == 429 else {}
+        kind = "rate_limit_exceeded" if status == 429 else "server_error"
+        self._send_json(status, {"error": {"message": f"fake {status}", "type": kind, "code": kind}}, headers)
+        return True
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.stats_lock:
+                self._send_json(200, dict(self.server.stats))
+            return
+        if self.path.startswith("/files/"):
+            # /files/<width>x<height>/<n>.png
+            try:
+                width, height = (int(value) for value in self.path.split("/")[2].split("x"))
+            except ValueError:
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            time.sleep(self.server.sample(self.server.config.download_latency))
+            self.server.bump("downloads")
+            self._send(200, self.server.png(width, height), "image/png")
+            return
+        self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.endswith("/chat/completions"):
+            self.server.bump("chat")
+            if not self._maybe_fail():
+                self._chat(request)
+        elif self.path.endswith("/images/generations"):
+            self.server.bump("images")
+            if not self._maybe_fail():
+                self._image(request)
+        else:
+            self._send_json(404, {"error": {"message": f"no fake for {self.path}"}})
+
+    def _structured_content(self, request: Dict[str, Any]) -> str:
+        response_format = request.get("response_format") or {}
+        json_schema = response_format.get("json_schema") or {}
+        name = json_schema.get("name", "")
+        schema = json_schema.get("schema") or {}
+        if name in ("WebsiteSpec", "StreamedWebsiteSpec", "WebsiteCode"):
+            site = self.server.website()
+            # Keep the schema's field order: streamed specs list images first
+            content = {field: site[field] for field in schema.get("properties", site) if field in site}
+        elif name == "SectionSpec":
+            content = {"html": '<section class="block"><h2>Refined</h2><p>Text.</p></section>', "css": "", "images": []}
+        elif name == "SpecPatch":
+            content = {"edits": [], "images": self.server.website()["images"]}
+        else:
+            content = _fill_schema(schema, schema.get("$defs", {}))
+        return json.dumps(content)
+
+    def _chat(self, request: Dict[str, Any]):
+        config = self.server.config
+        content = self._structured_content(request)
+        prompt_chars = sum(len(str(message.get("content", ""))) for message in request.get("messages", []))
+        usage = {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        latency = self.server.sample(config.chat_latency)
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request.get("model", "fake")}
+
+        if not request.get("stream"):
+            time.sleep(latency)
+            self._send_json(200, dict(
+                base,
+                object="chat.completion",
+                choices=[{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content, "refusal": None}}],
+                usage=usage,
+            ))
+            return
+
+        # Streamed: spread the latency over the chunks, like tokens arriving
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        pieces = [content[i:i + config.stream_chunk_chars] for i in range(0, len(content), config.stream_chunk_chars)] or [""]
+        delay = latency / len(pieces)
+        for index, piece in enumerate(pieces):
+            delta = {"content": piece}
+            if index == 0:
+                delta["role"] = "assistant"
+            chunk = dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(delay)
+        final = dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (request.get("stream_options") or {}).get("include_usage"):
+            usage_chunk = dict(base, object="chat.completion.chunk", choices=[], usage=usage)
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+        else:
+            self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _image(self, request: Dict[str, Any]):
+        time.sleep(self.server.sample(self.server.config.image_latency))
+        try:
+            width, height = (int(value) for value in str(request.get("size", "1024x1024")).split("x"))
+        except ValueError:
+            width, height = 1024, 1024
+        if request.get("response_format") == "b64_json":
+            data = {"b64_json": base64.b64encode(self.server.png(width, height)).decode("ascii")}
+        else:
+            host, port = self.server.server_address[:2]
+            data = {"url": f"http://{host}:{port}/files/{width}x{height}/{self.server.stats['images']}.png"}
+        self._send_json(200, {"created": int(time.time()), "data": [dict(data, revised_prompt=request.get("prompt"))]})
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--chat-latency", default="lognormal:0.8,0.3", help="Chat completion latency distribution (default: lognormal:0.8,0.3).")
+    parser.add_argument("--image-latency", default="lognormal:2.0,0.3", help="Image generation latency distribution (default: lognormal:2.0,0.3).")
+    parser.add_argument("--download-latency", default="fixed:0.05", help="Image download latency distribution (default: fixed:0.05).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API requests answered with an error (default: 0).")
+    parser.add_argument("--error-statuses", default="429,500", help="Error statuses to pick from (default: 429,500).")
+    parser.add_argument("--images-per-spec", type=int, default=4, help="Images in every generated spec (default: 4).")
+    parser.add_argument("--sections", type=int, default=4, help="Sections in every generated page (default: 4).")
+    parser.add_argument("--html-bytes", type=int, default=20_000, help="Approximate size of the generated HTML (default: 20000).")
+    parser.add_argument("--image-bytes", type=int, default=300_000, help="Approximate size of each generated PNG (default: 300000).")
+    parser.add_argument("--prompt-churn", type=float, default=0.0, help="Chance that an image prompt changes between completions (default: 0).")
+    parser.add_argument("--stream-chunk-chars", type=int, default=200, help="Characters per streamed chunk (default: 200).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI API for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="Port to listen on (default: any free port).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latencies and errors (default: 0).")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer((args.host, args.port), FakeConfig(args), seed=args.seed)
+    host, port = server.server_address[:2]
+    # The benchmark runner reads this line to find the port
+    print(f"Fake OpenAI API listening on http://{host}:{port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
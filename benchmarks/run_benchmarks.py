@@ -0,0 +1,332 @@
+# webapp/benchmarks/run_benchmarks.py
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+FAKE_SERVER = Path(__file__).resolve().parent / "fake_openai.py"
+DEFAULT_RESULTS_FILE = Path(__file__).resolve().parent / "results.jsonl"
+
+# Server settings every scenario starts from; latencies are shorter than the
+# real API so the whole suite runs in a few minutes
+BASE_SERVER = {
+    "chat-latency": "lognormal:0.5,0.3",
+    "image-latency": "lognormal:1.0,0.3",
+    "download-latency": "fixed:0.05",
+    "images-per-spec": 4,
+    "html-bytes": 20_000,
+    "image-bytes": 300_000,
+}
+# Flags every run gets: nothing may be served from a previous run
+BASE_CLI = ["--no-completion-cache", "--no-image-cache"]
+
+
+class Scenario:
+    """
+    One benchmark: fake server settings, extra main.py flags and, for
+    batch scenarios, the number of jobs in the batch file.
+    """
+
+    def __init__(self, name: str, server: Optional[Dict[str, Any]] = None, cli: Optional[List[str]] = None, batch_jobs: int = 0):
+        self.name = name
+        self.server = dict(BASE_SERVER, **(server or {}))
+        self.cli = list(cli or [])
+        self.batch_jobs = batch_jobs
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return {"server": self.server, "cli": self.cli, "batch_jobs": self.batch_jobs}
+
+    @property
+    def config_hash(self) -> str:
+        # Results are only compared between runs of the same configuration
+        return hashlib.sha256(json.dumps(self.params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+SCENARIOS = [
+    Scenario("baseline"),
+    Scenario("images-1", server={"images-per-spec": 1}),
+    Scenario("images-12", server={"images-per-spec": 12}),
+    Scenario("iterations-3", cli=["--iterations", "3", "--improvement", "Make it more colorful."]),
+    Scenario("sections-refine", server={"sections": 6}, cli=["--iterations", "2", "--improvement", "Tighten the copy.", "--refine-mode", "sections"]),
+    Scenario("stream-spec", cli=["--stream-spec"]),
+    Scenario("large-page", server={"html-bytes": 200_000}, cli=["--minify", "--critical-css", "--precompress"]),
+    Scenario("image-concurrency-1", server={"images-per-spec": 8}, cli=["--image-concurrency", "1"]),
+    Scenario("image-concurrency-8", server={"images-per-spec": 8}, cli=["--image-concurrency", "8"]),
+    Scenario("b64-images", cli=["--image-response-format", "b64_json"]),
+    Scenario("errors-20pct", server={"error-rate": 0.2}),
+    Scenario("batch-4", cli=["--chat-concurrency", "4"], batch_jobs=4),
+    Scenario("batch-16", cli=["--chat-concurrency", "8", "--image-concurrency", "8"], batch_jobs=16),
+]
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*args) -> str:
+        result = subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else ""
+
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def start_fake_server(scenario: Scenario, seed: int) -> Tuple[subprocess.Popen, str]:
+    command = [sys.executable, str(FAKE_SERVER), "--seed", str(seed)]
+    for name, value in scenario.server.items():
+        command += [f"--{name}", str(value)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if "http://" not in line:
+        server.kill()
+        raise RuntimeError(f"Fake server did not start: {line!r}")
+    return server, line.strip().split()[-1]
+
+
+def server_stats(base_url: str) -> Dict[str, int]:
+    with urllib.request.urlopen(base_url.rsplit("/v1", 1)[0] + "/stats", timeout=10) as response:
+        return json.loads(response.read())
+
+
+def run_main(command: List[str], env: Dict[str, str], log_path: Path) -> Tuple[int, float, Optional[float]]:
+    """
+    Runs main.py and returns (exit code, wall seconds, peak RSS in MB).
+    Peak RSS covers main.py and the worker processes it waited for.
+    """
+    with open(log_path, "w", encoding="utf-8") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            wall = time.perf_counter() - start
+            process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status >> 8
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+            return process.returncode, wall, round(usage.ru_maxrss / divisor, 1)
+        process.wait()
+        return process.returncode, time.perf_counter() - start, None
+
+
+def trace_breakdown(trace_path: Path) -> Dict[str, Any]:
+    """
+    Stage durations, per-span totals and counters from a --trace file.
+    """
+    if not trace_path.exists():
+        return {"stages": {}, "spans": {}, "counters": {}}
+    with open(trace_path, "r", encoding="utf-8") as f:
+        trace = json.load(f)
+    stages: Dict[str, float] = {}
+    spans: Dict[str, Dict[str, float]] = {}
+    for event in trace["traceEvents"]:
+        if event.get("ph") != "X":
+            continue
+        seconds = event["dur"] / 1_000_000
+        if event.get("cat") == "stage":
+            stages[event["name"]] = round(stages.get(event["name"], 0.0) + seconds, 3)
+        elif event.get("cat") != "job":
+            stats = spans.setdefault(event["name"], {"calls": 0, "seconds": 0.0})
+            stats["calls"] += 1
+            stats["seconds"] = round(stats["seconds"] + seconds, 3)
+    return {"stages": stages, "spans": spans, "counters": trace.get("otherData", {}).get("counters", {})}
+
+
+def run_scenario(scenario: Scenario, work_dir: Path, seed: int) -> Dict[str, Any]:
+    shutil.rmtree(work_dir, ignore_errors=True)
+    work_dir.mkdir(parents=True)
+    server, base_url = start_fake_server(scenario, seed)
+    try:
+        trace_path = work_dir / "trace.json"
+        command = [sys.executable, str(REPO_ROOT / "main.py"), "--openai-base-url", base_url, "--trace", str(trace_path)]
+        command += BASE_CLI + scenario.cli
+        if scenario.batch_jobs:
+            jobs_file = work_dir / "jobs.jsonl"
+            with open(jobs_file, "w", encoding="utf-8") as f:
+                for index in range(scenario.batch_jobs):
+                    job = {"id": f"job-{index}", "details": f"Benchmark site {index}", "output_dir": str(work_dir / f"site-{index}")}
+                    f.write(json.dumps(job) + "\n")
+            command += ["--batch", str(jobs_file)]
+        else:
+            command += [
+                "--details", "A benchmark landing page.",
+                "--output-dir", str(work_dir / "site"),
+                "--images-dir", str(work_dir / "site" / "images"),
+            ]
+
+        env = dict(os.environ, OPENAI_API_KEY="benchmark", PYTHONPATH=str(REPO_ROOT))
+        env.pop("OPENAI_BASE_URL", None)
+        exit_code, wall, peak_rss_mb = run_main(command, env, work_dir / "main.log")
+        requests = server_stats(base_url)
+    finally:
+        server.terminate()
+        server.wait()
+
+    api_requests = requests["chat"] + requests["images"] + requests["downloads"]
+    return dict(
+        exit_code=exit_code,
+        wall_s=round(wall, 3),
+        peak_rss_mb=peak_rss_mb,
+        requests=requests,
+        rps=round(api_requests / wall, 2) if wall else None,
+        **trace_breakdown(trace_path),
+    )
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Medians over the repeats of one scenario (stage times per stage).
+    """
+    ok = [run for run in runs if run["exit_code"] == 0] or runs
+    stage_names = sorted({name for run in ok for name in run["stages"]})
+    return {
+        "wall_s": round(statistics.median(run["wall_s"] for run in ok), 3),
+        "peak_rss_mb": max((run["peak_rss_mb"] for run in ok if run["peak_rss_mb"] is not None), default=None),
+        "rps": round(statistics.median(run["rps"] or 0 for run in ok), 2),
+        "stages": {
+            name: round(statistics.median(run["stages"].get(name, 0.0) for run in ok), 3)
+            for name in stage_names
+        },
+        "failed_runs": sum(1 for run in runs if run["exit_code"] != 0),
+    }
+
+
+def load_baseline(results_file: Path, commit: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    The latest record per (scenario, config) in results_file, only from
+    commits starting with `commit` when one is given.
+    """
+    baseline: Dict[str, Dict[str, Any]] = {}
+    if not results_file.exists():
+        return baseline
+    with open(results_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if commit and not (record.get("commit") or "").startswith(commit):
+                continue
+            baseline[f"{record['scenario']}:{record['config_hash']}"] = record
+    return baseline
+
+
+def compare(records: List[Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float) -> List[str]:
+    """
+    Prints each scenario's change against the baseline and returns the
+    regressions: wall time, peak RSS or a stage that got slower than
+    threshold (a fraction), ignoring stages shorter than 0.1 s.
+    """
+    regressions = []
+    print(f"\n{'scenario':<22}{'wall s':>9}{'change':>9}{'rss MB':>9}{'change':>9}  slowest stage change")
+    for record in records:
+        old = baseline.get(f"{record['scenario']}:{record['config_hash']}")
+        current = record["summary"]
+        if old is None:
+            print(f"{record['scenario']:<22}{current['wall_s']:>9.2f}{'new':>9}")
+            continue
+        previous = old["summary"]
+
+        def change(new_value, old_value) -> Optional[float]:
+            return (new_value - old_value) / old_value if new_value is not None and old_value else None
+
+        wall_change = change(current["wall_s"], previous["wall_s"])
+        rss_change = change(current["peak_rss_mb"], previous["peak_rss_mb"])
+        stage_changes = [
+            (name, change(seconds, previous["stages"].get(name)))
+            for name, seconds in current["stages"].items()
+            if max(seconds, previous["stages"].get(name, 0)) >= 0.1
+        ]
+        stage_changes = [(name, value) for name, value in stage_changes if value is not None]
+        worst = max(stage_changes, key=lambda item: item[1], default=None)
+
+        def percent(value: Optional[float]) -> str:
+            return f"{value * 100:+.0f}%" if value is not None else "-"
+
+        rss = f"{current['peak_rss_mb']:.0f}" if current["peak_rss_mb"] is not None else "-"
+        worst_text = f"{worst[0]} {percent(worst[1])}" if worst else "-"
+        print(f"{record['scenario']:<22}{current['wall_s']:>9.2f}{percent(wall_change):>9}{rss:>9}{percent(rss_change):>9}  {worst_text}")
+
+        for label, value in [("wall time", wall_change), ("peak RSS", rss_change)] + [(f"stage {name}", value) for name, value in stage_changes]:
+            if value is not None and value > threshold:
+                regressions.append(f"{record['scenario']}: {label} {percent(value)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs main.py against a local fake OpenAI API at several scales and records wall time, peak RSS and requests per second."
+    )
+    parser.add_argument("--scenario", action="append", help="Run only this scenario (repeatable). Default: all.")
+    parser.add_argument("--list", action="store_true", help="List the scenarios and exit.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; results are medians (default: 3).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the fake server's latencies and errors (default: 0).")
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS_FILE, help="JSONL file the results are appended to (default: benchmarks/results.jsonl).")
+    parser.add_argument("--compare", type=Path, help="Results file to compare against (default: the --results file before this run).")
+    parser.add_argument("--baseline-commit", help="Compare only against records from this commit (prefix).")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Slowdown (fraction) reported as a regression (default: 0.15).")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 when a regression is found.")
+    parser.add_argument("--work-dir", type=Path, help="Where runs write their output (default: a temporary directory).")
+    args = parser.parse_args()
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:<22}{json.dumps(scenario.params)}")
+        return 0
+    selected = [scenario for scenario in SCENARIOS if not args.scenario or scenario.name in args.scenario]
+    unknown = set(args.scenario or []) - {scenario.name for scenario in selected}
+    if unknown:
+        print(f"Error: unknown scenario(s): {', '.join(sorted(unknown))} (see --list)")
+        return 1
+
+    baseline = load_baseline(args.compare or args.results, args.baseline_commit)
+    revision = git_revision()
+    environment = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+    work_root = args.work_dir or Path(tempfile.mkdtemp(prefix="webapp-bench-"))
+
+    records = []
+    for scenario in selected:
+        runs = []
+        for repeat in range(args.repeat):
+            print(f"[{scenario.name}] run {repeat + 1}/{args.repeat}...", flush=True)
+            run = run_scenario(scenario, work_root / scenario.name, args.seed + repeat)
+            if run["exit_code"] != 0:
+                print(f"[{scenario.name}] main.py exited with {run['exit_code']}; see {work_root / scenario.name / 'main.log'}")
+            runs.append(run)
+        summary = summarize(runs)
+        print(f"[{scenario.name}] {summary['wall_s']:.2f}s, {summary['peak_rss_mb']} MB peak, {summary['rps']} req/s")
+        records.append(dict(
+            revision,
+            timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            scenario=scenario.name,
+            config_hash=scenario.config_hash,
+            params=scenario.params,
+            environment=environment,
+            summary=summary,
+            runs=runs,
+        ))
+
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    print(f"\nResults appended to {args.results}")
+    if args.work_dir is None:
+        shutil.rmtree(work_root, ignore_errors=True)
+
+    regressions = compare(records, baseline, args.threshold)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,110 @@
 # webapp/generators/image_generator.py
 
-import requests
+import os
+import time
+import shutil
+import asyncio
+import hashlib
+import threading
 from pathlib import Path
-from openai import OpenAI
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from .website_generator import ImageSpec
+from .image_planner import ImagePlan
+from services.image_cache import ImageCache, image_cache_key
+from services.prompt_index import PromptIndex, normalize_prompt
+from services.openai_client import get_client
+from services.request_layer import call_with_retry
+from services.tracing import count, span
+from services.downloader import DownloadError, average_download_seconds, download_file, write_base64_file
 
-# Reuse or initialize a new OpenAI client
-client = OpenAI()
+# Subdirectory of an images directory where ImageJobPool jobs write before publishing
+STAGING_DIRNAME = ".staging"
 
-def generate_and_save_image(image_spec: ImageSpec, output_dir: Path, size: str = "1024x1024", quality: str = "standard") -> Path:
+# What b64_json responses saved compared to fetching each image by URL
+_b64_lock = threading.Lock()
+_b64_savings = {"images": 0, "bytes": 0, "seconds": 0.0}
+
+# Image generations made unnecessary by duplicate or similar prompts
+_dedup_lock = threading.Lock()
+_dedup_stats = {"duplicates": 0, "similar": 0}
+
+def _record_avoided(kind: str):
+    with _dedup_lock:
+        _dedup_stats[kind] += 1
+    count(f"image_dedup.{kind}")
+
+def generate_and_save_image(
+    image_spec: ImageSpec,
+    output_dir: Path,
+    size: str = "1024x1024",
+    quality: str = "standard",
+    model: str = "dall-e-3",
+    cache: Optional[ImageCache] = None,
+    response_format: str = "url",
+    similar: Optional[PromptIndex] = None,
+) -> Path:
     """
     Calls the OpenAI Images API to generate an image based on image_spec.prompt.
     Saves the image to output_dir under image_spec.filename (only its name).
+    If a cache is given and already holds an image for the same
+    (model, prompt, size, quality), that image is reused instead. With a
+    PromptIndex as well, so is a cached image whose prompt is similar enough.
+    With response_format="b64_json" the image bytes come back inline and are
+    decoded straight to disk, skipping the separate download of an expiring URL.
     Returns the local file path if successful, or None if there's an error.
     """
+    filename = Path(image_spec.filename).name
+    with span("image.generate", "image", filename=filename, model=model, size=size, quality=quality) as info:
+        file_path = _generate_and_save_image(image_spec, output_dir, size, quality, model, cache, response_format, similar)
+        info["saved"] = file_path is not None
+        return file_path
+
+def _generate_and_save_image(
+    image_spec: ImageSpec,
+    output_dir: Path,
+    size: str,
+    quality: str,
+    model: str,
+    cache: Optional[ImageCache],
+    response_format: str,
+    similar: Optional[PromptIndex] = None,
+) -> Optional[Path]:
+    # Use only the name of the file (strip any directory parts)
+    filename = Path(image_spec.filename).name
+    file_path = output_dir / filename
+
+    cache_key = image_cache_key(model, image_spec.prompt, size, quality)
+    if cache is not None:
+        hit = cache.link_into(cache_key, file_path)
+        count("image_cache.hits" if hit else "image_cache.misses")
+        if hit:
+            print(f"Image cache hit for '{filename}': {file_path.resolve()}")
+            return file_path
+        if similar is not None and _reuse_similar(image_spec.prompt, file_path, model, size, quality, cache, similar):
+            return file_path
+
     try:
-        response = client.images.generate(
-            model="dall-e-3",  # or "dall-e-2"
+        response = call_with_retry(
+            "images",
+            get_client().images.generate,
+            model=model,  # "dall-e-3" or "dall-e-2"
             prompt=image_spec.prompt,
             size=size,
             quality=quality,
+            response_format=response_format,
             n=1
         )
     except Exception as e:
         print(f"Error generating image for prompt '{image_spec.prompt}': {e}")
         return None
 
+    if response_format == "b64_json":
+        saved = _save_b64_image(response, file_path, cache, cache_key)
+        if saved is not None and cache is not None and similar is not None:
+            similar.add(cache_key, image_spec.prompt, model, size, quality)
+        return saved
+
     if not response.data or not response.data[0].url:
         print("No valid image URL returned.")
         return None
@@ -33,19 +112,383 @@ def generate_and_save_image(image_spec: ImageSpec, output_dir: Path, size: str =
     image_url = response.data[0].url
     print(f"Generated image URL for prompt '{image_spec.prompt}': {image_url}")
 
-    # Ensure the output directory exists
-    output_dir.mkdir(parents=True, exist_ok=True)
-    # Use only the name of the file (strip any directory parts)
-    filename = Path(image_spec.filename).name
-    file_path = output_dir / filename
+    # Stream the image to disk; the file only appears once it is complete
+    try:
+        num_bytes = download_file(image_url, file_path)
+    except DownloadError as e:
+        print(e)
+        return None
+    print(f"Image saved to: {file_path.resolve()} ({num_bytes} bytes)")
+    if cache is not None:
+        cache.put(cache_key, file_path)
+        if similar is not None:
+            similar.add(cache_key, image_spec.prompt, model, size, quality)
+    return file_path
 
-    # Download the image
-    image_response = requests.get(image_url)
-    if image_response.status_code == 200:
-        with open(file_path, "wb") as f:
-            f.write(image_response.content)
-        print(f"Image saved to: {file_path.resolve()}")
-        return file_path
-    else:
-        print(f"Failed to download image. Status code: {image_response.status_code}")
+def _reuse_similar(
+    prompt: str,
+    file_path: Path,
+    model: str,
+    size: str,
+    quality: str,
+    cache: ImageCache,
+    similar: PromptIndex,
+) -> bool:
+    """
+    Places the cached image of the most similar earlier prompt at file_path,
+    if there is one above the index's threshold. Returns whether it did.
+    """
+    stale = ()
+    while True:
+        match = similar.find(prompt, model, size, quality, exclude=stale)
+        if match is None:
+            return False
+        key, similarity = match
+        if cache.link_into(key, file_path) is not None:
+            break
+        # The image was evicted from the cache since it was indexed
+        similar.discard(key)
+        stale += (key,)
+    _record_avoided("similar")
+    print(f"Reusing a cached image with a similar prompt ({similarity:.0%} similar) for '{file_path.name}'.")
+    return True
+
+def _save_b64_image(response, file_path: Path, cache: Optional[ImageCache], cache_key: str) -> Optional[Path]:
+    """
+    Decodes an inline b64_json image response into file_path and records
+    the download it made unnecessary.
+    """
+    if not response.data or not response.data[0].b64_json:
+        print("No valid b64_json image data returned.")
+        return None
+
+    start = time.perf_counter()
+    try:
+        num_bytes = write_base64_file(response.data[0].b64_json, file_path)
+    except (ValueError, OSError) as e:
+        print(f"Failed to decode image data for '{file_path.name}': {e}")
         return None
+    decode_seconds = time.perf_counter() - start
+    count("images.b64_bytes", num_bytes)
+
+    # Estimate the skipped fetch from the downloads seen so far in this process
+    saved_seconds = average_download_seconds()
+    with _b64_lock:
+        _b64_savings["images"] += 1
+        _b64_savings["bytes"] += num_bytes
+        _b64_savings["seconds"] += max(0.0, (saved_seconds or 0.0) - decode_seconds)
+
+    print(f"Image saved to: {file_path.resolve()} ({num_bytes} bytes decoded inline in {decode_seconds:.3f}s)")
+    if cache is not None:
+        cache.put(cache_key, file_path)
+    return file_path
+
+def _reusable(future: Future) -> bool:
+    # A job whose image can still be copied: not cancelled, and not failed if finished
+    if future.cancelled():
+        return False
+    return not future.done() or (future.exception() is None and future.result() is not None)
+
+def _copy_future(source: Future, target: Future):
+    try:
+        target.set_result(source.result())
+    except BaseException as e:
+        target.set_exception(e)
+
+def _publish(staged_path: Path, output_dir: Path) -> Path:
+    """
+    Places a staged image at its final path in output_dir, atomically.
+    The staged copy stays in place (as a hard link when possible) so the
+    same job can be published again.
+    """
+    final_path = output_dir / staged_path.name
+    if final_path.exists() and os.path.samefile(staged_path, final_path):
+        # Already published; renaming a hard link onto itself would leave tmp_path behind
+        return final_path
+    tmp_path = final_path.with_name(final_path.name + ".publish")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(staged_path, tmp_path)
+    except OSError:
+        shutil.copyfile(staged_path, tmp_path)
+    os.replace(tmp_path, final_path)
+    return final_path
+
+class ImageJobPool:
+    """
+    A bounded pool of image generation jobs that can be fed incrementally,
+    e.g. while the website spec is still streaming in. Jobs are keyed by
+    (output directory, filename, prompt), so submitting the same image twice
+    reuses the first job. One pool can serve several sites at once (batch mode),
+    which makes its concurrency a global limit on image requests.
+
+    Jobs write into a staging directory and only the images that are collected
+    are published under their real filename. Submitting a different prompt (or
+    plan) for a filename supersedes the earlier job: it is cancelled if it has
+    not started, and its result is never published otherwise.
+
+    Images are generated with the pool's model, size and quality unless an
+    ImagePlan for the image says otherwise.
+
+    Jobs whose prompts normalize the same (see normalize_prompt) and that
+    use the same settings share one generation, even across sites: the
+    later ones copy the first one's image. With a PromptIndex (`similar`),
+    cached images of near-identical prompts from earlier runs are reused too.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        concurrency: int = 4,
+        size: str = "1024x1024",
+        quality: str = "standard",
+        model: str = "dall-e-3",
+        cache: Optional[ImageCache] = None,
+        response_format: str = "url",
+        similar: Optional[PromptIndex] = None,
+    ):
+        self.output_dir = output_dir
+        self.size = size
+        self.quality = quality
+        self.model = model
+        self.cache = cache
+        self.response_format = response_format
+        self.similar = similar
+        if concurrency < 1:
+            raise ValueError(f"an image pool needs a concurrency of at least 1, not {concurrency}")
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._jobs: Dict[Tuple[str, ...], Future] = {}
+        # (normalized prompt, model, size, quality) -> the job generating it
+        self._requests: Dict[Tuple[str, ...], Future] = {}
+        # (output directory, filename) -> key of the most recently submitted job
+        self._latest: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        self._staging_dirs = set()
+        self._lock = threading.Lock()
+        with _b64_lock:
+            self._savings_before = dict(_b64_savings)
+        with _dedup_lock:
+            self._dedup_before = dict(_dedup_stats)
+
+    def settings(self, plan: Optional[ImagePlan] = None) -> Tuple[str, str, str]:
+        """
+        The (model, size, quality) used for an image with the given plan.
+        """
+        if plan is None:
+            return self.model, self.size, self.quality
+        return plan.model, plan.size, plan.quality
+
+    def submit(self, image_spec: ImageSpec, output_dir: Optional[Path] = None, plan: Optional[ImagePlan] = None) -> Future:
+        """
+        Starts generating image_spec (into output_dir, or the pool's default
+        directory) unless the same image is already running or done.
+        """
+        output_dir = Path(output_dir or self.output_dir)
+        model, size, quality = self.settings(plan)
+        slot = (output_dir.as_posix(), image_spec.filename)
+        key = slot + (image_spec.prompt, model, size, quality)
+        with self._lock:
+            latest = self._latest.get(slot)
+            if latest is not None and latest != key:
+                self._supersede(latest)
+            self._latest[slot] = key
+
+            future = self._jobs.get(key)
+            if future is None:
+                staging_root = output_dir / STAGING_DIRNAME
+                self._staging_dirs.add(staging_root)
+                job_hash = hashlib.sha256("\0".join(key[2:]).encode("utf-8")).hexdigest()[:16]
+                job = (image_spec, staging_root / job_hash, size, quality, model)
+                request = (normalize_prompt(image_spec.prompt), model, size, quality)
+                first = self._requests.get(request)
+                if first is not None and _reusable(first):
+                    future = self._follow(first, job)
+                else:
+                    future = self._start(job)
+                    self._requests[request] = future
+                self._jobs[key] = future
+            return future
+
+    def _start(self, job: Tuple) -> Future:
+        image_spec, staging_dir, size, quality, model = job
+        return self._executor.submit(
+            generate_and_save_image,
+            image_spec,
+            staging_dir,
+            size,
+            quality,
+            model,
+            self.cache,
+            self.response_format,
+            self.similar,
+        )
+
+    def _follow(self, first: Future, job: Tuple) -> Future:
+        """
+        A job that copies the image of `first`, an earlier job for the same
+        request, instead of generating its own. It falls back to generating
+        if the first job fails or is superseded.
+        """
+        future = Future()
+        image_spec, staging_dir = job[0], job[1]
+
+        def copy_result(first: Future):
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                source = None if first.cancelled() or first.exception() else first.result()
+                if source is None:
+                    fallback = self._start(job)
+                    fallback.add_done_callback(lambda done: _copy_future(done, future))
+                    return
+                staging_dir.mkdir(parents=True, exist_ok=True)
+                file_path = staging_dir / Path(image_spec.filename).name
+                if file_path != source:
+                    file_path.unlink(missing_ok=True)
+                    try:
+                        os.link(source, file_path)
+                    except OSError:
+                        shutil.copyfile(source, file_path)
+            except Exception as e:
+                future.set_exception(e)
+                return
+            _record_avoided("duplicates")
+            print(f"Reusing the image of an identical prompt for '{file_path.name}'.")
+            future.set_result(file_path)
+
+        first.add_done_callback(copy_result)
+        return future
+
+    def _supersede(self, key: Tuple[str, ...]):
+        # Called with self._lock held
+        future = self._jobs.get(key)
+        if future is not None and future.cancel():
+            del self._jobs[key]
+            print(f"Cancelled superseded image job for '{key[1]}'.")
+
+    def retain(self, image_specs: List[ImageSpec], output_dir: Optional[Path] = None):
+        """
+        Supersedes the jobs for filenames of output_dir that no longer appear in image_specs.
+        """
+        output_dir = Path(output_dir or self.output_dir).as_posix()
+        wanted = {image_spec.filename for image_spec in image_specs}
+        with self._lock:
+            for slot, key in list(self._latest.items()):
+                if slot[0] == output_dir and slot[1] not in wanted:
+                    self._supersede(key)
+                    del self._latest[slot]
+
+    def collect(
+        self,
+        image_specs: List[ImageSpec],
+        output_dir: Optional[Path] = None,
+        plans: Optional[Dict[str, ImagePlan]] = None,
+    ) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Waits for the given images (submitting any that are not running yet,
+        with their plan from plans if any) and returns (image_paths, failures)
+        as described in generate_images.
+        """
+        plans = plans or {}
+        futures = [(image_spec, self.submit(image_spec, output_dir, plans.get(image_spec.filename))) for image_spec in image_specs]
+        for _ in as_completed([future for _, future in futures]):
+            pass
+        return self._results(futures, Path(output_dir or self.output_dir))
+
+    async def collect_async(
+        self,
+        image_specs: List[ImageSpec],
+        output_dir: Optional[Path] = None,
+        plans: Optional[Dict[str, ImagePlan]] = None,
+    ) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Like collect, but awaits the jobs from an asyncio event loop without
+        tying up a thread per waiting caller.
+        """
+        plans = plans or {}
+        futures = [(image_spec, self.submit(image_spec, output_dir, plans.get(image_spec.filename))) for image_spec in image_specs]
+        await asyncio.gather(*(asyncio.wrap_future(future) for _, future in futures), return_exceptions=True)
+        return self._results(futures, Path(output_dir or self.output_dir))
+
+    def _results(self, futures: List[Tuple[ImageSpec, Future]], output_dir: Path) -> Tuple[Dict[str, str], Dict[str, str]]:
+        image_paths: Dict[str, str] = {}
+        failures: Dict[str, str] = {}
+        for image_spec, future in futures:
+            try:
+                local_path = future.result()
+            except Exception as e:
+                failures[image_spec.filename] = str(e)
+                print(f"Error generating image '{image_spec.filename}': {e}")
+                continue
+            if local_path:
+                image_paths[image_spec.filename] = _publish(local_path, output_dir).as_posix()
+            else:
+                failures[image_spec.filename] = "image generation or download failed"
+
+        print(f"Generated {len(image_paths)} of {len(futures)} images ({len(failures)} failed).")
+        self._report_b64_savings()
+        self._report_dedup()
+        return image_paths, failures
+
+    def _report_b64_savings(self):
+        if self.response_format != "b64_json":
+            return
+        with _b64_lock:
+            saved_images = _b64_savings["images"] - self._savings_before["images"]
+            saved_bytes = _b64_savings["bytes"] - self._savings_before["bytes"]
+            saved_seconds = _b64_savings["seconds"] - self._savings_before["seconds"]
+        if saved_images:
+            estimate = f", ~{saved_seconds:.1f}s" if saved_seconds else ""
+            print(f"b64_json mode skipped {saved_images} image downloads ({saved_bytes} bytes{estimate}).")
+
+    def _report_dedup(self):
+        with _dedup_lock:
+            duplicates = _dedup_stats["duplicates"] - self._dedup_before["duplicates"]
+            similar = _dedup_stats["similar"] - self._dedup_before["similar"]
+        if duplicates or similar:
+            print(
+                f"Avoided {duplicates + similar} image generations "
+                f"({duplicates} duplicate prompts, {similar} similar to cached images)."
+            )
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+        if self.cache is not None:
+            self.cache.flush()
+        if wait:
+            for staging_root in self._staging_dirs:
+                shutil.rmtree(staging_root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+def generate_images(
+    image_specs: List[ImageSpec],
+    output_dir: Path,
+    concurrency: int = 4,
+    size: str = "1024x1024",
+    quality: str = "standard",
+    model: str = "dall-e-3",
+    cache: Optional[ImageCache] = None,
+    response_format: str = "url",
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    Generates every image in image_specs using a bounded pool of worker threads.
+    Each image is almost entirely network wait, so running them side by side
+    cuts the wall-clock time of this stage to roughly that of the slowest image.
+    The optional cache is shared by all workers, and response_format is
+    passed through to generate_and_save_image.
+
+    Returns (image_paths, failures):
+      - image_paths maps image_spec.filename -> saved local path (posix string),
+        ready to be passed to update_website_code.
+      - failures maps image_spec.filename -> short error description.
+    """
+    if not image_specs:
+        return {}, {}
+
+    workers = min(concurrency, len(image_specs))
+    with ImageJobPool(output_dir, workers, size, quality, model, cache, response_format) as pool:
+        return pool.collect(image_specs)
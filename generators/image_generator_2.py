@@ -2,11 +2,10 @@
 
 import requests
 from pathlib import Path
-from openai import OpenAI
 from .website_generator import ImageSpec
-
-# Reuse or initialize a new OpenAI client
-client = OpenAI()
+from services.openai_client import get_client
+from services.request_layer import call_with_retry
+from services.tracing import count
 
 def generate_and_save_image(image_spec: ImageSpec, output_dir: Path, size: str = "1024x1024", quality: str = "standard") -> Path:
     """
@@ -15,7 +14,9 @@ def generate_and_save_image(image_spec: ImageSpec, output_dir: Path, size: str =
     Returns the local file path if successful, or None if there's an error.
     """
     try:
-        response = client.images.generate(
+        response = call_with_retry(
+            "images",
+            get_client().images.generate,
             model="dall-e-3",  # or "dall-e-2"
             prompt=image_spec.prompt,
             size=size,
@@ -42,6 +43,7 @@ def generate_and_save_image(image_spec: ImageSpec, output_dir: Path, size: str =
     if image_response.status_code == 200:
         with open(file_path, "wb") as f:
             f.write(image_response.content)
+        count("download.bytes", len(image_response.content))
         print(f"Image saved to: {file_path.resolve()}")
         return file_path
     else:
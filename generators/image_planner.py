@@ -0,0 +1,277 @@
+# webapp/generators/image_planner.py
+
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+from .website_generator import ImageSpec, WebsiteSpec
+from services.css_rules import CssRule, parse_css, selector_matches
+from services.html_dom import Element, parse_html
+
+# Assumed layout when a size is relative to the viewport
+VIEWPORT_WIDTH = 1440
+ROOT_FONT_SIZE = 16
+# Images are generated for high-density screens
+DEVICE_PIXEL_RATIO = 2
+
+# Words in class names, ids, alt text or filenames that hint at an image's role
+SMALL_HINTS = ("icon", "logo", "avatar", "thumb", "thumbnail", "badge", "emoji", "favicon")
+WIDE_HINTS = ("hero", "banner", "cover", "background", "backdrop", "header-bg")
+# Elements that wrap an image without being its container; their names count
+# as the image's own, and the container is the first ancestor past them
+IMAGE_WRAPPERS = ("picture", "a", "span", "figure")
+SMALL_HINT_SIZE = (96, 96)
+WIDE_HINT_SIZE = (VIEWPORT_WIDTH, VIEWPORT_WIDTH * 9 // 16)
+
+_LENGTH_RE = re.compile(r"^\s*(-?\d*\.?\d+)\s*(px|rem|em|vw)?\s*(?:!important)?\s*$", re.IGNORECASE)
+# Words of a name: lowercase runs, capitalized words and digits ("heroImage-2" -> hero, Image, 2)
+_WORD_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+_DECLARATION_RE = re.compile(r"(?:^|;)\s*(width|height|max-width|max-height|min-width)\s*:\s*([^;]+)", re.IGNORECASE)
+
+
+class ImagePlan(BaseModel):
+    """
+    The generation settings chosen for one image, and why.
+    """
+    filename: str
+    model: str
+    size: str
+    quality: str
+    rendered_width: Optional[int] = None
+    rendered_height: Optional[int] = None
+    source: str
+
+
+def _css_length(value: str) -> Optional[float]:
+    """
+    Converts a CSS length to pixels. Percentages and keywords return None,
+    since they depend on the container.
+    """
+    match = _LENGTH_RE.match(value)
+    if not match:
+        return None
+    if match.group(2) is None:
+        # A bare number is not a CSS length
+        return None
+    number, unit = float(match.group(1)), match.group(2).lower()
+    if number <= 0:
+        return None
+    if unit in ("rem", "em"):
+        return number * ROOT_FONT_SIZE
+    if unit == "vw":
+        return number * VIEWPORT_WIDTH / 100
+    return number
+
+
+def _declared_size(body: str) -> Tuple[Optional[float], Optional[float]]:
+    """
+    The pixel width and height a declaration block gives its element, if any.
+    max-width counts as a width bound; an explicit width wins over it.
+    """
+    values: Dict[str, float] = {}
+    for prop, value in _DECLARATION_RE.findall(body or ""):
+        length = _css_length(value)
+        if length is not None:
+            values[prop.lower()] = length
+    width = values.get("width", values.get("max-width"))
+    height = values.get("height", values.get("max-height"))
+    return width, height
+
+
+def _css_size(element: Element, rules: List[CssRule]) -> Tuple[Optional[float], Optional[float]]:
+    """
+    The largest width and height any matching rule (including the ones in
+    media queries) gives the element.
+    """
+    width = height = None
+    for style_rule in rules:
+        if any(selector_matches(selector, element) for selector in style_rule.selectors()):
+            rule_width, rule_height = _declared_size(style_rule.body)
+            if rule_width is not None:
+                width = max(width or 0, rule_width)
+            if rule_height is not None:
+                height = max(height or 0, rule_height)
+    return width, height
+
+
+def _has_hint(words: List[str], hint: str) -> bool:
+    # Whole words only (a plural counts): "thumbnails" is not "thumb", "header-bg" is two words
+    hint_words = hint.split("-")
+    for start in range(len(words) - len(hint_words) + 1):
+        window = words[start:start + len(hint_words)]
+        if window[:-1] == hint_words[:-1] and window[-1] in (hint_words[-1], hint_words[-1] + "s"):
+            return True
+    return False
+
+
+def _hint_size(text: str) -> Optional[Tuple[Tuple[int, int], str]]:
+    words = [word.lower() for word in _WORD_RE.findall(text)]
+    for hint in SMALL_HINTS:
+        if _has_hint(words, hint):
+            return SMALL_HINT_SIZE, f"name hint '{hint}'"
+    for hint in WIDE_HINTS:
+        if _has_hint(words, hint):
+            return WIDE_HINT_SIZE, f"name hint '{hint}'"
+    return None
+
+
+def _element_words(element: Element) -> str:
+    """
+    The names of an image element and of its nearest container: a hint
+    further up (e.g. a "thumbs" gallery around a full-width photo) says
+    nothing about this image.
+    """
+    words = [element.get("alt") or "", element.id or ""] + element.classes
+    for ancestor in element.ancestors():
+        words += ancestor.classes + [ancestor.id or ""]
+        if ancestor.tag not in IMAGE_WRAPPERS:
+            break
+    return " ".join(words)
+
+
+def _attribute_px(element: Element, name: str) -> Optional[float]:
+    value = element.get(name)
+    if value and value.strip().isdigit():
+        return float(value)
+    return None
+
+
+def estimate_rendered_sizes(website_spec: WebsiteSpec) -> Dict[str, Tuple[Optional[int], Optional[int], str]]:
+    """
+    Estimates how large each image of the spec is displayed, in CSS pixels:
+    filename -> (width, height, how it was estimated). Width or height is None
+    when unknown; images with no estimate at all are left out.
+
+    Looks, in order, at the width/height attributes of the <img> tags that use
+    the image, CSS rules that size those tags, role hints in class names, ids,
+    alt text and the filename (e.g. "icon", "avatar", "hero"), and the CSS
+    width of their containers. Images only used as CSS backgrounds are sized
+    from the rule that uses them.
+    """
+    document = parse_html(website_spec.html)
+    style_rules = [rule for top in parse_css(website_spec.css) for rule in top.iter_style_rules()]
+    estimates: Dict[str, Tuple[Optional[int], Optional[int], str]] = {}
+
+    for image_spec in website_spec.images:
+        name = Path(image_spec.filename).name
+        best: Optional[Tuple[Optional[float], Optional[float], str]] = None
+
+        for img in document.find_all("img", "source"):
+            src = (img.get("src") or "") + " " + (img.get("srcset") or "")
+            if name not in src:
+                continue
+            width, height = _attribute_px(img, "width"), _attribute_px(img, "height")
+            source = "img width/height attributes"
+            if width is None and height is None:
+                width, height = _css_size(img, style_rules)
+                source = "CSS rules for the img"
+            if width is None and height is None:
+                hint = _hint_size(_element_words(img) + " " + name)
+                if hint:
+                    (width, height), source = hint
+            if width is None and height is None:
+                for ancestor in img.ancestors():
+                    width, height = _css_size(ancestor, style_rules)
+                    if width is not None:
+                        source = f"CSS width of its <{ancestor.tag}> container"
+                        break
+            if width is not None or height is not None:
+                # The largest use of an image decides its size
+                if best is None or max(width or 0, height or 0) > max(best[0] or 0, best[1] or 0):
+                    best = (width, height, source)
+
+        if best is None:
+            for style_rule in style_rules:
+                if name in (style_rule.body or "") and "url(" in (style_rule.body or ""):
+                    width, height = _declared_size(style_rule.body)
+                    if width is not None or height is not None:
+                        best = (width, height, "CSS background rule")
+                    else:
+                        hint = _hint_size(style_rule.prelude + " " + name)
+                        (width, height), source = hint or (WIDE_HINT_SIZE, "CSS background (assumed full width)")
+                        best = (width, height, source)
+                    break
+
+        if best is None:
+            hint = _hint_size(name)
+            if hint:
+                (width, height), source = hint
+                best = (width, height, source)
+
+        if best is not None:
+            width, height, source = best
+            estimates[image_spec.filename] = (
+                round(width) if width is not None else None,
+                round(height) if height is not None else None,
+                source,
+            )
+    return estimates
+
+
+def choose_settings(width: Optional[int], height: Optional[int]) -> Tuple[str, str, str]:
+    """
+    Returns the cheapest (model, size, quality) that covers an image rendered
+    at width x height CSS pixels on a high-density screen. DALL·E 2 is used up
+    to 512 px, DALL·E 3 standard quality (square, landscape or portrait) above.
+    """
+    target = max(width or 0, height or 0) * DEVICE_PIXEL_RATIO
+    if target <= 256:
+        return "dall-e-2", "256x256", "standard"
+    if target <= 512:
+        return "dall-e-2", "512x512", "standard"
+    if width and height:
+        if width / height >= 1.4:
+            return "dall-e-3", "1792x1024", "standard"
+        if height / width >= 1.4:
+            return "dall-e-3", "1024x1792", "standard"
+    return "dall-e-3", "1024x1024", "standard"
+
+
+def plan_image(image_spec: ImageSpec, estimate: Optional[Tuple[Optional[int], Optional[int], str]] = None) -> Optional[ImagePlan]:
+    """
+    Plans one image from a size estimate, or from its filename alone when
+    no markup is available yet (e.g. while the spec is streaming).
+    Returns None when nothing is known, so the default settings apply.
+    """
+    if estimate is None:
+        hint = _hint_size(Path(image_spec.filename).name)
+        if hint is None:
+            return None
+        (width, height), source = hint
+        estimate = (width, height, source)
+    width, height, source = estimate
+    model, size, quality = choose_settings(width, height)
+    return ImagePlan(
+        filename=image_spec.filename,
+        model=model,
+        size=size,
+        quality=quality,
+        rendered_width=width,
+        rendered_height=height,
+        source=source,
+    )
+
+
+def plan_images(website_spec: WebsiteSpec) -> Dict[str, ImagePlan]:
+    """
+    Plans every image of the spec whose rendered size can be estimated.
+    """
+    estimates = estimate_rendered_sizes(website_spec)
+    plans = {}
+    for image_spec in website_spec.images:
+        if image_spec.filename in estimates:
+            plans[image_spec.filename] = plan_image(image_spec, estimates[image_spec.filename])
+    return plans
+
+
+def print_image_plans(image_specs: List[ImageSpec], plans: Dict[str, ImagePlan], default: str):
+    print("\nImage plan:")
+    for image_spec in image_specs:
+        plan = plans.get(image_spec.filename)
+        if plan is None:
+            print(f"  {image_spec.filename:<28} {default:<30} (rendered size unknown)")
+            continue
+        rendered = f"{plan.rendered_width or '?'}x{plan.rendered_height or '?'}px"
+        settings = f"{plan.model} {plan.size} {plan.quality}"
+        print(f"  {plan.filename:<28} {settings:<30} {rendered} from {plan.source}")
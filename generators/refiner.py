@@ -0,0 +1,37 @@
+# webapp/generators/refiner.py
+
+from typing import Optional
+
+from .website_generator import WebsiteSpec, refine_website_spec, refine_website_spec_diff
+from .section_refiner import refine_website_spec_sections
+from services.completion_cache import CompletionCache
+
+REFINE_MODES = ("full", "diff", "sections")
+
+def refine_spec(
+    current_spec: WebsiteSpec,
+    improvement_instructions: str,
+    model_name: str,
+    mode: str = "full",
+    cache: Optional[CompletionCache] = None,
+    section_concurrency: int = 4,
+) -> WebsiteSpec:
+    """
+    Runs one refinement iteration with the given mode:
+      - "full": regenerate the whole spec (refine_website_spec)
+      - "diff": apply search/replace edits (refine_website_spec_diff)
+      - "sections": refine page sections in parallel (refine_website_spec_sections)
+    """
+    if mode == "sections":
+        return refine_website_spec_sections(
+            current_spec,
+            improvement_instructions,
+            model_name,
+            cache,
+            concurrency=section_concurrency,
+        )
+    if mode == "diff":
+        return refine_website_spec_diff(current_spec, improvement_instructions, model_name, cache)
+    if mode == "full":
+        return refine_website_spec(current_spec, improvement_instructions, model_name, cache)
+    raise ValueError(f"Unknown refine mode: {mode!r} (expected one of {', '.join(REFINE_MODES)})")
@@ -0,0 +1,307 @@
+# webapp/generators/section_refiner.py
+
+import contextvars
+from typing import Dict, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel
+
+from .website_generator import ImageSpec, WebsiteSpec, parse_completion, refine_website_spec
+from services.completion_cache import CompletionCache
+from services.css_rules import CssRule, parse_css, selector_names
+from services.html_dom import Element, HtmlDocument, parse_html
+
+SECTION_TAGS = ("header", "section", "footer")
+
+
+class SectionSpec(BaseModel):
+    html: str
+    css: str
+    images: List[ImageSpec]
+
+
+def find_sections(document: HtmlDocument) -> List[Element]:
+    """
+    Returns the top-level sections of the page: every header, section and
+    footer element that is not nested inside another one, in document order.
+    """
+    return [
+        el for el in document.find_all(*SECTION_TAGS)
+        if not any(parent.tag in SECTION_TAGS for parent in el.ancestors())
+    ]
+
+
+Names = Tuple[Set[str], Set[str], Set[str]]
+
+
+def _section_names(section: Element) -> Names:
+    classes, ids, tags = set(), set(), set()
+    for el in section.iter():
+        classes.update(el.classes)
+        tags.add(el.tag)
+        if el.id:
+            ids.add(el.id)
+    return classes, ids, tags
+
+
+def _rule_names(rule: CssRule) -> List[Names]:
+    """
+    (classes, ids, tags) of each selector of a rule, or of the style rules nested in it.
+    """
+    return [
+        selector_names(selector)
+        for style_rule in rule.iter_style_rules()
+        for selector in style_rule.selectors()
+    ]
+
+
+def _rule_applies(rule_names: List[Names], section_names: Names) -> bool:
+    """
+    Whether a rule may style a section: one of its selectors shares a class
+    or id with the section, or, for selectors of tags only (`section`,
+    `header h1`), all of its tags occur in the section.
+    """
+    classes, ids, tags = section_names
+    for selector_classes, selector_ids, selector_tags in rule_names:
+        if selector_classes or selector_ids:
+            if selector_classes & classes or selector_ids & ids:
+                return True
+        elif selector_tags and selector_tags <= tags:
+            return True
+    return False
+
+
+def _keyed(rules: List[CssRule]) -> Dict[Tuple[str, int], CssRule]:
+    """
+    Keys rules by (normalized prelude, occurrence), so repeated selectors
+    or media queries are matched up in order.
+    """
+    keyed, seen = {}, {}
+    for rule in rules:
+        occurrence = seen.get(rule.key, 0)
+        seen[rule.key] = occurrence + 1
+        keyed[(rule.key, occurrence)] = rule
+    return keyed
+
+
+def _same(a: str, b: str) -> bool:
+    return " ".join(a.split()) == " ".join(b.split())
+
+
+def _refine_section(
+    section_html: str,
+    section_css: str,
+    section_images: List[ImageSpec],
+    improvement_instructions: str,
+    model_name: str,
+    cache: Optional[CompletionCache],
+) -> SectionSpec:
+    images_text = "\n".join(f"- {img.filename}: {img.prompt}" for img in section_images) or "(none)"
+    refinement_prompt = (
+        "Here is one section of a larger web page.\n\n"
+        f"SECTION HTML:\n{section_html}\n\n"
+        f"CSS RULES FOR THIS SECTION:\n{section_css or '(none)'}\n\n"
+        f"IMAGES USED IN THIS SECTION:\n{images_text}\n\n"
+        "Please refine or improve this section based on these instructions for the whole page:\n"
+        f"{improvement_instructions}\n\n"
+        "Output a JSON object following the SectionSpec schema: 'html' is the complete refined markup "
+        "of this section only, as a single top-level element; 'css' holds the refined versions of the "
+        "rules above plus any new rules this section needs (keep the selectors of existing rules unchanged); "
+        "'images' lists the image specs (prompt and filename, kept in the images directory) this section uses."
+    )
+    return parse_completion(
+        model_name,
+        [
+            {
+                "role": "system",
+                "content": (
+                    "You are an expert web developer and creative director. "
+                    "You refine one section of an existing website at a time, keeping it consistent "
+                    "with the rest of the page."
+                )
+            },
+            {
+                "role": "user",
+                "content": refinement_prompt
+            }
+        ],
+        SectionSpec,
+        cache,
+    )
+
+
+def refine_website_spec_sections(
+    current_spec: WebsiteSpec,
+    improvement_instructions: str,
+    model_name: str,
+    cache: Optional[CompletionCache] = None,
+    concurrency: int = 4,
+) -> WebsiteSpec:
+    """
+    Refines each top-level section of the page (header, sections, footer)
+    in its own concurrent GPT call, together with the CSS rules that style it,
+    then merges the results back into one WebsiteSpec.
+
+    CSS rules that several sections rely on are only updated when the sections
+    agree; conflicting edits keep the original rule and are reported. JS and the
+    markup outside the sections (e.g. <head>) are left unchanged.
+    Pages with fewer than two sections fall back to refine_website_spec.
+    """
+    document = parse_html(current_spec.html)
+    sections = find_sections(document)
+    if len(sections) < 2:
+        print("Fewer than two sections found; refining the whole page instead.")
+        return refine_website_spec(current_spec, improvement_instructions, model_name, cache)
+
+    rules = parse_css(current_spec.css)
+    rule_names = [_rule_names(rule) for rule in rules]
+
+    # Work out which rules and images belong to which section
+    section_rules: List[List[int]] = []
+    section_images: List[List[ImageSpec]] = []
+    for section in sections:
+        names = _section_names(section)
+        section_rules.append([index for index, names_of_rule in enumerate(rule_names) if _rule_applies(names_of_rule, names)])
+        section_markup = document.outer_html(section)
+        section_images.append([img for img in current_spec.images if img.filename in section_markup])
+
+    print(f"Refining {len(sections)} sections with up to {concurrency} concurrent requests...")
+    workers = max(1, min(concurrency, len(sections)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Each call runs in a copy of this context so usage tracking follows it
+        futures = [
+            pool.submit(
+                contextvars.copy_context().run,
+                _refine_section,
+                document.outer_html(section),
+                "\n\n".join(rules[index].text.strip() for index in section_rules[number]),
+                section_images[number],
+                improvement_instructions,
+                model_name,
+                cache,
+            )
+            for number, section in enumerate(sections)
+        ]
+        results: List[Optional[SectionSpec]] = []
+        for number, future in enumerate(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Refining section {number + 1} <{sections[number].tag}> failed, keeping it as is: {e}")
+                results.append(None)
+
+    # Merge the HTML: each refined section replaces its original markup
+    for section, result in zip(sections, results):
+        if result is not None:
+            document.replace(section, result.html.strip())
+
+    new_css, css_conflicts, css_overrides = _merge_css(current_spec.css, rules, section_rules, results)
+    new_images, image_conflicts = _merge_images(current_spec.images, section_images, results)
+
+    for override in css_overrides:
+        print(f"Section merge: {override}")
+    for conflict in css_conflicts + image_conflicts:
+        print(f"Section merge conflict: {conflict}")
+
+    return WebsiteSpec(
+        html=document.to_html(),
+        css=new_css,
+        js=current_spec.js,
+        images=new_images,
+    )
+
+
+def _merge_css(
+    css: str,
+    rules: List[CssRule],
+    section_rules: List[List[int]],
+    results: List[Optional[SectionSpec]],
+) -> Tuple[str, List[str], List[str]]:
+    """
+    Folds the per-section CSS back into the stylesheet. A section may also
+    return a rule of the stylesheet it was not given (e.g. a shared `body`
+    rule); that edit is applied like the others, and reported as an override.
+    Returns the new CSS, a description of each conflict between sections
+    and one of each override.
+    """
+    original_keys = {id(rule): key for key, rule in _keyed(rules).items()}
+    refined = [_keyed(parse_css(result.css)) if result else {} for result in results]
+
+    conflicts, overrides = [], []
+    replacements: Dict[int, str] = {}
+    for index, rule in enumerate(rules):
+        key = original_keys[id(rule)]
+        versions = {}
+        for number, keyed in enumerate(refined):
+            if key in keyed and not _same(keyed[key].text, rule.text):
+                versions[number] = keyed[key].text.strip()
+        distinct = {" ".join(text.split()) for text in versions.values()}
+        if len(distinct) > 1:
+            conflicts.append(f"rule '{rule.key}' was changed differently by sections {sorted(versions)}; kept the original")
+        elif versions:
+            replacements[index] = next(iter(versions.values()))
+            unsent = sorted(number for number in versions if index not in section_rules[number])
+            if unsent:
+                overrides.append(f"rule '{rule.key}' was not sent to sections {unsent} but changed by them; applied their version")
+
+    # Rules a section added that did not exist before
+    added: Dict[Tuple[str, int], str] = {}
+    known_keys = set(original_keys.values())
+    for keyed in refined:
+        for key, rule in keyed.items():
+            if key in known_keys:
+                continue
+            if key in added and not _same(added[key], rule.text):
+                conflicts.append(f"new rule '{key[0]}' was added differently by several sections; kept the first")
+                continue
+            added.setdefault(key, rule.text.strip())
+
+    pieces = []
+    cursor = 0
+    for index, rule in enumerate(rules):
+        if index in replacements:
+            pieces.append(css[cursor:rule.start])
+            pieces.append(replacements[index])
+            cursor = rule.end
+    pieces.append(css[cursor:])
+    new_css = "".join(pieces)
+    if added:
+        new_css = new_css.rstrip() + "\n\n" + "\n\n".join(added.values()) + "\n"
+    return new_css, conflicts, overrides
+
+
+def _merge_images(
+    images: List[ImageSpec],
+    section_images: List[List[ImageSpec]],
+    results: List[Optional[SectionSpec]],
+) -> Tuple[List[ImageSpec], List[str]]:
+    """
+    Rebuilds the page's image list from the sections: the images of each
+    refined section replace the ones it used before, so images a section
+    dropped are removed. Images outside the sections, and those of sections
+    whose refinement failed, are kept. Returns the list (in the original
+    order, new images last) and a description of each conflict.
+    """
+    original = {img.filename: img for img in images}
+    replaced = {
+        img.filename
+        for used, result in zip(section_images, results) if result is not None
+        for img in used
+    }
+    merged = {img.filename: img for img in images if img.filename not in replaced}
+    changed_by: Dict[str, int] = {}
+    conflicts = []
+    for number, result in enumerate(results):
+        if result is None:
+            continue
+        for img in result.images:
+            before = original.get(img.filename)
+            if before is not None and before.prompt == img.prompt:
+                merged.setdefault(img.filename, img)
+                continue
+            if img.filename in changed_by:
+                conflicts.append(f"image '{img.filename}' was changed by several sections; kept the first")
+                continue
+            changed_by[img.filename] = number
+            merged[img.filename] = img
+    order = {filename: index for index, filename in enumerate(original)}
+    return sorted(merged.values(), key=lambda img: order.get(img.filename, len(order))), conflicts
@@ -1,11 +1,13 @@
 # webapp/generators/website_generator.py
 
-from typing import List, Optional
+from typing import Callable, Dict, List, Literal, Optional, Type, TypeVar
 from pydantic import BaseModel
-from openai import OpenAI
-
-# Initialize the OpenAI client (ensure you have your API key set up)
-client = OpenAI()
+from services.completion_cache import CompletionCache, CompletionCacheMiss, completion_cache_key
+from services.json_stream import IncrementalJsonObjectParser
+from services.tracing import count
+from services.usage import record_usage
+from services.openai_client import get_client
+from services.request_layer import call_with_retry, estimate_chat_tokens
 
 class ImageSpec(BaseModel):
     prompt: str
@@ -17,76 +19,311 @@ class WebsiteSpec(BaseModel):
     js: str
     images: List[ImageSpec]
 
-def generate_website_spec(details_doc: str, model_name: str) -> WebsiteSpec:
+class StreamedWebsiteSpec(BaseModel):
+    # Same fields as WebsiteSpec, but images first: structured outputs are
+    # generated in schema order, so image jobs can start before the code arrives.
+    images: List[ImageSpec]
+    html: str
+    css: str
+    js: str
+
+class SpecEdit(BaseModel):
+    file: Literal["html", "css", "js"]
+    search: str   # Exact snippet of the current file; must occur exactly once
+    replace: str  # Text that takes its place
+
+class SpecPatch(BaseModel):
+    edits: List[SpecEdit]
+    images: List[ImageSpec]  # The complete image list after the change
+
+class PatchApplyError(Exception):
+    """
+    Raised when a SpecPatch does not apply cleanly to the current spec.
+    """
+
+class CompletionRefused(Exception):
+    """
+    Raised when a structured completion comes back without a parsed result,
+    e.g. because the model refused or its output was cut off.
+    """
+
+ParsedT = TypeVar("ParsedT", bound=BaseModel)
+
+def _parsed_result(completion, model_name: str):
+    # The parsed result of a completion, never None: a refusal or a cut-off
+    # answer raises here, before anything is cached.
+    choice = completion.choices[0]
+    if choice.message.parsed is not None:
+        return choice.message.parsed
+    if choice.message.refusal:
+        reason = f"the model refused: {choice.message.refusal}"
+    elif choice.finish_reason == "length":
+        reason = "the response was cut off at the token limit"
+    else:
+        reason = f"finish reason {choice.finish_reason!r}"
+    raise CompletionRefused(f"{model_name} returned no structured result ({reason}).")
+
+def parse_completion(
+    model_name: str,
+    messages: List[Dict],
+    response_format: Type[ParsedT],
+    cache: Optional[CompletionCache] = None,
+) -> ParsedT:
+    """
+    Runs a structured chat completion, going through the completion cache if one is given.
+    In replay mode a cache miss raises CompletionCacheMiss instead of calling the API.
+    Raises CompletionRefused if the model gives no structured result.
+    """
+    cache_key = None
+    if cache is not None:
+        cache_key = completion_cache_key(model_name, messages, response_format)
+        cached = cache.get(cache_key)
+        count("completion_cache.hits" if cached is not None else "completion_cache.misses")
+        if cached is not None:
+            print(f"Completion cache hit ({cache_key[:12]}).")
+            return response_format.model_validate_json(cached)
+        if cache.replay:
+            raise CompletionCacheMiss(
+                f"No cached completion for {model_name} request {cache_key[:12]} (replay mode)."
+            )
+
+    completion = call_with_retry(
+        "chat",
+        get_client().beta.chat.completions.parse,
+        model=model_name,
+        messages=messages,
+        response_format=response_format,
+        estimated_tokens=estimate_chat_tokens(messages),
+    )
+    record_usage(completion.usage)
+    parsed = _parsed_result(completion, model_name)
+
+    if cache is not None:
+        cache.put(cache_key, parsed.model_dump_json(), model=model_name)
+    return parsed
+
+def _spec_messages(details_doc: str) -> List[Dict]:
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are an expert web developer and creative director. "
+                "When given requirements, you decide the website's HTML, CSS, JS, "
+                "and which images should be generated (with prompts and filenames; files will be kept in images directory and tagged as such in src). "
+                "Output a JSON object that strictly follows the WebsiteSpec schema:\n\n"
+                "{\n"
+                "  \"html\": string,\n"
+                "  \"css\": string,\n"
+                "  \"js\": string,\n"
+                "  \"images\": [\n"
+                "    { \"prompt\": string, \"filename\": string }\n"
+                "  ]\n"
+                "}"
+            )
+        },
+        {
+            "role": "user",
+            "content": (
+                "Design a landing page with the following requirements:\n"
+                f"{details_doc}\n\n"
+                "Include in your JSON the image specs: each with a prompt and filename."
+            )
+        }
+    ]
+
+def generate_website_spec(details_doc: str, model_name: str, cache: Optional[CompletionCache] = None) -> WebsiteSpec:
     """
     Uses GPT to produce an initial website spec (HTML/CSS/JS) plus
     image specs. 
     """
-    completion = client.beta.chat.completions.parse(
-        model=model_name,
-        messages=[
+    return parse_completion(model_name, _spec_messages(details_doc), WebsiteSpec, cache)
+
+def generate_website_spec_stream(
+    details_doc: str,
+    model_name: str,
+    on_image: Optional[Callable[[ImageSpec], None]] = None,
+    on_file: Optional[Callable[[str, str], None]] = None,
+    cache: Optional[CompletionCache] = None,
+) -> WebsiteSpec:
+    """
+    Streaming variant of generate_website_spec. As the response streams in,
+    on_image(image_spec) is called as soon as each image spec is complete and
+    on_file(field, content) as soon as each of html/css/js is complete, so
+    image generation and file writing overlap with the rest of the response.
+    """
+    messages = _spec_messages(details_doc)
+    cache_key = None
+    if cache is not None:
+        cache_key = completion_cache_key(model_name, messages, StreamedWebsiteSpec)
+        cached = cache.get(cache_key)
+        count("completion_cache.hits" if cached is not None else "completion_cache.misses")
+        if cached is not None:
+            print(f"Completion cache hit ({cache_key[:12]}).")
+            streamed = StreamedWebsiteSpec.model_validate_json(cached)
+            for image_spec in streamed.images:
+                if on_image is not None:
+                    on_image(image_spec)
+            for field in ("html", "css", "js"):
+                if on_file is not None:
+                    on_file(field, getattr(streamed, field))
+            return WebsiteSpec(**streamed.model_dump())
+        if cache.replay:
+            raise CompletionCacheMiss(
+                f"No cached completion for {model_name} request {cache_key[:12]} (replay mode)."
+            )
+
+    def handle_field(key, value):
+        if key in ("html", "css", "js") and on_file is not None:
+            on_file(key, value)
+
+    def handle_item(key, item):
+        if key == "images" and on_image is not None:
+            on_image(ImageSpec(**item))
+
+    def stream_once(timeout):
+        # A retry starts the stream over; image jobs submitted by an earlier
+        # attempt are deduplicated by the image pool.
+        parser = IncrementalJsonObjectParser(on_field=handle_field, on_item=handle_item)
+        with get_client().beta.chat.completions.stream(
+            model=model_name,
+            messages=messages,
+            response_format=StreamedWebsiteSpec,
+            stream_options={"include_usage": True},
+            timeout=timeout,
+        ) as stream:
+            for event in stream:
+                if event.type == "content.delta":
+                    parser.feed(event.delta)
+            return stream.get_final_completion()
+
+    # Not hedged: a second stream would call on_image and on_file again
+    final_completion = call_with_retry(
+        "chat",
+        stream_once,
+        estimated_tokens=estimate_chat_tokens(messages),
+        latency_key=f"{model_name}/StreamedWebsiteSpec",
+        hedge=False,
+    )
+    record_usage(final_completion.usage)
+    streamed = _parsed_result(final_completion, model_name)
+
+    if cache is not None:
+        cache.put(cache_key, streamed.model_dump_json(), model=model_name)
+    return WebsiteSpec(**streamed.model_dump())
+
+def _current_code(spec: WebsiteSpec) -> str:
+    # Convert the current spec to a textual representation
+    return (
+        f"HTML:\n{spec.html}\n\n"
+        f"CSS:\n{spec.css}\n\n"
+        f"JS:\n{spec.js}\n\n"
+        "IMAGES:\n"
+        + "\n".join(
+            [f"- {img.filename}: {img.prompt}" for img in spec.images]
+        )
+    )
+
+def _refinement_prompt(spec: WebsiteSpec, improvement_instructions: str, output_instructions: str) -> str:
+    return (
+        "Here is the current website specification:\n"
+        f"{_current_code(spec)}\n\n"
+        "Please refine or improve it based on these additional instructions:\n"
+        f"{improvement_instructions}\n\n"
+        f"{output_instructions}"
+    )
+
+def refine_website_spec(
+    current_spec: WebsiteSpec,
+    improvement_instructions: str,
+    model_name: str,
+    cache: Optional[CompletionCache] = None,
+) -> WebsiteSpec:
+    """
+    Refines an existing WebsiteSpec based on some improvement or refinement instructions.
+    We supply the current code and any user-specified improvement instructions to GPT.
+    """
+    refinement_prompt = _refinement_prompt(
+        current_spec,
+        improvement_instructions,
+        "Output a JSON object that still strictly follows the WebsiteSpec schema.",
+    )
+
+    return parse_completion(
+        model_name,
+        [
             {
                 "role": "system",
                 "content": (
                     "You are an expert web developer and creative director. "
-                    "When given requirements, you decide the website's HTML, CSS, JS, "
-                    "and which images should be generated (with prompts and filenames; files will be kept in images directory and tagged as such in src). "
-                    "Output a JSON object that strictly follows the WebsiteSpec schema:\n\n"
-                    "{\n"
-                    "  \"html\": string,\n"
-                    "  \"css\": string,\n"
-                    "  \"js\": string,\n"
-                    "  \"images\": [\n"
-                    "    { \"prompt\": string, \"filename\": string }\n"
-                    "  ]\n"
-                    "}"
+                    "You refine existing website code (HTML, CSS, JS, images) based on improvement instructions."
                 )
             },
             {
                 "role": "user",
-                "content": (
-                    "Design a landing page with the following requirements:\n"
-                    f"{details_doc}\n\n"
-                    "Include in your JSON the image specs: each with a prompt and filename."
-                )
+                "content": refinement_prompt
             }
         ],
-        response_format=WebsiteSpec,
+        WebsiteSpec,
+        cache,
     )
-    return completion.choices[0].message.parsed
 
-def refine_website_spec(current_spec: WebsiteSpec, improvement_instructions: str, model_name: str) -> WebsiteSpec:
+def apply_spec_patch(current_spec: WebsiteSpec, patch: SpecPatch) -> WebsiteSpec:
     """
-    Refines an existing WebsiteSpec based on some improvement or refinement instructions.
-    We supply the current code and any user-specified improvement instructions to GPT.
+    Applies the search/replace edits of a SpecPatch to a copy of current_spec.
+    Edits are applied in order, each to the result of the previous one.
+    Raises PatchApplyError if any search text is empty, missing or ambiguous,
+    so a bad patch never leaves a half-edited spec behind.
     """
-    # Convert the current spec to a textual representation
-    current_code = (
-        f"HTML:\n{current_spec.html}\n\n"
-        f"CSS:\n{current_spec.css}\n\n"
-        f"JS:\n{current_spec.js}\n\n"
-        "IMAGES:\n"
-        + "\n".join(
-            [f"- {img.filename}: {img.prompt}" for img in current_spec.images]
-        )
+    files = {"html": current_spec.html, "css": current_spec.css, "js": current_spec.js}
+    for number, edit in enumerate(patch.edits, start=1):
+        content = files[edit.file]
+        if not edit.search:
+            raise PatchApplyError(f"Edit {number} ({edit.file}) has an empty search text.")
+        matches = content.count(edit.search)
+        if matches != 1:
+            raise PatchApplyError(
+                f"Edit {number} ({edit.file}) search text matches {matches} times, expected exactly once."
+            )
+        files[edit.file] = content.replace(edit.search, edit.replace, 1)
+
+    return WebsiteSpec(
+        html=files["html"],
+        css=files["css"],
+        js=files["js"],
+        images=patch.images,
     )
 
-    refinement_prompt = (
-        "Here is the current website specification:\n"
-        f"{current_code}\n\n"
-        "Please refine or improve it based on these additional instructions:\n"
-        f"{improvement_instructions}\n\n"
-        "Output a JSON object that still strictly follows the WebsiteSpec schema."
+def refine_website_spec_diff(
+    current_spec: WebsiteSpec,
+    improvement_instructions: str,
+    model_name: str,
+    cache: Optional[CompletionCache] = None,
+) -> WebsiteSpec:
+    """
+    Like refine_website_spec, but asks GPT for a list of search/replace edits
+    instead of the whole spec, and applies them locally. Output size (and so
+    latency) follows the size of the change rather than the size of the page.
+    Falls back to a full refinement if the edits do not apply.
+    """
+    refinement_prompt = _refinement_prompt(
+        current_spec,
+        improvement_instructions,
+        "Do not repeat the whole website. Output a JSON object following the SpecPatch schema: "
+        "'edits' is a list of search/replace edits, each naming the file ('html', 'css' or 'js'), "
+        "a 'search' snippet copied verbatim from the current file that occurs exactly once in it, "
+        "and the 'replace' text for it. Keep search snippets short but unique. "
+        "'images' is the complete list of image specs after your changes.",
     )
 
-    completion = client.beta.chat.completions.parse(
-        model=model_name,
-        messages=[
+    patch = parse_completion(
+        model_name,
+        [
             {
                 "role": "system",
                 "content": (
                     "You are an expert web developer and creative director. "
-                    "You refine existing website code (HTML, CSS, JS, images) based on improvement instructions."
+                    "You refine existing website code (HTML, CSS, JS, images) based on improvement instructions, "
+                    "answering with minimal, precise edits."
                 )
             },
             {
@@ -94,6 +331,15 @@ def refine_website_spec(current_spec: WebsiteSpec, improvement_instructions: str
                 "content": refinement_prompt
             }
         ],
-        response_format=WebsiteSpec,
+        SpecPatch,
+        cache,
     )
-    return completion.choices[0].message.parsed
+
+    try:
+        refined_spec = apply_spec_patch(current_spec, patch)
+    except PatchApplyError as e:
+        print(f"Could not apply refinement edits ({e}); falling back to full regeneration.")
+        return refine_website_spec(current_spec, improvement_instructions, model_name, cache)
+
+    print(f"Applied {len(patch.edits)} refinement edits.")
+    return refined_spec
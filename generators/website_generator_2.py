@@ -1,9 +1,7 @@
 from typing import List
 from pydantic import BaseModel
-from openai import OpenAI
-
-# Initialize the OpenAI client (ensure you have your API key set up via environment variables or otherwise)
-client = OpenAI()
+from services.openai_client import get_client
+from services.request_layer import call_with_retry
 
 class ImageSpec(BaseModel):
     prompt: str   # DALL·E prompt for generating the image
@@ -21,7 +19,9 @@ def generate_website_spec(details_doc: str) -> WebsiteSpec:
     that define which images should be generated and how they should be named.
     """
     # Use the "beta.chat.completions.parse" method if you're leveraging the structured outputs feature.
-    completion = client.beta.chat.completions.parse(
+    completion = call_with_retry(
+        "chat",
+        get_client().beta.chat.completions.parse,
         model="gpt-4o-2024-08-06",
         messages=[
             {
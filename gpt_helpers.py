@@ -1,10 +1,8 @@
 import os
 from pathlib import Path
 from pydantic import BaseModel
-from openai import OpenAI
-
-# Initialize the OpenAI client
-client = OpenAI()
+from services.openai_client import get_client
+from services.request_layer import call_with_retry, estimate_chat_tokens
 
 # Define the Pydantic schema for our website code.
 class WebsiteCode(BaseModel):
@@ -17,26 +15,30 @@ def build_website(details_doc: str) -> WebsiteCode:
     Build the HTML, CSS, and JavaScript for a landing page that meets the specified requirements.
     The assistant's output will conform to the WebsiteCode schema.
     """
-    completion = client.beta.chat.completions.parse(
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are an expert web developer who creates production-ready websites with HTML, CSS, and JavaScript. "
+                "When provided a set of requirements, return only a valid JSON object that has three keys: 'html', 'css', and 'js'. "
+                "Each should contain the respective code as a string."
+            )
+        },
+        {
+            "role": "user",
+            "content": (
+                "Build me a landing page that meets the following requirements: "
+                f"{details_doc}"
+            )
+        }
+    ]
+    completion = call_with_retry(
+        "chat",
+        get_client().beta.chat.completions.parse,
         model="gpt-4o-2024-08-06",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are an expert web developer who creates production-ready websites with HTML, CSS, and JavaScript. "
-                    "When provided a set of requirements, return only a valid JSON object that has three keys: 'html', 'css', and 'js'. "
-                    "Each should contain the respective code as a string."
-                )
-            },
-            {
-                "role": "user",
-                "content": (
-                    "Build me a landing page that meets the following requirements: "
-                    f"{details_doc}"
-                )
-            }
-        ],
+        messages=messages,
         response_format=WebsiteCode,  # Use our Pydantic model to enforce the output schema.
+        estimated_tokens=estimate_chat_tokens(messages),
     )
 
     website_code = completion.choices[0].message.parsed
@@ -1,10 +1,9 @@
 import os
 import requests
 from pathlib import Path
-from openai import OpenAI
-
-# Initialize the OpenAI client
-client = OpenAI()
+from services.openai_client import get_client
+from services.request_layer import call_with_retry
+from services.tracing import count
 
 def generate_image(prompt: str, output_dir: Path, filename: str, size: str = "1024x1024", quality: str = "standard") -> Path:
     """
@@ -23,7 +22,9 @@ def generate_image(prompt: str, output_dir: Path, filename: str, size: str = "10
     """
     # Generate image using the Images API (using DALL·E 3)
     try:
-        response = client.images.generate(
+        response = call_with_retry(
+            "images",
+            get_client().images.generate,
             model="dall-e-3",
             prompt=prompt,
             size=size,
@@ -47,6 +48,7 @@ def generate_image(prompt: str, output_dir: Path, filename: str, size: str = "10
         file_path = output_dir / filename
         with open(file_path, "wb") as f:
             f.write(image_response.content)
+        count("download.bytes", len(image_response.content))
         print(f"Image saved to: {file_path.resolve()}")
         return file_path
     else:
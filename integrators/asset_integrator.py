@@ -1,31 +1,178 @@
 # webapp/integrators/asset_integrator.py
 
-from typing import Dict
+import os
+import re
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
+from pydantic import BaseModel
 from generators.website_generator import WebsiteSpec
 
-def update_website_code(website_spec: WebsiteSpec, image_paths: Dict[str, str]) -> WebsiteSpec:
+class IntegrationReport(BaseModel):
+    # "html" / "css" / "js" -> image filename -> number of references rewritten
+    rewritten: Dict[str, Dict[str, int]]
+    # Images in image_paths that no file referenced
+    unreferenced: List[str]
+
+# Relative directories in front of a filename, e.g. "images/", "./img/", "/assets/images/"
+_PREFIX = r"(?:\.{1,2}/|/)?(?:[\w-]+/)*"
+# Attributes whose value is a URL (srcset and data-srcset: a list of them)
+URL_ATTRIBUTES = ("src", "href", "poster", "data-src")
+# <meta content> holds a URL for og:image and twitter:image
+META_URL_ATTRIBUTES = URL_ATTRIBUTES + ("content",)
+SRCSET_ATTRIBUTES = ("srcset", "data-srcset")
+
+# The attributes of a start tag, with quoted values that may contain ">"
+_TAG_BODY = r"(?:[^>\"']|\"[^\"]*\"|'[^']*')*>"
+# A start tag; <style> and <script> tags also take their content up to the end tag
+_HTML_RE = re.compile(
+    r"(?P<block_open><(?P<block_tag>style|script)\b" + _TAG_BODY + r")(?P<block>.*?)(?=</(?P=block_tag)\s*>)"
+    r"|(?P<tag><(?P<tag_name>[a-zA-Z][\w-]*)" + _TAG_BODY + r")",
+    re.IGNORECASE | re.DOTALL,
+)
+_ATTRIBUTE_RE = re.compile(
+    r"(?P<lead>\s(?P<name>[\w-]+)\s*=\s*)(?:(?P<quote>[\"'])(?P<value>.*?)(?P=quote)|(?P<bare>[^\s\"'=<>`]+))",
+    re.DOTALL,
+)
+
+
+class _References:
     """
-    Replaces any image placeholders in the website's HTML (and possibly CSS/JS)
-    with the actual paths where the images have been saved.
-    
-    This example assumes your HTML might contain placeholders like {{filename}}.
-    For each filename in image_paths, replace it with the actual path.
+    Rewrites references to a set of image names in one file, counting them
+    in counts. A reference is only rewritten where a URL is expected:
+      - placeholders:           {{hero.png}}, {{ images/hero.png }} (anywhere)
+      - URL attributes:         src="images/hero.png", href, poster, data-src,
+                                srcset="images/hero.png 2x, ...", <meta content>
+      - CSS urls:               url(images/hero.png), url('images/hero.png'), in CSS,
+                                <style> blocks, style attributes and JS
+      - JS strings:             'images/hero.png', "hero.png", in JS and <script> blocks
+    Other attribute values (alt="hero.png") and names in text are left alone.
+    """
+
+    def __init__(self, targets: Dict[str, str], counts: Dict[str, int]):
+        self.targets = targets
+        self.counts = counts
+        # Longest first, so "hero-large.png" wins over "large.png"
+        alternation = "|".join(re.escape(name) for name in sorted(targets, key=len, reverse=True))
+        placeholder = r"\{\{\s*" + _PREFIX + r"(?P<placeholder>" + alternation + r")\s*\}\}"
+        css_url = r"|(?P<url_lead>url\(\s*[\"']?)" + _PREFIX + r"(?P<url>" + alternation + r")(?=[\"']?\s*\))"
+        js_string = r"|(?P<quote>[\"'`])" + _PREFIX + r"(?P<string>" + alternation + r")(?=(?P=quote))"
+        self.placeholder_re = re.compile(placeholder)
+        self.value_re = re.compile(r"\s*(?:" + placeholder + r"|" + _PREFIX + r"(?P<name>" + alternation + r"))\s*")
+        self.css_re = re.compile(placeholder + css_url)
+        self.js_re = re.compile(placeholder + css_url + js_string)
+
+    def _target(self, name: str) -> str:
+        self.counts[name] = self.counts.get(name, 0) + 1
+        return self.targets[name]
+
+    def _substitute(self, match: "re.Match") -> str:
+        groups = match.groupdict()
+        if groups.get("placeholder"):
+            return self._target(groups["placeholder"])
+        if groups.get("url"):
+            return groups["url_lead"] + self._target(groups["url"])
+        return groups["quote"] + self._target(groups["string"])
+
+    def placeholders(self, content: str) -> str:
+        return self.placeholder_re.sub(self._substitute, content)
+
+    def css(self, content: str) -> str:
+        return self.css_re.sub(self._substitute, content)
+
+    def js(self, content: str) -> str:
+        return self.js_re.sub(self._substitute, content)
+
+    def url(self, value: str) -> str:
+        # An attribute value that is a single URL (or placeholder)
+        match = self.value_re.fullmatch(value)
+        if match is None:
+            return value
+        return self._target(match.group("placeholder") or match.group("name"))
+
+    def srcset(self, value: str) -> str:
+        candidates = []
+        for candidate in value.split(","):
+            parts = candidate.split()
+            if parts:
+                rewritten = self.url(parts[0])
+                if rewritten != parts[0]:
+                    candidate = candidate.replace(parts[0], rewritten, 1)
+            candidates.append(candidate)
+        return ",".join(candidates)
+
+    def _attribute(self, match: "re.Match", url_attributes=URL_ATTRIBUTES) -> str:
+        name = match.group("name").lower()
+        quote = match.group("quote") or ""
+        value = match.group("value") if quote else match.group("bare")
+        if name in url_attributes:
+            value = self.url(value)
+        elif name in SRCSET_ATTRIBUTES:
+            value = self.srcset(value)
+        elif name == "style":
+            value = self.css(value)
+        else:
+            value = self.placeholders(value)
+        return match.group("lead") + quote + value + quote
+
+    def html(self, content: str) -> str:
+        def substitute(match: "re.Match") -> str:
+            if match.group("block_open"):
+                rewrite = self.css if match.group("block_tag").lower() == "style" else self.js
+                return _ATTRIBUTE_RE.sub(self._attribute, match.group("block_open")) + rewrite(match.group("block"))
+            if match.group("tag_name").lower() == "meta":
+                return _ATTRIBUTE_RE.sub(lambda found: self._attribute(found, META_URL_ATTRIBUTES), match.group("tag"))
+            return _ATTRIBUTE_RE.sub(self._attribute, match.group("tag"))
+
+        # Placeholders in text (outside tags and blocks) are replaced too
+        return self.placeholders(_HTML_RE.sub(substitute, content))
+
+def integrate_images(
+    website_spec: WebsiteSpec,
+    image_paths: Dict[str, str],
+    site_root: Optional[Path] = None,
+) -> Tuple[WebsiteSpec, IntegrationReport]:
     """
-    new_html = website_spec.html
-    new_css = website_spec.css
-    new_js = website_spec.js
+    Rewrites every reference to a generated image in the HTML, CSS and JS
+    to the path where the image was saved. Only places where a URL is
+    expected are rewritten (see _References), so a filename in an alt text
+    or in the page's prose stays as it is.
 
+    If site_root is given (the directory the HTML is served from), saved paths
+    are made relative to it so the links work from index.html.
+    Returns the updated spec and a report of what was rewritten.
+    """
+    targets: Dict[str, str] = {}
     for filename, local_path in image_paths.items():
-        placeholder = f"{{{{{filename}}}}}"  # e.g. "{{hero.png}}"
-        # If you want to do the same in CSS/JS, you could also replace placeholders there:
-        new_html = new_html.replace(placeholder, local_path)
-        new_css = new_css.replace(placeholder, local_path)
-        new_js = new_js.replace(placeholder, local_path)
-
-    return WebsiteSpec(
-        html=new_html,
-        css=new_css,
-        js=new_js,
+        if site_root is not None:
+            local_path = Path(os.path.relpath(local_path, site_root)).as_posix()
+        targets[Path(filename).name] = local_path
+
+    rewritten: Dict[str, Dict[str, int]] = {"html": {}, "css": {}, "js": {}}
+    if not targets:
+        return website_spec, IntegrationReport(rewritten=rewritten, unreferenced=[])
+
+    updated_spec = WebsiteSpec(
+        html=_References(targets, rewritten["html"]).html(website_spec.html),
+        css=_References(targets, rewritten["css"]).css(website_spec.css),
+        js=_References(targets, rewritten["js"]).js(website_spec.js),
         images=website_spec.images
     )
+    referenced = {name for counts in rewritten.values() for name in counts}
+    report = IntegrationReport(
+        rewritten=rewritten,
+        unreferenced=sorted(name for name in targets if name not in referenced),
+    )
+    return updated_spec, report
+
+def update_website_code(
+    website_spec: WebsiteSpec,
+    image_paths: Dict[str, str],
+    site_root: Optional[Path] = None,
+) -> WebsiteSpec:
+    """
+    Replaces any image placeholders or references in the website's HTML, CSS and JS
+    with the actual paths where the images have been saved.
+    See integrate_images for the supported forms and for the rewrite report.
+    """
+    updated_spec, _ = integrate_images(website_spec, image_paths, site_root)
+    return updated_spec
@@ -0,0 +1,169 @@
+# webapp/integrators/page_hints.py
+
+import re
+import html
+from pathlib import Path
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+
+from generators.website_generator import WebsiteSpec
+from services.asset_builder import above_the_fold
+from services.css_rules import parse_css, selector_matches
+from services.html_dom import Element, HtmlDocument, parse_html
+from services.image_size import read_image_size
+
+_CSS_URL_RE = re.compile(r"url\(\s*['\"]?([^'\")]+\.(?:png|jpe?g|gif|webp|avif))['\"]?\s*\)", re.IGNORECASE)
+
+
+class PageHintsReport(BaseModel):
+    hero: Optional[str] = None
+    lazy: List[str] = []
+    sized: List[str] = []
+    deferred: List[str] = []
+
+
+def _is_local(url: str) -> bool:
+    return bool(url) and "://" not in url and not url.startswith(("//", "data:"))
+
+
+def _local_file(src: str, site_root: Optional[Path]) -> Optional[Path]:
+    if site_root is None or not _is_local(src):
+        return None
+    return Path(site_root) / src.split("?")[0].split("#")[0].lstrip("/")
+
+
+def _background_hero(css: str, sections: List[Element]) -> Optional[str]:
+    """
+    The first background image set on one of the sections at the top of the page.
+    """
+    for top in parse_css(css):
+        for rule in top.iter_style_rules():
+            match = _CSS_URL_RE.search(rule.body or "")
+            if match and any(selector_matches(selector, el) for selector in rule.selectors() for el in sections):
+                return match.group(1)
+    return None
+
+
+def _preload_tag(hero: Element, hero_url: str) -> str:
+    attrs = [("rel", "preload"), ("as", "image")]
+    picture = hero.parent if hero is not None and hero.parent is not None and hero.parent.tag == "picture" else None
+    source = picture.find("source") if picture is not None else None
+    if source is not None and source.get("srcset"):
+        # Preload what the <picture> will actually pick, in its preferred format
+        if source.get("type"):
+            attrs.append(("type", source.get("type")))
+        attrs.append(("imagesrcset", source.get("srcset")))
+        if source.get("sizes"):
+            attrs.append(("imagesizes", source.get("sizes")))
+    else:
+        attrs.append(("href", hero_url))
+        if hero is not None and hero.get("srcset"):
+            attrs.append(("imagesrcset", hero.get("srcset")))
+            if hero.get("sizes"):
+                attrs.append(("imagesizes", hero.get("sizes")))
+    attrs.append(("fetchpriority", "high"))
+    return "<link " + " ".join(f'{name}="{html.escape(value, quote=True)}"' for name, value in attrs) + ">"
+
+
+def _insert_in_head(document: HtmlDocument, markup: str) -> bool:
+    head = document.find("head")
+    if head is None:
+        return False
+    # Ahead of stylesheets and scripts, so the image request starts first
+    first = next((el for el in head.children if el.tag in ("link", "style", "script")), None)
+    if first is not None:
+        document.insert_before(first, markup)
+    else:
+        document.append_child(head, markup)
+    return True
+
+
+def add_page_hints(website_spec: WebsiteSpec, site_root: Optional[Path] = None) -> Tuple[WebsiteSpec, PageHintsReport]:
+    """
+    Adds the loading hints a fast page needs, working on the parsed HTML:
+
+      - the hero (the first image at the top of the page, or the background
+        image of its first section) gets fetchpriority="high" and a
+        <link rel="preload"> in <head>;
+      - images below the fold get loading="lazy" and decoding="async",
+        other images decoding="async";
+      - <img> tags without width/height get the real size of the local
+        file (read from site_root), so the browser reserves their space;
+      - local scripts loaded with a plain <script src> get defer.
+
+    Attributes already present are left as they are. Returns the updated
+    spec and a report of what changed.
+    """
+    document = parse_html(website_spec.html)
+    report = PageHintsReport()
+    sections = above_the_fold(document)
+    fold_ids = {id(el) for section in sections for el in section.iter()} if sections is not None else None
+
+    images = document.find_all("img")
+    hero: Optional[Element] = None
+    above = [img for img in images if fold_ids is None or id(img) in fold_ids]
+    if above:
+        hero = above[0]
+    hero_url = hero.get("src") if hero is not None else None
+    if hero is None and sections:
+        hero_url = _background_hero(website_spec.css, sections)
+
+    for img in images:
+        src = img.get("src") or ""
+        if img is hero:
+            if img.get("loading") == "lazy":
+                document.set_attribute(img, "loading", "eager")
+            if img.get("fetchpriority") is None:
+                document.set_attribute(img, "fetchpriority", "high")
+        elif fold_ids is not None and id(img) not in fold_ids:
+            if img.get("loading") is None:
+                document.set_attribute(img, "loading", "lazy")
+                report.lazy.append(src)
+        if img is not hero and img.get("decoding") is None:
+            document.set_attribute(img, "decoding", "async")
+
+        if img.get("width") is None and img.get("height") is None:
+            path = _local_file(src, site_root)
+            size = read_image_size(path) if path is not None else None
+            if size is not None:
+                document.set_attribute(img, "width", str(size[0]))
+                document.set_attribute(img, "height", str(size[1]))
+                report.sized.append(src)
+
+    if hero_url and _is_local(hero_url):
+        # A page that already preloads an image has chosen its hero itself
+        already = any(
+            link.get("rel") == "preload" and link.get("as") == "image"
+            for link in document.find_all("link")
+        )
+        if not already and _insert_in_head(document, _preload_tag(hero, hero_url)):
+            report.hero = hero_url
+
+    for script in document.find_all("script"):
+        src = script.get("src")
+        kind = (script.get("type") or "").strip().lower()
+        if not src or not _is_local(src) or kind not in ("", "text/javascript", "application/javascript"):
+            continue
+        # Boolean attributes parse with a None value, so test for the name
+        if "defer" not in script.attrs and "async" not in script.attrs:
+            document.set_attribute(script, "defer", None)
+            report.deferred.append(src)
+
+    updated_spec = WebsiteSpec(
+        html=document.to_html(),
+        css=website_spec.css,
+        js=website_spec.js,
+        images=website_spec.images,
+    )
+    return updated_spec, report
+
+
+def print_page_hints(report: PageHintsReport):
+    if report.hero:
+        print(f"Preloading hero image {report.hero} with high priority.")
+    if report.lazy:
+        print(f"Lazy-loading {len(report.lazy)} image(s) below the fold.")
+    if report.sized:
+        print(f"Added width/height to {len(report.sized)} image(s).")
+    for src in report.deferred:
+        print(f"Deferred script {src}.")
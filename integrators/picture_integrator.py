@@ -0,0 +1,85 @@
+# webapp/integrators/picture_integrator.py
+
+import os
+import html
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from generators.image_planner import estimate_rendered_sizes
+from generators.website_generator import WebsiteSpec
+from services.html_dom import parse_html
+from services.image_optimizer import FORMATS, MIME_TYPES, OptimizedImage
+
+
+def _sizes(rendered_width: Optional[int]) -> str:
+    if rendered_width:
+        return f"(max-width: {rendered_width}px) 100vw, {rendered_width}px"
+    return "100vw"
+
+
+def use_responsive_images(
+    website_spec: WebsiteSpec,
+    optimized: Dict[str, OptimizedImage],
+    site_root: Optional[Path] = None,
+) -> Tuple[WebsiteSpec, int]:
+    """
+    Wraps every <img> that shows an optimized image in a <picture> with one
+    <source srcset> per format (AVIF first, then WebP), keeping the original
+    file as the fallback src. Missing width/height attributes are filled in
+    from the image, so the browser can reserve space before it loads.
+    The sizes attribute comes from the image's estimated rendered width.
+
+    Call after integrate_images, so img src attributes hold the saved paths.
+    <img> tags already inside a <picture> and CSS backgrounds are left alone.
+    Returns the updated spec and the number of tags rewritten.
+    """
+    if not optimized:
+        return website_spec, 0
+
+    def href(path: str) -> str:
+        if site_root is not None:
+            path = os.path.relpath(path, site_root)
+        return Path(path).as_posix()
+
+    by_name = {Path(image.source_path).name: image for image in optimized.values()}
+    estimates = estimate_rendered_sizes(website_spec)
+    document = parse_html(website_spec.html)
+    rewritten = 0
+
+    for img in document.find_all("img"):
+        if img.parent is not None and img.parent.tag == "picture":
+            continue
+        image = by_name.get(Path((img.get("src") or "").split("?")[0]).name)
+        if image is None:
+            continue
+
+        estimate = estimates.get(image.filename)
+        sizes = _sizes(estimate[0] if estimate else None)
+        sources = []
+        for fmt in FORMATS:
+            variants = image.by_format(fmt)
+            if not variants:
+                continue
+            srcset = ", ".join(f"{href(v.path)} {v.width}w" for v in variants)
+            sources.append(
+                f'<source type="{MIME_TYPES[fmt]}" srcset="{html.escape(srcset, quote=True)}" sizes="{sizes}">'
+            )
+        if not sources:
+            continue
+
+        if img.get("width") is None and img.get("height") is None:
+            document.set_attribute(img, "width", str(image.width))
+            document.set_attribute(img, "height", str(image.height))
+        document.insert_before(img, "<picture>" + "".join(sources))
+        document.insert_after(img, "</picture>")
+        rewritten += 1
+
+    if not rewritten:
+        return website_spec, 0
+    updated_spec = WebsiteSpec(
+        html=document.to_html(),
+        css=website_spec.css,
+        js=website_spec.js,
+        images=website_spec.images,
+    )
+    return updated_spec, rewritten
@@ -1,16 +1,28 @@
 # webapp/main.py
 
 import sys
-import json
+import asyncio
 import argparse
 from pathlib import Path
 
 
 # Import modules
-from generators.website_generator import generate_website_spec, refine_website_spec, WebsiteSpec
-from generators.image_generator import generate_and_save_image
-from integrators.asset_integrator import update_website_code
-from services.file_manager import write_website_files
+from generators.image_generator import ImageJobPool
+from generators.refiner import REFINE_MODES
+from generators.website_generator import CompletionRefused
+from services.image_cache import ImageCache, DEFAULT_CACHE_DIR
+from services.prompt_index import PromptIndex, DEFAULT_THRESHOLD as DEFAULT_SIMILARITY, INDEX_FILENAME as PROMPT_INDEX_FILENAME
+from services.image_optimizer import DEFAULT_WIDTHS, ImageOptimizer, pillow_available
+from services.batch_runner import BatchScheduler, run_batch
+from services.job_server import serve
+from services.watcher import watch_site
+from services.site_pipeline import build_site_pipeline
+from services.checkpoint import CheckpointError, CheckpointStore, DEFAULT_CHECKPOINT_DIR, PATH_OPTIONS, RUN_OPTIONS, run_options
+from services.openai_client import configure_client
+from services.request_layer import configure_budget
+from services.latency_stats import DEFAULT_STATS_FILE as DEFAULT_LATENCY_STATS_FILE, configure_latency_stats, get_latency_stats
+from services.tracing import get_tracer
+from services.completion_cache import CompletionCache, CompletionCacheMiss, DEFAULT_CACHE_DIR as DEFAULT_COMPLETION_CACHE_DIR
 
 
 
@@ -27,6 +39,60 @@ def main():
     parser = argparse.ArgumentParser(description="Generate or refine a website with GPT + DALL·E images.")
 
     # High-level pipeline controls
+    parser.add_argument(
+        "--batch",
+        type=Path,
+        help=(
+            "Build many sites from a JSONL file; each line has 'output_dir' and 'details' (or 'spec_file' to "
+            "refine an existing spec) and optionally 'id', 'model', 'spec_model', 'refine_model', 'iterations', 'improvement', 'refine_mode' "
+            "and 'output_spec'."
+        )
+    )
+    parser.add_argument(
+        "--batch-summary",
+        type=Path,
+        help="Where to write the per-job JSONL summary of a --batch run (default: <jobs file>.summary.jsonl)."
+    )
+    parser.add_argument(
+        "--chat-concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of chat completions running at the same time in --batch and --serve mode."
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as a long-lived job service: accept generate and refine jobs over a local HTTP API."
+    )
+    parser.add_argument(
+        "--serve-host",
+        default="127.0.0.1",
+        help="Address the --serve API listens on."
+    )
+    parser.add_argument(
+        "--serve-port",
+        type=int,
+        default=8080,
+        help="Port the --serve API listens on."
+    )
+    parser.add_argument(
+        "--serve-dir",
+        type=Path,
+        default=Path(".serve"),
+        help="Directory holding the --serve job queue, job specs and (by default) generated sites."
+    )
+    parser.add_argument(
+        "--serve-workers",
+        type=int,
+        default=2,
+        help="How many jobs --serve runs at the same time."
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=60.0,
+        help="On shutdown, seconds --serve waits for running jobs before requeueing them."
+    )
     parser.add_argument(
         "--details", 
         type=str, 
@@ -35,12 +101,27 @@ def main():
         ),
         help="Textual requirements for the initial website (passed to GPT)."
     )
+    parser.add_argument(
+        "--details-file",
+        type=Path,
+        help="Read the website requirements from this file instead of --details (watched by --watch)."
+    )
     parser.add_argument(
         "--model",
         type=str,
         default="gpt-4o-mini-2024-07-18",  # or "o1-mini-2024-12-17" depending on your plan
         help="Model name to use for GPT calls."
     )
+    parser.add_argument(
+        "--spec-model",
+        type=str,
+        help="Model for the initial website spec (default: --model), e.g. a stronger one than for refinements."
+    )
+    parser.add_argument(
+        "--refine-model",
+        type=str,
+        help="Model for the refinement iterations (default: --model), e.g. a cheaper and faster one."
+    )
     parser.add_argument(
         "--iterations",
         type=int,
@@ -53,11 +134,64 @@ def main():
         default="Please enhance the design and add a testimonial section.",
         help="Instructions for refining the website spec each iteration."
     )
+    parser.add_argument(
+        "--stream-spec",
+        action="store_true",
+        help=(
+            "Stream the initial spec and start generating each image as soon as its spec arrives, "
+            "writing draft HTML/CSS/JS files as they complete."
+        )
+    )
+    parser.add_argument(
+        "--refine-mode",
+        choices=REFINE_MODES,
+        default="full",
+        help=(
+            "'full' regenerates the whole spec each iteration; 'diff' asks only for search/replace edits; "
+            "'sections' refines each page section in parallel and merges the results."
+        )
+    )
+    parser.add_argument(
+        "--section-concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of sections refined at the same time with --refine-mode sections."
+    )
     parser.add_argument(
         "--spec-file",
         type=Path,
         help="Path to an existing website spec JSON file. If provided, skip initial GPT generation unless forced."
     )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "After building, rebuild whenever --spec-file or --details-file changes, redoing only the "
+            "affected stages, and serve the site with live reload."
+        )
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=0.5,
+        help="Seconds between checks for changes in --watch mode."
+    )
+    parser.add_argument(
+        "--preview-host",
+        default="127.0.0.1",
+        help="Address of the --watch preview server."
+    )
+    parser.add_argument(
+        "--preview-port",
+        type=int,
+        default=8000,
+        help="Port of the --watch preview server."
+    )
+    parser.add_argument(
+        "--no-preview",
+        action="store_true",
+        help="Do not start the preview server in --watch mode."
+    )
     parser.add_argument(
         "--skip-web",
         action="store_true",
@@ -68,6 +202,106 @@ def main():
         action="store_true",
         help="Skip the image generation step."
     )
+    parser.add_argument(
+        "--image-concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of images to generate at the same time."
+    )
+    parser.add_argument(
+        "--no-image-planning",
+        action="store_true",
+        help=(
+            "Generate every image with dall-e-3 at 1024x1024 instead of picking the cheapest model, "
+            "size and quality that covers its estimated rendered size."
+        )
+    )
+    parser.add_argument(
+        "--no-speculative-images",
+        action="store_true",
+        help=(
+            "Only generate the images of the final spec, instead of starting image jobs for every "
+            "intermediate refinement and reusing those whose prompt does not change."
+        )
+    )
+    parser.add_argument(
+        "--image-response-format",
+        choices=["url", "b64_json"],
+        default="url",
+        help="How the Images API returns images: a URL to download, or inline base64 data (skips the extra fetch)."
+    )
+    parser.add_argument(
+        "--no-optimize-images",
+        action="store_true",
+        help="Keep the generated images as they are instead of adding resized WebP/AVIF variants and <picture> tags."
+    )
+    parser.add_argument(
+        "--image-widths",
+        type=lambda text: [int(width) for width in text.split(",") if width.strip()],
+        default=list(DEFAULT_WIDTHS),
+        help="Comma-separated widths of the responsive image variants (default: 480,960,1600)."
+    )
+    parser.add_argument(
+        "--optimize-workers",
+        type=int,
+        help="Number of processes transcoding images (default: one per CPU)."
+    )
+    parser.add_argument(
+        "--no-image-cache",
+        action="store_true",
+        help="Always call the Images API instead of reusing previously generated images."
+    )
+    parser.add_argument(
+        "--image-cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="Directory of the on-disk cache of generated images."
+    )
+    parser.add_argument(
+        "--image-cache-max-mb",
+        type=int,
+        default=1024,
+        help="Size budget of the image cache in megabytes; least recently used images are evicted beyond it."
+    )
+    parser.add_argument(
+        "--reuse-similar-images",
+        type=float,
+        nargs="?",
+        const=DEFAULT_SIMILARITY,
+        metavar="SIMILARITY",
+        help=(
+            "Reuse a cached image whose prompt is at least this similar (0-1, word-bigram Jaccard; "
+            f"default {DEFAULT_SIMILARITY}) instead of generating a new one."
+        )
+    )
+    parser.add_argument(
+        "--no-completion-cache",
+        action="store_true",
+        help="Always call the chat API instead of reusing identical previous completions."
+    )
+    parser.add_argument(
+        "--completion-cache-dir",
+        type=Path,
+        default=DEFAULT_COMPLETION_CACHE_DIR,
+        help="Directory of the on-disk cache of chat completions."
+    )
+    parser.add_argument(
+        "--completion-cache-ttl-hours",
+        type=float,
+        default=24 * 7,
+        help="Cached chat completions older than this are ignored and refreshed."
+    )
+    parser.add_argument(
+        "--completion-cache-max-mb",
+        type=int,
+        default=256,
+        help="Size budget of the completion cache in megabytes."
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="Serve every chat completion from the cache and fail on a miss instead of calling the API."
+    )
     parser.add_argument(
         "--output-spec",
         type=Path,
@@ -85,79 +319,275 @@ def main():
         default=Path("output_website"),
         help="Directory to store final HTML/CSS/JS files."
     )
+    parser.add_argument(
+        "--hashed-assets",
+        action="store_true",
+        help="Write CSS/JS under content-hashed names (e.g. styles.3fa9c1.css) and link them from index.html."
+    )
+    parser.add_argument(
+        "--no-page-hints",
+        action="store_true",
+        help="Leave index.html as generated instead of adding lazy loading, a hero image preload, image sizes and deferred scripts."
+    )
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="Minify the HTML, CSS and JS and drop CSS selectors that match nothing in the page."
+    )
+    parser.add_argument(
+        "--critical-css",
+        action="store_true",
+        help="Inline the CSS of the top of the page in index.html and load the full stylesheet without blocking rendering."
+    )
+    parser.add_argument(
+        "--precompress",
+        action="store_true",
+        help="Also write .gz (and .br, if the brotli package is installed) copies of the HTML, CSS and JS."
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        help="Write a Chrome trace (JSON) of the run's stages, API calls and downloads to this file."
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Save the run's progress (spec versions and finished images) so it can be resumed with --resume if it fails."
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=Path,
+        default=DEFAULT_CHECKPOINT_DIR,
+        help="Directory holding one checkpoint per --checkpoint run."
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="RUN_ID",
+        help="Resume a failed or interrupted run from its checkpoint, reusing its options and finished work."
+    )
+
+    parser.add_argument(
+        "--chat-rpm",
+        type=float,
+        help="Chat completion requests per minute allowed by your OpenAI quota (default: 500)."
+    )
+    parser.add_argument(
+        "--chat-tpm",
+        type=float,
+        help="Chat completion tokens per minute allowed by your OpenAI quota (default: 200000)."
+    )
+    parser.add_argument(
+        "--image-rpm",
+        type=float,
+        help="Image generation requests per minute allowed by your OpenAI quota (default: 50)."
+    )
+    parser.add_argument(
+        "--openai-base-url",
+        help="Send API requests to this URL instead of the OpenAI API (default: $OPENAI_BASE_URL), e.g. a local stand-in."
+    )
+    parser.add_argument(
+        "--request-timeout",
+        type=float,
+        help="Per-request timeout in seconds for chat and image calls (default: 300 for chat, 120 for images)."
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        help=(
+            "Send a second, identical chat request when one takes longer than this percentile (e.g. 95) "
+            "of recent latencies for the same model and request type, and use whichever answers first."
+        )
+    )
+    parser.add_argument(
+        "--latency-stats",
+        type=Path,
+        default=DEFAULT_LATENCY_STATS_FILE,
+        help="File keeping rolling per-model API latencies across runs (used by --hedge-percentile)."
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        help="How many times a rate-limited or failed API call is retried with backoff (default: 5)."
+    )
 
     args = parser.parse_args()
 
-    # -------------------------------------------------------------------------
-    # 1) Generate or load the WebsiteSpec
-    # -------------------------------------------------------------------------
-    if args.spec_file and args.spec_file.exists():
-        if args.skip_web:
-            # Load the existing spec from JSON, skipping GPT entirely
-            print(f"Loading existing website spec from {args.spec_file}")
-            with open(args.spec_file, "r", encoding="utf-8") as f:
-                spec_data = json.load(f)
-            website_spec = WebsiteSpec(**spec_data)
-        else:
-            # Just load the file. In a real app, you might ask the user
-            # if they want to re-generate or refine from scratch.
-            print(f"Loading existing website spec from {args.spec_file} (GPT generation not forced).")
-            with open(args.spec_file, "r", encoding="utf-8") as f:
-                spec_data = json.load(f)
-            website_spec = WebsiteSpec(**spec_data)
-    else:
-        if args.skip_web:
-            print("Error: --skip-web is set, but no valid --spec-file provided. Cannot skip GPT generation.")
+    if args.details_file is not None:
+        try:
+            args.details = args.details_file.read_text(encoding="utf-8")
+        except OSError as e:
+            print(f"Error: cannot read --details-file: {e}")
+            sys.exit(1)
+
+    if args.watch:
+        if args.batch or args.serve or args.resume or args.checkpoint:
+            print("Error: --watch cannot be combined with --batch, --serve, --resume or --checkpoint.")
+            sys.exit(1)
+        if args.spec_file is None and args.details_file is None:
+            print("Error: --watch needs a --spec-file or --details-file to watch.")
+            sys.exit(1)
+
+    for name in ("chat_rpm", "chat_tpm", "image_rpm", "request_timeout", "max_retries"):
+        if getattr(args, name) is not None and getattr(args, name) <= 0:
+            print(f"Error: --{name.replace('_', '-')} must be greater than 0.")
+            sys.exit(1)
+
+    for name in ("image_concurrency", "chat_concurrency", "section_concurrency", "serve_workers", "optimize_workers"):
+        if getattr(args, name) is not None and getattr(args, name) < 1:
+            print(f"Error: --{name.replace('_', '-')} must be at least 1.")
+            sys.exit(1)
+
+    if args.hedge_percentile is not None and not 0 < args.hedge_percentile < 100:
+        print("Error: --hedge-percentile must be between 0 and 100.")
+        sys.exit(1)
+
+    configure_client(base_url=args.openai_base_url)
+    configure_latency_stats(args.latency_stats)
+    configure_budget(
+        "chat",
+        requests_per_minute=args.chat_rpm,
+        tokens_per_minute=args.chat_tpm,
+        timeout=args.request_timeout,
+        max_retries=args.max_retries,
+        hedge_percentile=args.hedge_percentile,
+    )
+    configure_budget(
+        "images",
+        requests_per_minute=args.image_rpm,
+        timeout=args.request_timeout,
+        max_retries=args.max_retries,
+    )
+
+    if args.reuse_similar_images is not None:
+        if not 0 < args.reuse_similar_images <= 1:
+            print("Error: --reuse-similar-images must be between 0 and 1.")
+            sys.exit(1)
+        if args.no_image_cache:
+            print("Error: --reuse-similar-images needs the image cache, but --no-image-cache is set.")
             sys.exit(1)
-        
-        # Generate the initial spec from GPT
-        print(f"Generating initial website spec from GPT using model: {args.model}")
-        website_spec = generate_website_spec(args.details, args.model)
-
-    # -------------------------------------------------------------------------
-    # 2) Refinement Iterations (if any)
-    # -------------------------------------------------------------------------
-    for i in range(1, args.iterations):
-        print(f"\n--- Refinement Iteration {i} of {args.iterations - 1} ---")
-        website_spec = refine_website_spec(
-            website_spec,
-            args.improvement,  # Single instruction repeated or dynamically changed
-            args.model
+
+    if args.replay and args.no_completion_cache:
+        print("Error: --replay needs the completion cache, but --no-completion-cache is set.")
+        sys.exit(1)
+
+    checkpoint = None
+    if args.resume:
+        try:
+            checkpoint = CheckpointStore.open(args.checkpoint_dir, args.resume)
+        except CheckpointError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        for name, value in checkpoint.options.items():
+            if name in RUN_OPTIONS:
+                setattr(args, name, Path(value) if name in PATH_OPTIONS and value is not None else value)
+        print(f"Resuming run {checkpoint.run_id} (last status: {checkpoint.state.get('status')}).")
+    elif args.checkpoint and not args.batch and not args.serve:
+        checkpoint = CheckpointStore.create(args.checkpoint_dir, run_options(args))
+        print(f"Run ID: {checkpoint.run_id} (checkpoint in {checkpoint.root})")
+
+    completion_cache = None
+    if not args.no_completion_cache:
+        completion_cache = CompletionCache(
+            args.completion_cache_dir,
+            ttl_seconds=args.completion_cache_ttl_hours * 3600,
+            max_bytes=args.completion_cache_max_mb * 1024 * 1024,
+            replay=args.replay,
+        )
+
+    # Image jobs can start before the spec is final (see --stream-spec),
+    # so the pool lives for the whole run.
+    image_pool = None
+    if not args.skip_images:
+        image_cache = None
+        prompt_index = None
+        if not args.no_image_cache:
+            image_cache = ImageCache(args.image_cache_dir, args.image_cache_max_mb * 1024 * 1024)
+            if args.reuse_similar_images is not None:
+                prompt_index = PromptIndex(args.image_cache_dir / PROMPT_INDEX_FILENAME, args.reuse_similar_images)
+        image_pool = ImageJobPool(
+            args.images_dir,
+            concurrency=args.image_concurrency,
+            cache=image_cache,
+            response_format=args.image_response_format,
+            similar=prompt_index,
         )
 
-    # Display the final spec after all iterations
-    print("\nWebsite spec after all iterations:")
-    spec_dict = website_spec.model_dump()
-    print(json.dumps(spec_dict, indent=2))
-
-    # Optionally save the final spec to a JSON file
-    if args.output_spec:
-        args.output_spec.parent.mkdir(parents=True, exist_ok=True)
-        with open(args.output_spec, "w", encoding="utf-8") as f:
-            json.dump(spec_dict, f, indent=2)
-        print(f"Final WebsiteSpec saved to {args.output_spec}")
-
-    # -------------------------------------------------------------------------
-    # 3) Generate images (unless skipped)
-    # -------------------------------------------------------------------------
-    image_paths = {}
-    if args.skip_images:
-        print("Skipping image generation step...")
-    else:
-        for image_spec in website_spec.images:
-            local_path = generate_and_save_image(image_spec, args.images_dir)
-            if local_path:
-                image_paths[image_spec.filename] = local_path.as_posix()
-
-    # -------------------------------------------------------------------------
-    # 4) Integrate image paths
-    # -------------------------------------------------------------------------
-    updated_spec = update_website_code(website_spec, image_paths)
-
-    # -------------------------------------------------------------------------
-    # 5) Write final website files
-    # -------------------------------------------------------------------------
-    write_website_files(updated_spec, args.output_dir)
+    optimizer = None
+    if not args.skip_images and not args.no_optimize_images:
+        if pillow_available():
+            optimizer = ImageOptimizer(args.image_widths, args.optimize_workers)
+        else:
+            print("Pillow is not installed; images will not be optimized (pip install Pillow).")
+
+    try:
+        if args.batch:
+            scheduler = make_scheduler(args, completion_cache, image_pool, optimizer)
+            summary_file = args.batch_summary or args.batch.with_suffix(".summary.jsonl")
+            ok = run_batch(args.batch, summary_file, scheduler)
+            get_tracer().print_summary()
+            return 0 if ok else 1
+        if args.serve:
+            scheduler = make_scheduler(args, completion_cache, image_pool, optimizer)
+            status = serve(scheduler, args.serve_dir, args.serve_host, args.serve_port, args.serve_workers, args.drain_timeout)
+            get_tracer().print_summary()
+            return status
+        if args.watch:
+            if args.skip_web and not (args.spec_file and args.spec_file.exists()):
+                print("Error: --skip-web is set, but no valid --spec-file provided. Cannot skip GPT generation.")
+                sys.exit(1)
+            return watch_site(args, completion_cache, image_pool, optimizer)
+        return run(args, completion_cache, image_pool, checkpoint, optimizer)
+    except BaseException as e:
+        # A cache miss in replay mode or a refused completion ends the run
+        # with a message instead of a traceback, but still marks the checkpoint
+        expected = isinstance(e, (CompletionCacheMiss, CompletionRefused))
+        if expected:
+            print(f"Error: {e}")
+        if checkpoint is not None:
+            checkpoint.set_status("failed")
+            print(f"\nRun {checkpoint.run_id} did not finish; continue it with --resume {checkpoint.run_id}")
+        if expected:
+            sys.exit(1)
+        raise
+    finally:
+        if image_pool is not None:
+            image_pool.shutdown()
+        if optimizer is not None:
+            optimizer.shutdown()
+        get_latency_stats().save()
+        if args.trace:
+            get_tracer().write(args.trace)
+            print(f"Trace written to {args.trace} (open it in chrome://tracing or https://ui.perfetto.dev)")
+
+def make_scheduler(args, completion_cache, image_pool, optimizer=None):
+    """
+    Builds the job scheduler shared by --batch and --serve from parsed
+    command-line arguments; job fields left out fall back to these.
+    """
+    return BatchScheduler(
+        args,
+        image_pool,
+        completion_cache,
+        optimizer=optimizer,
+        chat_concurrency=args.chat_concurrency,
+        checkpoint_dir=args.checkpoint_dir if args.checkpoint else None,
+    )
+
+def run(args, completion_cache, image_pool, checkpoint=None, optimizer=None):
+    """
+    Runs the pipeline for parsed command-line arguments as a graph of stages
+    (see services.site_pipeline), so independent work overlaps.
+    """
+    if args.skip_web and not (args.spec_file and args.spec_file.exists()):
+        print("Error: --skip-web is set, but no valid --spec-file provided. Cannot skip GPT generation.")
+        sys.exit(1)
+
+    pipeline = build_site_pipeline(args, completion_cache, image_pool, checkpoint, optimizer)
+    asyncio.run(pipeline.run())
+    pipeline.print_timings()
+    get_tracer().print_summary()
+    if checkpoint is not None:
+        checkpoint.set_status("complete")
 
     print(f"\nAll done! You can now serve the contents of: {args.output_dir}")
 
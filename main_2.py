@@ -7,7 +7,7 @@ from pathlib import Path
 
 # Import modules
 from generators.website_generator import generate_website_spec, WebsiteSpec
-from generators.image_generator import generate_and_save_image
+from generators.image_generator import generate_images
 from integrators.asset_integrator import update_website_code
 from services.file_manager import write_website_files
 
@@ -39,6 +39,12 @@ def main():
         action="store_true",
         help="Skip the image generation step (useful if images are already generated)."
     )
+    parser.add_argument(
+        "--image-concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of images to generate at the same time."
+    )
     parser.add_argument(
         "--skip-web",
         action="store_true",
@@ -111,16 +117,18 @@ def main():
     if args.skip_images:
         print("Skipping image generation step...")
     else:
-        # Go through each image and generate it
-        for image_spec in website_spec.images:
-            local_path = generate_and_save_image(image_spec, args.images_dir)
-            if local_path:
-                image_paths[image_spec.filename] = local_path.as_posix()
+        image_paths, failures = generate_images(
+            website_spec.images,
+            args.images_dir,
+            concurrency=args.image_concurrency,
+        )
+        for filename, reason in failures.items():
+            print(f"Image '{filename}' was not generated: {reason}")
 
     # -------------------------------------------------------------------------
     # 3) Integrate image paths into the website code
     # -------------------------------------------------------------------------
-    updated_spec = update_website_code(website_spec, image_paths)
+    updated_spec = update_website_code(website_spec, image_paths, site_root=args.output_dir)
 
     # -------------------------------------------------------------------------
     # 4) Write final website files
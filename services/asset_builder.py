@@ -0,0 +1,199 @@
+# webapp/services/asset_builder.py
+
+import re
+from typing import List, Optional, Set, Tuple
+from pydantic import BaseModel
+
+from generators.section_refiner import find_sections
+from generators.website_generator import WebsiteSpec
+from services.css_rules import CssRule, NESTING_AT_RULES, parse_css, selector_matches, selector_names
+from services.file_manager import WEBSITE_FILES, brotli_bytes, gzip_bytes, site_relative
+from services.html_dom import Element, HtmlDocument, parse_html
+from services.minify import minify_css, minify_html, minify_js
+
+# Tags every page has even if the markup leaves them implicit
+_IMPLICIT_TAGS = {"html", "head", "body"}
+# Number of top-level sections (header, hero, ...) treated as above the fold
+CRITICAL_SECTIONS = 2
+
+
+class BuildOptions(BaseModel):
+    """
+    What the build stage does before the website files are written.
+    """
+    minify: bool = False
+    critical_css: bool = False
+    precompress: bool = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.minify or self.critical_css or self.precompress
+
+
+def _used_names(document: HtmlDocument, scripts: str) -> Tuple[Set[str], Set[str], Set[str], Set[str]]:
+    classes, ids, tags = set(), set(), set(_IMPLICIT_TAGS)
+    for element in document.root.iter():
+        classes.update(element.classes)
+        if element.id:
+            ids.add(element.id)
+        tags.add(element.tag)
+    # Any word in a script may be a class or id it adds at runtime
+    words = set(re.findall(r"[\w-]+", scripts))
+    return classes, ids, tags, words
+
+
+def prune_unused_css(css: str, html: str, js: str = "") -> Tuple[str, int]:
+    """
+    Drops the selectors that cannot match anything in the page, and the rules
+    (and @media blocks) left without selectors. A class or id also counts as
+    used when it appears anywhere in the JS or in an inline script, since
+    scripts often add classes at runtime. Selectors with functional
+    pseudo-classes (:is(), :not(), ...) are always kept.
+    Returns the pruned CSS and the number of selectors removed.
+    """
+    document = parse_html(html)
+    inline_scripts = " ".join(document.inner_html(script) for script in document.find_all("script"))
+    classes, ids, tags, words = _used_names(document, js + " " + inline_scripts)
+    removed = 0
+
+    def used(selector: str) -> bool:
+        if "(" in selector:
+            return True
+        selector_classes, selector_ids, selector_tags = selector_names(selector)
+        return (
+            selector_classes <= (classes | words)
+            and selector_ids <= (ids | words)
+            and selector_tags <= tags
+        )
+
+    def prune(rule: CssRule) -> Optional[str]:
+        nonlocal removed
+        if rule.prelude.lower().startswith(NESTING_AT_RULES):
+            kept_children = [text for text in (prune(child) for child in rule.children) if text]
+            return f"{rule.prelude} {{\n" + "\n".join(kept_children) + "\n}" if kept_children else None
+        if rule.is_at_rule:
+            return rule.text.strip()
+        selectors = rule.selectors()
+        kept = [selector for selector in selectors if used(selector)]
+        removed += len(selectors) - len(kept)
+        if not kept:
+            return None
+        if len(kept) == len(selectors):
+            return rule.text.strip()
+        return f"{', '.join(kept)} {{{rule.body}}}"
+
+    pruned = [text for text in (prune(rule) for rule in parse_css(css)) if text]
+    return "\n".join(pruned) + "\n", removed
+
+
+def _critical_rules(css: str, fold: List[Element]) -> str:
+    def critical(rule: CssRule) -> Optional[str]:
+        if rule.prelude.lower().startswith(NESTING_AT_RULES):
+            kept_children = [text for text in (critical(child) for child in rule.children) if text]
+            return f"{rule.prelude}{{" + "".join(kept_children) + "}" if kept_children else None
+        if rule.is_at_rule:
+            # @font-face, @keyframes etc. are only needed once the full stylesheet arrives
+            return None
+        if any(selector_matches(selector, element) for selector in rule.selectors() for element in fold):
+            return rule.text.strip()
+        return None
+
+    return "".join(text for text in (critical(rule) for rule in parse_css(css)) if text)
+
+
+def above_the_fold(document: HtmlDocument) -> Optional[List[Element]]:
+    """
+    The top-level sections visible without scrolling (the first
+    CRITICAL_SECTIONS of them), or None when the page has no more sections
+    than that, so there is no fold to speak of.
+    """
+    sections = find_sections(document)
+    if len(sections) <= CRITICAL_SECTIONS:
+        return None
+    return sections[:CRITICAL_SECTIONS]
+
+
+def inline_critical_css(html: str, css: str) -> str:
+    """
+    Inlines the rules that style the first sections of the page (the part
+    visible without scrolling) in a <style> block, and turns the stylesheet
+    link into a preload that applies itself once loaded, with a <noscript>
+    fallback. The page then renders its top without waiting for styles.css.
+    """
+    document = parse_html(html)
+    link = next(
+        (
+            el for el in document.find_all("link")
+            if "stylesheet" in (el.get("rel") or "").lower().split()
+            and site_relative(el.get("href") or "") == WEBSITE_FILES["css"]
+        ),
+        None,
+    )
+    sections = above_the_fold(document)
+    if link is None or sections is None:
+        return html
+
+    fold: List[Element] = []
+    for section in sections:
+        fold.extend(section.iter())
+        fold.extend(section.ancestors())
+    critical = minify_css(_critical_rules(css, fold))
+    if not critical:
+        return html
+
+    original_link = document.outer_html(link)
+    document.insert_before(link, f"<style>{critical}</style>")
+    document.set_attribute(link, "rel", "preload")
+    document.set_attribute(link, "as", "style")
+    document.set_attribute(link, "onload", "this.onload=null;this.rel='stylesheet'")
+    document.insert_after(link, f"<noscript>{original_link}</noscript>")
+    return document.to_html()
+
+
+def build_assets(website_spec: WebsiteSpec, options: BuildOptions) -> WebsiteSpec:
+    """
+    Prunes and minifies the page and inlines its critical CSS, as the options ask.
+    Precompression happens when the files are written (see write_website_files).
+    """
+    html, css, js = website_spec.html, website_spec.css, website_spec.js
+    if options.minify:
+        css, removed = prune_unused_css(css, html, js)
+        if removed:
+            print(f"Pruned {removed} unused CSS selector(s).")
+        css = minify_css(css)
+        js = minify_js(js)
+    if options.critical_css:
+        html = inline_critical_css(html, css)
+    if options.minify:
+        html = minify_html(html)
+    return WebsiteSpec(html=html, css=css, js=js, images=website_spec.images)
+
+
+def print_size_table(before: WebsiteSpec, after: WebsiteSpec, precompress: bool):
+    """
+    Prints the size of each file before and after the build, and compressed.
+    """
+    columns = ["file", "before", "after", "change"]
+    if precompress:
+        columns += ["gzip"] + (["brotli"] if brotli_bytes(b"") is not None else [])
+    rows = []
+    totals = [0] * (len(columns) - 1)
+    for field, filename in WEBSITE_FILES.items():
+        old, new = getattr(before, field).encode("utf-8"), getattr(after, field).encode("utf-8")
+        values = [len(old), len(new), None]
+        if precompress:
+            values.append(len(gzip_bytes(new)))
+            if "brotli" in columns:
+                values.append(len(brotli_bytes(new)))
+        rows.append((filename, values))
+        for index, value in enumerate(values):
+            if value is not None:
+                totals[index] += value
+    rows.append(("total", totals))
+
+    print("\nBuild output sizes (bytes):")
+    print("  " + "".join(f"{column:>12}" if index else f"{column:<14}" for index, column in enumerate(columns)))
+    for filename, values in rows:
+        change = f"{100 * (values[1] - values[0]) / values[0]:+.0f}%" if values[0] else "-"
+        cells = [f"{values[0]:>12,}", f"{values[1]:>12,}", f"{change:>12}"] + [f"{value:>12,}" for value in values[3:]]
+        print(f"  {filename:<14}" + "".join(cells))
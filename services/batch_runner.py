@@ -0,0 +1,229 @@
+# webapp/services/batch_runner.py
+
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, ValidationError
+
+from generators.image_generator import ImageJobPool
+from services.checkpoint import CheckpointStore, run_options
+from services.completion_cache import CompletionCache
+from services.image_optimizer import ImageOptimizer
+from services.site_pipeline import build_site_pipeline
+from services.tracing import span, track
+from services.usage import track_usage
+
+
+class BatchJob(BaseModel):
+    """
+    One line of a --batch JSONL file (or one job of --serve). Fields left
+    out fall back to the command-line defaults.
+
+    A job with spec_file refines that spec instead of generating one from
+    details; it counts as the first iteration. With output_spec, the final
+    spec is saved there as JSON.
+    """
+    output_dir: Path
+    details: str = ""
+    spec_file: Optional[Path] = None
+    output_spec: Optional[Path] = None
+    id: Optional[str] = None
+    model: Optional[str] = None
+    spec_model: Optional[str] = None
+    refine_model: Optional[str] = None
+    iterations: Optional[int] = None
+    improvement: Optional[str] = None
+    refine_mode: Optional[str] = None
+
+
+def load_jobs(jobs_file: Path) -> Tuple[List[BatchJob], List[Dict]]:
+    """
+    Reads a JSONL job file. Returns the valid jobs and a summary record for
+    every line that could not be parsed.
+    """
+    jobs, invalid = [], []
+    with open(jobs_file, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                job = BatchJob(**json.loads(line))
+            except (ValueError, ValidationError, TypeError) as e:
+                invalid.append({"id": f"line-{line_number}", "status": "invalid", "error": str(e)})
+                continue
+            if job.id is None:
+                job.id = f"line-{line_number}"
+            jobs.append(job)
+    return jobs, invalid
+
+
+class BatchScheduler:
+    """
+    Runs many site builds in one asyncio event loop, sharing the OpenAI clients,
+    the completion cache, a single image pool and the image optimizer across
+    all of them.
+
+    Each job runs the same stage graph as a single-site run (see
+    services.site_pipeline), built from the command-line arguments in
+    `defaults` with the job's own fields on top. Chat completions of all jobs
+    go through one thread pool of chat_concurrency workers and images through
+    the shared ImageJobPool, so those two limits hold across the whole batch
+    no matter how many jobs are queued.
+
+    With a checkpoint_dir, every job records a checkpoint as its own run
+    (its run ID is in the job's record), so a failed job can be continued
+    on its own with --resume.
+    """
+
+    def __init__(
+        self,
+        defaults: argparse.Namespace,
+        image_pool: Optional[ImageJobPool],
+        completion_cache: Optional[CompletionCache] = None,
+        optimizer: Optional[ImageOptimizer] = None,
+        chat_concurrency: int = 4,
+        checkpoint_dir: Optional[Path] = None,
+        on_progress: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.defaults = defaults
+        self.image_pool = image_pool
+        self.completion_cache = completion_cache
+        self.optimizer = optimizer
+        self.chat_concurrency = chat_concurrency
+        self.checkpoint_dir = checkpoint_dir
+        # Called with (job id, stage) as each job's stages start
+        self.on_progress = on_progress
+        self._chat_executor = ThreadPoolExecutor(max_workers=max(1, chat_concurrency))
+
+    def job_args(self, job: BatchJob) -> argparse.Namespace:
+        """
+        The arguments of a job's site pipeline: the defaults with the job's fields on top.
+        """
+        args = argparse.Namespace(**vars(self.defaults))
+        args.output_dir = job.output_dir
+        args.images_dir = job.output_dir / "images"
+        args.details = job.details
+        args.spec_file = job.spec_file
+        args.output_spec = job.output_spec
+        # A job's own models win over the command-line ones; per stage over --model
+        args.model = job.model or self.defaults.model
+        args.spec_model = job.spec_model or job.model or self.defaults.spec_model
+        args.refine_model = job.refine_model or job.model or self.defaults.refine_model
+        if job.iterations is not None:
+            args.iterations = job.iterations
+        args.improvement = job.improvement or self.defaults.improvement
+        args.refine_mode = job.refine_mode or self.defaults.refine_mode
+        return args
+
+    async def run_job(self, job: BatchJob) -> Dict:
+        args = self.job_args(job)
+        record = {
+            "id": job.id,
+            "output_dir": job.output_dir.as_posix(),
+            "model": args.spec_model or args.model,
+            "refine_model": args.refine_model or args.model,
+        }
+        job_start = time.perf_counter()
+        pipeline = None
+        checkpoint = None
+        on_stage = None if self.on_progress is None else (lambda stage: self.on_progress(job.id, stage))
+
+        with track_usage() as usage, track(f"job {job.id}"), span(f"job {job.id}", "job"):
+            try:
+                if job.spec_file is not None:
+                    if not job.spec_file.exists():
+                        raise FileNotFoundError(f"spec file {job.spec_file} does not exist")
+                elif not job.details:
+                    raise ValueError("job needs 'details' or 'spec_file'")
+
+                if self.checkpoint_dir is not None:
+                    checkpoint = CheckpointStore.create(self.checkpoint_dir, run_options(args))
+                    record["run_id"] = checkpoint.run_id
+                pipeline = build_site_pipeline(
+                    args,
+                    self.completion_cache,
+                    self.image_pool,
+                    checkpoint,
+                    optimizer=self.optimizer,
+                    chat_executor=self._chat_executor,
+                    on_stage=on_stage,
+                    print_spec=False,
+                )
+                values = await pipeline.run()
+
+                record["image_plans"] = [plan.model_dump() for plan in values["image_plans"].values()]
+                optimized = values["optimized_images"]
+                if self.optimizer is not None:
+                    record["image_bytes"] = {
+                        "original": sum(image.original_bytes for image in optimized.values()),
+                        "optimized": sum(image.largest_bytes(image.best_format()) for image in optimized.values()),
+                    }
+                record.update(
+                    status="ok",
+                    images={"generated": len(values["image_paths"]), "failed": len(values["image_failures"])},
+                )
+            except asyncio.CancelledError:
+                # Stages that have not started never run; drop the job's images
+                # still waiting in the shared pool so they do not hold it up
+                if self.image_pool is not None:
+                    self.image_pool.retain([], args.images_dir)
+                if checkpoint is not None:
+                    checkpoint.set_status("failed")
+                raise
+            except Exception as e:
+                print(f"Batch job {job.id} failed: {e}")
+                record.update(status="failed", error=f"{type(e).__name__}: {e}")
+            if checkpoint is not None:
+                checkpoint.set_status("complete" if record["status"] == "ok" else "failed")
+
+        timings = {} if pipeline is None else {
+            name: timing["end"] - timing["start"] for name, timing in pipeline.timings.items()
+        }
+        timings["total"] = time.perf_counter() - job_start
+        record["timings"] = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+        record["usage"] = usage
+        return record
+
+    async def run(self, jobs: List[BatchJob], summary_file: Path, invalid: Optional[List[Dict]] = None) -> List[Dict]:
+        """
+        Runs all jobs concurrently and appends one summary line per finished
+        job to summary_file, so partial results survive an interrupted batch.
+        """
+        summary_file.parent.mkdir(parents=True, exist_ok=True)
+        records = list(invalid or [])
+        with open(summary_file, "w", encoding="utf-8") as summary:
+            for record in records:
+                summary.write(json.dumps(record) + "\n")
+            for finished in asyncio.as_completed([self.run_job(job) for job in jobs]):
+                record = await finished
+                records.append(record)
+                summary.write(json.dumps(record) + "\n")
+                summary.flush()
+                print(f"Batch job {record['id']}: {record['status']} ({len(records)} of {len(jobs) + len(invalid or [])})")
+        return records
+
+    def shutdown(self):
+        self._chat_executor.shutdown()
+
+
+def run_batch(jobs_file: Path, summary_file: Path, scheduler: BatchScheduler) -> bool:
+    """
+    Builds every site listed in jobs_file. Returns True if all jobs succeeded.
+    """
+    jobs, invalid = load_jobs(jobs_file)
+    print(f"Running {len(jobs)} batch jobs from {jobs_file} ({len(invalid)} invalid lines).")
+    start = time.perf_counter()
+    try:
+        records = asyncio.run(scheduler.run(jobs, summary_file, invalid))
+    finally:
+        scheduler.shutdown()
+
+    failed = [record for record in records if record["status"] != "ok"]
+    elapsed = time.perf_counter() - start
+    print(f"Batch finished in {elapsed:.1f}s: {len(records) - len(failed)} succeeded, {len(failed)} failed.")
+    print(f"Summary written to {summary_file}")
+    return not failed
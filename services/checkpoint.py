@@ -0,0 +1,185 @@
+# webapp/services/checkpoint.py
+
+import os
+import json
+import time
+import shutil
+import secrets
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from generators.website_generator import ImageSpec, WebsiteSpec
+from services.file_manager import atomic_write_bytes, content_hash
+
+DEFAULT_CHECKPOINT_DIR = Path(".checkpoints")
+STATE_FILENAME = "state.json"
+
+# Options that decide what a run produces; recorded in its checkpoint and restored by --resume
+RUN_OPTIONS = (
+    "details", "model", "spec_model", "refine_model", "iterations", "improvement", "refine_mode", "stream_spec", "spec_file",
+    "output_spec", "images_dir", "output_dir", "hashed_assets", "no_image_planning",
+    "no_optimize_images", "image_widths", "no_page_hints", "minify", "critical_css", "precompress",
+    "reuse_similar_images",
+)
+PATH_OPTIONS = ("spec_file", "output_spec", "images_dir", "output_dir")
+
+# WebsiteSpec fields stored as blobs; images are kept inline in the spec record
+BLOB_FIELDS = ("html", "css", "js")
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + secrets.token_hex(3)
+
+
+def run_options(args) -> Dict:
+    """
+    The RUN_OPTIONS of parsed arguments, as JSON values for a checkpoint.
+    """
+    options = {name: getattr(args, name) for name in RUN_OPTIONS}
+    for name in PATH_OPTIONS:
+        if options[name] is not None:
+            options[name] = Path(options[name]).as_posix()
+    return options
+
+
+class CheckpointStore:
+    """
+    Persists the progress of one run under <checkpoint_dir>/<run_id>:
+
+        blobs/<sha256>       content-addressed HTML/CSS/JS and image bytes,
+                             so text repeated across spec versions is stored once
+        specs/<version>.json a spec version as blob hashes plus its image list
+        state.json           run options, status, finished images and the run report
+
+    Every write is atomic, so a run killed at any point leaves a readable
+    checkpoint. Safe to share between the threads of the image pool.
+    """
+
+    def __init__(self, checkpoint_dir: Path, run_id: str):
+        self.run_id = run_id
+        self.root = Path(checkpoint_dir) / run_id
+        self.blob_dir = self.root / "blobs"
+        self.spec_dir = self.root / "specs"
+        self._lock = threading.Lock()
+        self.state = self._load_state()
+        # Images finished by earlier attempts of this run; the current attempt's
+        # own images are still in the image pool and need no restoring
+        self._restorable = dict(self.state.get("images", {}))
+
+    @classmethod
+    def create(cls, checkpoint_dir: Path, options: Dict) -> "CheckpointStore":
+        store = cls(checkpoint_dir, new_run_id())
+        store.state.update(options=options, status="running", created=time.time())
+        store._save_state()
+        return store
+
+    @classmethod
+    def open(cls, checkpoint_dir: Path, run_id: str) -> "CheckpointStore":
+        store = cls(checkpoint_dir, run_id)
+        if not (store.root / STATE_FILENAME).exists():
+            raise CheckpointError(f"No checkpoint for run '{run_id}' in {checkpoint_dir}")
+        return store
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(self.root / STATE_FILENAME, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"images": {}}
+
+    def _save_state(self):
+        # Called with self._lock held (or before the store is shared)
+        atomic_write_bytes(self.root / STATE_FILENAME, json.dumps(self.state, indent=2).encode("utf-8"))
+
+    @property
+    def options(self) -> Dict:
+        return self.state.get("options", {})
+
+    def set_status(self, status: str):
+        with self._lock:
+            self.state["status"] = status
+            self._save_state()
+
+    def record_report(self, name: str, value):
+        """
+        Adds a section to the run report kept in state.json.
+        """
+        with self._lock:
+            self.state.setdefault("report", {})[name] = value
+            self._save_state()
+
+    # -- blobs ---------------------------------------------------------------
+
+    def put_blob(self, data: bytes) -> str:
+        digest = content_hash(data)
+        path = self.blob_dir / digest
+        if not path.exists():
+            atomic_write_bytes(path, data)
+        return digest
+
+    def put_blob_file(self, source: Path) -> str:
+        digest = content_hash(source.read_bytes())
+        path = self.blob_dir / digest
+        if not path.exists():
+            self.blob_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=self.blob_dir, suffix=".tmp")
+            os.close(fd)
+            shutil.copyfile(source, tmp_name)
+            os.replace(tmp_name, path)
+        return digest
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest
+
+    # -- spec versions -------------------------------------------------------
+
+    def save_spec(self, version: str, spec: WebsiteSpec):
+        record = {field: self.put_blob(getattr(spec, field).encode("utf-8")) for field in BLOB_FIELDS}
+        record["images"] = [image.model_dump() for image in spec.images]
+        atomic_write_bytes(self.spec_dir / f"{version}.json", json.dumps(record, indent=2).encode("utf-8"))
+
+    def load_spec(self, version: str) -> Optional[WebsiteSpec]:
+        """
+        Returns a saved spec version, or None if it was never completed
+        (or one of its blobs is missing).
+        """
+        try:
+            with open(self.spec_dir / f"{version}.json", "r", encoding="utf-8") as f:
+                record = json.load(f)
+            fields = {field: self.blob_path(record[field]).read_text(encoding="utf-8") for field in BLOB_FIELDS}
+        except (OSError, ValueError, KeyError):
+            return None
+        return WebsiteSpec(images=[ImageSpec(**image) for image in record["images"]], **fields)
+
+    # -- images --------------------------------------------------------------
+
+    def save_image(self, image_spec: ImageSpec, path: Path):
+        """
+        Stores a finished image, keyed by its filename and prompt.
+        """
+        digest = self.put_blob_file(path)
+        with self._lock:
+            self.state.setdefault("images", {})[image_spec.filename] = {"prompt": image_spec.prompt, "blob": digest}
+            self._save_state()
+
+    def can_restore(self, image_spec: ImageSpec) -> bool:
+        entry = self._restorable.get(image_spec.filename)
+        return bool(entry) and entry.get("prompt") == image_spec.prompt and self.blob_path(entry["blob"]).exists()
+
+    def restore_image(self, image_spec: ImageSpec, output_dir: Path) -> Optional[Path]:
+        """
+        Copies an image an earlier attempt stored for image_spec into output_dir,
+        if it was saved with the same prompt. Returns its path, or None.
+        """
+        if not self.can_restore(image_spec):
+            return None
+        blob = self.blob_path(self._restorable[image_spec.filename]["blob"])
+        dest = output_dir / Path(image_spec.filename).name
+        atomic_write_bytes(dest, blob.read_bytes())
+        return dest
@@ -0,0 +1,127 @@
+# webapp/services/completion_cache.py
+
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+DEFAULT_CACHE_DIR = Path(".cache/completions")
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60  # one week
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MiB
+
+
+class CompletionCacheMiss(Exception):
+    """
+    Raised in replay mode when a chat completion is not in the cache.
+    """
+
+
+def completion_cache_key(model: str, messages: List[Dict], response_format: Type[BaseModel]) -> str:
+    """
+    Returns a canonical hash of a structured chat completion request:
+    the model, the exact messages and the JSON schema of the response format.
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "response_format": response_format.model_json_schema(),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    On-disk record/replay cache for parsed chat completions.
+
+    Each entry is stored as <key>.json holding the parsed response as JSON.
+    Entries older than ttl_seconds are treated as misses, and once the
+    cache grows past max_bytes the least recently used entries are evicted.
+
+    Any object with the same get/put/replay interface can be passed to the
+    generators instead, e.g. an in-memory dict-backed cache in tests.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = DEFAULT_CACHE_DIR,
+        ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        replay: bool = False,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached response JSON for key, or None on a miss.
+        In replay mode expired entries are still served, since the point
+        of replay is to never go to the network.
+        """
+        path = self._entry_path(key)
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except FileNotFoundError:
+                return None
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable completion cache entry {path}: {e}")
+                path.unlink(missing_ok=True)
+                return None
+
+            expired = (
+                self.ttl_seconds is not None
+                and time.time() - entry["created"] > self.ttl_seconds
+            )
+            if expired and not self.replay:
+                path.unlink(missing_ok=True)
+                return None
+
+            # Bump the mtime so eviction sees this entry as recently used
+            os.utime(path)
+            return entry["response"]
+
+    def put(self, key: str, response_json: str, model: str = ""):
+        """
+        Stores the response JSON for key and evicts old entries if needed.
+        """
+        path = self._entry_path(key)
+        entry = {"created": time.time(), "model": model, "response": response_json}
+        with self._lock:
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+            self._evict(keep=path)
+
+    def _evict(self, keep: Path):
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*.json"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
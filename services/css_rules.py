@@ -0,0 +1,214 @@
+# webapp/services/css_rules.py
+
+import re
+from typing import List, Optional, Set
+
+_CLASS_RE = re.compile(r"\.(-?[_a-zA-Z][\w-]*)")
+_ID_RE = re.compile(r"#(-?[_a-zA-Z][\w-]*)")
+# Tag names at the start of a compound selector (after a combinator or at the start)
+_TAG_RE = re.compile(r"(?:^|[\s>+~(,])([a-zA-Z][a-zA-Z0-9-]*)")
+# At-rules whose block holds further style rules (unlike @keyframes or @font-face)
+NESTING_AT_RULES = ("@media", "@supports", "@layer", "@container", "@document")
+
+
+class CssRule:
+    """
+    One top-level block of a stylesheet: a style rule (`.hero h1 { ... }`)
+    or an at-rule (`@media (...) { ... }`, `@import ...;`).
+
+    source[start:end] is the block's full text. For at-rules with a block,
+    children holds the nested rules.
+    """
+
+    def __init__(self, prelude: str, body: Optional[str], start: int, end: int, text: str):
+        self.prelude = prelude
+        self.body = body
+        self.start = start
+        self.end = end
+        self.text = text
+        self.children: List["CssRule"] = []
+
+    @property
+    def is_at_rule(self) -> bool:
+        return self.prelude.startswith("@")
+
+    @property
+    def key(self) -> str:
+        """
+        The prelude with whitespace normalized, used to match a rule across
+        two versions of a stylesheet.
+        """
+        return " ".join(self.prelude.split())
+
+    def selectors(self) -> List[str]:
+        """
+        The comma-separated selectors of a style rule (empty for at-rules).
+        """
+        if self.is_at_rule:
+            return []
+        return [sel.strip() for sel in _split_top_level(self.prelude, ",") if sel.strip()]
+
+    def iter_style_rules(self):
+        """
+        Yields this rule if it is a style rule, or the style rules nested in it.
+        """
+        if not self.is_at_rule:
+            yield self
+        for child in self.children:
+            yield from child.iter_style_rules()
+
+
+def _split_top_level(text: str, separator: str) -> List[str]:
+    parts, depth, current, quote = [], 0, [], None
+    for char in text:
+        if quote:
+            current.append(char)
+            if char == quote:
+                quote = None
+            continue
+        if char in "\"'":
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+def _skip_comment_or_string(source: str, index: int) -> int:
+    """
+    If a comment or string starts at index, returns the index just past it; otherwise index.
+    """
+    if source.startswith("/*", index):
+        close = source.find("*/", index + 2)
+        return len(source) if close == -1 else close + 2
+    char = source[index]
+    if char in "\"'":
+        position = index + 1
+        while position < len(source):
+            if source[position] == "\\":
+                position += 2
+                continue
+            if source[position] == char:
+                return position + 1
+            position += 1
+        return len(source)
+    return index
+
+
+def _find_block_end(source: str, open_index: int) -> int:
+    """
+    Returns the index just past the `}` matching the `{` at open_index.
+    """
+    depth = 0
+    index = open_index
+    while index < len(source):
+        skipped = _skip_comment_or_string(source, index)
+        if skipped != index:
+            index = skipped
+            continue
+        if source[index] == "{":
+            depth += 1
+        elif source[index] == "}":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    return len(source)
+
+
+def parse_css(source: str, offset: int = 0) -> List[CssRule]:
+    """
+    Splits a stylesheet into its top-level rules, keeping exact source offsets.
+    Comments between rules are skipped; nested blocks of @media/@supports
+    are parsed into children.
+    """
+    rules = []
+    index = 0
+    while index < len(source):
+        # Skip whitespace and comments between rules
+        skipped = _skip_comment_or_string(source, index) if source.startswith("/*", index) else index
+        if skipped != index:
+            index = skipped
+            continue
+        if source[index].isspace():
+            index += 1
+            continue
+
+        start = index
+        # Scan the prelude up to `{` or `;` (for statements like @import)
+        while index < len(source):
+            skipped = _skip_comment_or_string(source, index)
+            if skipped != index:
+                index = skipped
+                continue
+            if source[index] in "{;}":
+                break
+            index += 1
+
+        if index >= len(source) or source[index] in ";}":
+            end = min(index + 1, len(source))
+            prelude = source[start:index].strip()
+            if prelude:
+                rules.append(CssRule(prelude, None, start + offset, end + offset, source[start:end]))
+            index = end
+            continue
+
+        end = _find_block_end(source, index)
+        prelude = source[start:index].strip()
+        body = source[index + 1:end - 1]
+        rule = CssRule(prelude, body, start + offset, end + offset, source[start:end])
+        if prelude.lower().startswith(NESTING_AT_RULES):
+            rule.children = parse_css(body, offset + index + 1)
+        rules.append(rule)
+        index = end
+    return rules
+
+
+def selector_names(selector: str):
+    """
+    Returns (classes, ids, tags) referenced by a selector or selector list.
+    Pseudo-classes, attribute selectors and strings are ignored.
+    """
+    cleaned = re.sub(r"\[[^\]]*\]", " ", selector)
+    cleaned = re.sub(r"::?[a-zA-Z-]+(\([^)]*\))?", " ", cleaned)
+    classes: Set[str] = set(_CLASS_RE.findall(cleaned))
+    ids: Set[str] = set(_ID_RE.findall(cleaned))
+    tags: Set[str] = {tag.lower() for tag in _TAG_RE.findall(cleaned)}
+    return classes, ids, tags
+
+
+_COMBINATOR_RE = re.compile(r"\s*[>+~]\s*|\s+")
+_PSEUDO_RE = re.compile(r"::?[\w-]+(\([^)]*\))?")
+
+
+def _compound_matches(compound: str, element) -> bool:
+    classes, ids, tags = selector_names(compound)
+    if tags and element.tag not in tags:
+        return False
+    if ids and element.id not in ids:
+        return False
+    return classes <= set(element.classes)
+
+
+def selector_matches(selector: str, element) -> bool:
+    """
+    Approximate matching of one selector against an html_dom Element: the
+    last compound must match the element and every earlier compound some
+    ancestor. Pseudo-classes and attribute selectors are ignored, so this
+    errs on the side of matching.
+    """
+    compounds = [part for part in _COMBINATOR_RE.split(_PSEUDO_RE.sub("", selector).strip()) if part]
+    if not compounds:
+        return True
+    if not _compound_matches(compounds[-1], element):
+        return False
+    ancestors = list(element.ancestors())
+    return all(any(_compound_matches(compound, ancestor) for ancestor in ancestors) for compound in compounds[:-1])
+
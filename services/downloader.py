@@ -0,0 +1,157 @@
+# webapp/services/downloader.py
+
+import os
+import time
+import base64
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from services.tracing import count, get_tracer
+
+if TYPE_CHECKING:
+    import requests
+
+CHUNK_SIZE = 64 * 1024
+# Base64 chunks must be a multiple of 4 characters to decode independently
+B64_CHUNK_CHARS = 4 * 16 * 1024
+DEFAULT_TIMEOUT = (10, 60)  # (connect, read) seconds
+DEFAULT_RETRIES = 3
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+# requests is imported on first download, so runs without network stages start faster
+_session: Optional["requests.Session"] = None
+_session_lock = threading.Lock()
+
+# Running totals of completed downloads, used to estimate what a skipped one would cost
+_stats_lock = threading.Lock()
+_download_stats = {"count": 0, "bytes": 0, "seconds": 0.0}
+
+
+class DownloadError(Exception):
+    """
+    Raised when a file could not be downloaded after all retries.
+    """
+
+
+def get_session(pool_size: int = 16) -> "requests.Session":
+    """
+    Returns the process-wide requests.Session, creating it on first use.
+    The session keeps TCP/TLS connections alive between downloads, and its
+    pool is large enough for the concurrent image workers.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def download_file(
+    url: str,
+    dest_path: Path,
+    timeout=DEFAULT_TIMEOUT,
+    retries: int = DEFAULT_RETRIES,
+    backoff: float = 1.0,
+) -> int:
+    """
+    Streams url to dest_path in fixed-size chunks and returns the number of bytes written.
+
+    The body goes to a temporary file next to dest_path, which is renamed over
+    dest_path only once complete, so a crash never leaves a truncated image.
+    5xx responses and dropped connections are retried with exponential backoff;
+    if part of the body was already received, the retry asks for the rest
+    with a Range request when the server supports it.
+    """
+    dest_path = Path(dest_path)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest_path.with_name(dest_path.name + ".part")
+    tmp_path.unlink(missing_ok=True)
+    import requests
+    session = get_session()
+    start = time.perf_counter()
+
+    attempt = 0
+    while True:
+        received = tmp_path.stat().st_size if tmp_path.exists() else 0
+        headers = {"Range": f"bytes={received}-"} if received else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code in RETRY_STATUS_CODES:
+                    raise requests.HTTPError(f"server error {response.status_code}", response=response)
+                if response.status_code == 416 and received:
+                    # Range not satisfiable: we already have the whole body
+                    break
+                if response.status_code not in (200, 206):
+                    tmp_path.unlink(missing_ok=True)
+                    raise DownloadError(f"Failed to download {url}: status code {response.status_code}")
+
+                # A 200 means the server ignored our Range header; start over
+                mode = "ab" if response.status_code == 206 else "wb"
+                with open(tmp_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+            break
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.HTTPError,
+            requests.exceptions.ChunkedEncodingError,
+        ) as e:
+            attempt += 1
+            if attempt > retries:
+                tmp_path.unlink(missing_ok=True)
+                raise DownloadError(f"Failed to download {url} after {retries} retries: {e}") from e
+            delay = backoff * (2 ** (attempt - 1))
+            print(f"Download of {url} failed ({e}); retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+    os.replace(tmp_path, dest_path)
+    num_bytes = dest_path.stat().st_size
+    end = time.perf_counter()
+    with _stats_lock:
+        _download_stats["count"] += 1
+        _download_stats["bytes"] += num_bytes
+        _download_stats["seconds"] += end - start
+    get_tracer().add_span("download", "io", start, end, {"file": dest_path.name, "bytes": num_bytes, "retries": attempt})
+    count("download.bytes", num_bytes)
+    return num_bytes
+
+
+def average_download_seconds() -> Optional[float]:
+    """
+    Returns the mean wall-clock time of the downloads completed so far in
+    this process, or None if nothing has been downloaded yet.
+    """
+    with _stats_lock:
+        if not _download_stats["count"]:
+            return None
+        return _download_stats["seconds"] / _download_stats["count"]
+
+
+def write_base64_file(data: str, dest_path: Path) -> int:
+    """
+    Decodes a base64 string into dest_path and returns the number of bytes written.
+
+    The string is decoded slice by slice, so only one small chunk of decoded
+    bytes exists at a time next to the encoded payload. Like download_file,
+    it writes to a temporary file and renames it into place when complete.
+    """
+    dest_path = Path(dest_path)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest_path.with_name(dest_path.name + ".part")
+    try:
+        with open(tmp_path, "wb") as f:
+            for offset in range(0, len(data), B64_CHUNK_CHARS):
+                f.write(base64.b64decode(data[offset:offset + B64_CHUNK_CHARS], validate=True))
+    except (ValueError, OSError):
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, dest_path)
+    return dest_path.stat().st_size
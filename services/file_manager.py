@@ -1,20 +1,207 @@
 # webapp/services/file_manager.py
 
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+import posixpath
 from pathlib import Path
+from typing import Dict, List, Optional
 from generators.website_generator import WebsiteSpec
+from services.html_dom import parse_html
+from services.tracing import count
 
-def write_website_files(website_spec: WebsiteSpec, output_dir: Path):
+# brotli is optional: without it only .gz siblings are written
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# WebsiteSpec field -> file it is written to
+WEBSITE_FILES = {"html": "index.html", "css": "styles.css", "js": "main.js"}
+MANIFEST_FILENAME = ".manifest.json"
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """
+    Writes data to a temporary file next to path and renames it into place,
+    so readers never see a partially written file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        mode = path.stat().st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644  # mkstemp creates 0600 files, which a web server could not read
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+def gzip_bytes(data: bytes) -> bytes:
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def brotli_bytes(data: bytes) -> Optional[bytes]:
+    if brotli is None:
+        return None
+    return brotli.compress(data, quality=11)
+
+def precompressed_variants(filename: str, data: bytes) -> Dict[str, bytes]:
+    """
+    Returns the .gz (and, with brotli installed, .br) siblings of a file,
+    for static servers that send precompressed files as they are.
+    """
+    variants = {filename + ".gz": gzip_bytes(data)}
+    compressed = brotli_bytes(data)
+    if compressed is not None:
+        variants[filename + ".br"] = compressed
+    return variants
+
+def write_website_file(output_dir: Path, field: str, content: str) -> Path:
+    """
+    Writes a single WebsiteSpec field ("html", "css" or "js") to its file in output_dir.
+    Used to write drafts while a spec is still being generated. The draft is
+    recorded in the manifest, so the final write_website_files either keeps
+    it (same content) or replaces or removes it (e.g. styles.css once
+    hashed asset names are used).
+    """
+    path = output_dir / WEBSITE_FILES[field]
+    data = content.encode("utf-8")
+    atomic_write_bytes(path, data)
+    manifest = load_manifest(output_dir)
+    manifest[path.name] = _manifest_entry(path, content_hash(data))
+    _save_manifest(output_dir, manifest)
+    return path
+
+def load_manifest(output_dir: Path) -> Dict[str, Dict]:
+    """
+    Returns the manifest of the last write: filename -> {"sha256", "size", "mtime_ns"}.
+    """
+    manifest_path = output_dir / MANIFEST_FILENAME
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+def _manifest_entry(path: Path, digest: str) -> Dict:
+    stat = path.stat()
+    return {"sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def _save_manifest(output_dir: Path, files: Dict[str, Dict]):
+    manifest_data = json.dumps({"files": files}, indent=2, sort_keys=True)
+    atomic_write_bytes(output_dir / MANIFEST_FILENAME, manifest_data.encode("utf-8"))
+
+def _unchanged_on_disk(path: Path, digest: str, entry: Dict) -> bool:
+    """
+    True if path already holds content with this digest. Size and mtime are
+    compared with the manifest first, so unchanged files are not re-read; a file
+    touched since the last write is hashed again.
+    """
+    if not entry or entry.get("sha256") != digest:
+        return False
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    if stat.st_size == entry.get("size") and stat.st_mtime_ns == entry.get("mtime_ns"):
+        return True
+    return content_hash(path.read_bytes()) == digest
+
+def site_relative(reference: str) -> str:
+    """
+    Normalizes a reference from index.html to a file of the site ("./styles.css"
+    becomes "styles.css"). References outside the site directory, such as
+    "../styles.css" or "/styles.css", keep their leading "../" or "/".
+    """
+    return posixpath.normpath(reference)
+
+def _hashed_name(filename: str, digest: str) -> str:
+    stem, suffix = os.path.splitext(filename)
+    return f"{stem}.{digest[:6]}{suffix}"
+
+def _link_hashed_assets(html: str, renames: Dict[str, str]) -> str:
+    """
+    Points the stylesheet links and script tags of the page at the renamed assets.
+    """
+    document = parse_html(html)
+    for element in document.find_all("link", "script"):
+        attribute = "href" if element.tag == "link" else "src"
+        value = element.get(attribute)
+        if value is None:
+            continue
+        target = site_relative(value)
+        if target in renames:
+            document.set_attribute(element, attribute, renames[target])
+    return document.to_html()
+
+def write_website_files(
+    website_spec: WebsiteSpec,
+    output_dir: Path,
+    hashed_assets: bool = False,
+    precompress: bool = False,
+) -> List[Path]:
     """
     Writes the website code to index.html, styles.css, and main.js in output_dir.
+
+    A manifest of content hashes is kept in output_dir, and files whose content
+    did not change are left untouched (same mtime), so caches and file watchers
+    only see real changes. Changed files are written atomically.
+
+    With hashed_assets, the CSS and JS are written as e.g. styles.3fa9c1.css
+    and main.5b2e07.js and index.html is updated to reference them, so those
+    files can be served with long-lived immutable cache headers.
+    With precompress, each file also gets .gz and .br siblings (see
+    precompressed_variants), tracked in the manifest like the files themselves.
+    Returns the paths that were (re)written.
     """
     output_dir.mkdir(parents=True, exist_ok=True)
+    old_manifest = load_manifest(output_dir)
+
+    contents: Dict[str, bytes] = {
+        WEBSITE_FILES[field]: getattr(website_spec, field).encode("utf-8")
+        for field in ("css", "js")
+    }
+    html = website_spec.html
+    if hashed_assets:
+        renames = {
+            filename: _hashed_name(filename, content_hash(data))
+            for filename, data in contents.items()
+        }
+        contents = {renames[filename]: data for filename, data in contents.items()}
+        html = _link_hashed_assets(html, renames)
+    contents[WEBSITE_FILES["html"]] = html.encode("utf-8")
+    if precompress:
+        for filename, data in list(contents.items()):
+            contents.update(precompressed_variants(filename, data))
+
+    new_manifest: Dict[str, Dict] = {}
+    written: List[Path] = []
+    for filename, data in contents.items():
+        path = output_dir / filename
+        digest = content_hash(data)
+        if not _unchanged_on_disk(path, digest, old_manifest.get(filename)):
+            atomic_write_bytes(path, data)
+            written.append(path)
+            count("disk.bytes_written", len(data))
+        new_manifest[filename] = _manifest_entry(path, digest)
 
-    html_path = output_dir / "index.html"
-    css_path = output_dir / "styles.css"
-    js_path = output_dir / "main.js"
+    # Remove assets from the previous write that nothing references any more
+    # (e.g. an older styles.<hash>.css, or styles.css after switching to hashed names)
+    for filename in old_manifest:
+        if filename not in new_manifest:
+            (output_dir / filename).unlink(missing_ok=True)
 
-    html_path.write_text(website_spec.html, encoding="utf-8")
-    css_path.write_text(website_spec.css, encoding="utf-8")
-    js_path.write_text(website_spec.js, encoding="utf-8")
+    _save_manifest(output_dir, new_manifest)
 
-    print(f"Website files written to: {output_dir.resolve()}")
+    unchanged = len(contents) - len(written)
+    print(f"Website files written to: {output_dir.resolve()} ({len(written)} changed, {unchanged} unchanged)")
+    return written
@@ -0,0 +1,214 @@
+# webapp/services/html_dom.py
+
+import html
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+
+class Element:
+    """
+    One element of a parsed HTML document.
+
+    start/end are offsets into the original source: source[start:end] is the
+    element's full markup, and source[start:start_tag_end] its opening tag.
+    """
+
+    def __init__(self, tag: str, attrs: List[Tuple[str, Optional[str]]], start: int, start_tag_end: int,
+                 self_closing: bool = False, parent: Optional["Element"] = None):
+        self.tag = tag
+        self.attrs: Dict[str, Optional[str]] = dict(attrs)
+        self.start = start
+        self.start_tag_end = start_tag_end
+        self.end = start_tag_end
+        self.end_tag_start = start_tag_end
+        self.self_closing = self_closing
+        self.parent = parent
+        self.children: List["Element"] = []
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.attrs.get(name, default)
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.attrs.get("id")
+
+    @property
+    def classes(self) -> List[str]:
+        return (self.attrs.get("class") or "").split()
+
+    def iter(self) -> Iterator["Element"]:
+        """
+        Yields this element and all its descendants in document order.
+        """
+        yield self
+        for child in self.children:
+            yield from child.iter()
+
+    def find_all(self, *tags: str) -> List["Element"]:
+        return [el for el in self.iter() if el is not self and el.tag in tags]
+
+    def find(self, *tags: str) -> Optional["Element"]:
+        for el in self.iter():
+            if el is not self and el.tag in tags:
+                return el
+        return None
+
+    def ancestors(self) -> Iterator["Element"]:
+        parent = self.parent
+        while parent is not None:
+            yield parent
+            parent = parent.parent
+
+    def start_tag_html(self) -> str:
+        """
+        Renders the opening tag from the current attributes.
+        """
+        parts = [self.tag]
+        for name, value in self.attrs.items():
+            if value is None:
+                parts.append(name)
+            else:
+                parts.append(f'{name}="{html.escape(value, quote=True)}"')
+        closing = " />" if self.self_closing else ">"
+        return "<" + " ".join(parts) + closing
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self, source: str, root: Element):
+        super().__init__(convert_charrefs=True)
+        self.source = source
+        self.stack = [root]
+        self.line_starts = [0]
+        for index, char in enumerate(source):
+            if char == "\n":
+                self.line_starts.append(index + 1)
+
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self.line_starts[line - 1] + column
+
+    def _open(self, tag, attrs, self_closing):
+        start = self._offset()
+        tag_text = self.get_starttag_text() or ""
+        element = Element(tag, attrs, start, start + len(tag_text), self_closing, parent=self.stack[-1])
+        self.stack[-1].children.append(element)
+        return element
+
+    def handle_starttag(self, tag, attrs):
+        element = self._open(tag, attrs, self_closing=False)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self._open(tag, attrs, self_closing=True)
+
+    def handle_endtag(self, tag):
+        # Ignore stray closing tags; otherwise close everything up to the match
+        if not any(el.tag == tag for el in self.stack[1:]):
+            return
+        start = self._offset()
+        close = self.source.find(">", start)
+        end = len(self.source) if close == -1 else close + 1
+        while True:
+            element = self.stack.pop()
+            if element.tag == tag:
+                element.end_tag_start = start
+                element.end = end
+                break
+            # Implicitly closed (e.g. an unclosed <p>): ends where its parent ends
+            element.end_tag_start = element.end = start
+
+    def close(self):
+        super().close()
+        while len(self.stack) > 1:
+            element = self.stack.pop()
+            element.end_tag_start = element.end = len(self.source)
+
+
+class HtmlDocument:
+    """
+    A parsed HTML document that can be edited without disturbing the parts
+    that are not touched: attribute changes and insertions are recorded as
+    edits against the original source, and to_html() applies them, keeping
+    every other byte (formatting, comments, whitespace) as it was.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.root = Element("#document", [], 0, 0)
+        builder = _TreeBuilder(source, self.root)
+        builder.feed(source)
+        builder.close()
+        self.root.end = len(source)
+        self._dirty: List[Element] = []
+        self._edits: List[Tuple[int, int, int, str]] = []  # (start, end, sequence, text)
+
+    def find_all(self, *tags: str) -> List[Element]:
+        return self.root.find_all(*tags)
+
+    def find(self, *tags: str) -> Optional[Element]:
+        return self.root.find(*tags)
+
+    def outer_html(self, element: Element) -> str:
+        return self.source[element.start:element.end]
+
+    def inner_html(self, element: Element) -> str:
+        return self.source[element.start_tag_end:element.end_tag_start]
+
+    def set_attribute(self, element: Element, name: str, value: Optional[str] = ""):
+        """
+        Sets (or adds) an attribute; None renders it as a bare boolean attribute.
+        """
+        element.attrs[name] = value
+        if element not in self._dirty:
+            self._dirty.append(element)
+
+    def _add_edit(self, start: int, end: int, text: str):
+        self._edits.append((start, end, len(self._edits), text))
+
+    def replace(self, element: Element, markup: str):
+        """
+        Replaces the element's whole markup (including any pending attribute changes).
+        """
+        if element in self._dirty:
+            self._dirty.remove(element)
+        self._add_edit(element.start, element.end, markup)
+
+    def insert_before(self, element: Element, markup: str):
+        self._add_edit(element.start, element.start, markup)
+
+    def insert_after(self, element: Element, markup: str):
+        self._add_edit(element.end, element.end, markup)
+
+    def append_child(self, element: Element, markup: str):
+        """
+        Inserts markup just before the element's closing tag.
+        """
+        self._add_edit(element.end_tag_start, element.end_tag_start, markup)
+
+    def to_html(self) -> str:
+        edits = list(self._edits)
+        for element in self._dirty:
+            edits.append((element.start, element.start_tag_end, len(edits), element.start_tag_html()))
+        edits.sort(key=lambda edit: (edit[0], edit[1], edit[2]))
+
+        pieces = []
+        cursor = 0
+        for start, end, _, text in edits:
+            if start < cursor:
+                raise ValueError(f"Overlapping HTML edits at offset {start}.")
+            pieces.append(self.source[cursor:start])
+            pieces.append(text)
+            cursor = end
+        pieces.append(self.source[cursor:])
+        return "".join(pieces)
+
+
+def parse_html(source: str) -> HtmlDocument:
+    return HtmlDocument(source)
@@ -0,0 +1,169 @@
+# webapp/services/image_cache.py
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+INDEX_FILENAME = "index.json"
+DEFAULT_CACHE_DIR = Path(".cache/images")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+# Last-use times updated by cache hits are written at most this often;
+# flush() writes the rest
+SAVE_INTERVAL = 5.0
+
+
+def image_cache_key(model: str, prompt: str, size: str, quality: str) -> str:
+    """
+    Returns a stable hash for one image generation request.
+    Two requests with the same key would produce an equivalent image,
+    so the second one can be served from disk.
+    """
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "size": size, "quality": quality},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """
+    Content-addressed on-disk cache for generated images.
+
+    Entries live in cache_dir as <key><suffix>, and index.json records
+    their size and last use time. When the total size goes over max_bytes,
+    the least recently used entries are evicted. Last use times from cache
+    hits are saved in batches; flush() saves the rest.
+    Safe to share between the threads of the image generation pool.
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.index_path = self.cache_dir / INDEX_FILENAME
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._index: Dict[str, Dict] = self._load_index()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _load_index(self) -> Dict[str, Dict]:
+        if not self.index_path.exists():
+            return {}
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable image cache index {self.index_path}: {e}")
+            return {}
+        # Drop entries whose file was removed behind our back
+        return {
+            key: entry for key, entry in index.items()
+            if (self.cache_dir / entry["file"]).exists()
+        }
+
+    def _save_index(self):
+        tmp_path = self.index_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _evict(self, keep: str):
+        total = sum(entry["size"] for entry in self._index.values())
+        by_age = sorted(self._index.items(), key=lambda item: item[1]["last_used"])
+        for key, entry in by_age:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            (self.cache_dir / entry["file"]).unlink(missing_ok=True)
+            del self._index[key]
+            total -= entry["size"]
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+        Returns the cached file for key (marking it as recently used), or None.
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            path = self.cache_dir / entry["file"]
+            if not path.exists():
+                del self._index[key]
+                self._save_index()
+                return None
+            entry["last_used"] = time.time()
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= SAVE_INTERVAL:
+                self._save_index()
+            return path
+
+    def put(self, key: str, source_path: Path) -> Optional[Path]:
+        """
+        Copies source_path into the cache under key and evicts old entries
+        if the byte budget is exceeded. Returns the cached path, or None if
+        the file alone is larger than the whole budget.
+        """
+        source_path = Path(source_path)
+        size = source_path.stat().st_size
+        if size > self.max_bytes:
+            return None
+
+        cached_path = self.cache_dir / f"{key}{source_path.suffix}"
+        # A unique temp file, as two workers may put the same key at once
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, prefix=f"{key}.", suffix=".tmp")
+        os.close(fd)
+        try:
+            # copy() rather than copyfile(): mkstemp creates the file private
+            shutil.copy(source_path, tmp_name)
+            os.replace(tmp_name, cached_path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            self._index[key] = {
+                "file": cached_path.name,
+                "size": size,
+                "last_used": time.time(),
+            }
+            self._evict(keep=key)
+            self._save_index()
+        return cached_path
+
+    def flush(self):
+        """
+        Writes last-use times not yet saved to the index.
+        """
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def link_into(self, key: str, dest_path: Path) -> Optional[Path]:
+        """
+        Places the cached image for key at dest_path, using a hard link when
+        possible and a copy otherwise. Returns dest_path, or None on a miss.
+        """
+        cached_path = self.get(key)
+        if cached_path is None:
+            return None
+
+        dest_path = Path(dest_path)
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        # Never write through an existing file: it may itself be a hard link
+        # to another cache entry.
+        dest_path.unlink(missing_ok=True)
+        try:
+            os.link(cached_path, dest_path)
+        except OSError:
+            shutil.copyfile(cached_path, dest_path)
+        return dest_path
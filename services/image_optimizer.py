@@ -0,0 +1,227 @@
+# webapp/services/image_optimizer.py
+
+import os
+import asyncio
+import multiprocessing
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from pydantic import BaseModel
+
+# Pillow is optional: without it images are left as generated
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+try:
+    import pillow_avif  # noqa: F401  (registers the AVIF plugin on older Pillow)
+except ImportError:
+    pass
+
+DEFAULT_WIDTHS = (480, 960, 1600)
+# Encoder settings per output format (quality is the usual 0-100 scale)
+FORMATS = {
+    "avif": {"quality": 50},
+    "webp": {"quality": 80, "method": 6},
+}
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+
+class ImageVariant(BaseModel):
+    format: str
+    width: int
+    path: str
+    bytes: int
+
+
+class OptimizedImage(BaseModel):
+    """
+    The responsive variants written for one generated image.
+    """
+    filename: str
+    source_path: str
+    width: int
+    height: int
+    original_bytes: int
+    variants: List[ImageVariant]
+
+    def by_format(self, fmt: str) -> List[ImageVariant]:
+        return sorted((v for v in self.variants if v.format == fmt), key=lambda v: v.width)
+
+    def largest_bytes(self, fmt: str) -> Optional[int]:
+        variants = self.by_format(fmt)
+        return variants[-1].bytes if variants else None
+
+    def best_format(self) -> str:
+        """
+        The format whose full-width variant is smallest.
+        """
+        return min(
+            (fmt for fmt in FORMATS if self.largest_bytes(fmt) is not None),
+            key=lambda fmt: self.largest_bytes(fmt),
+        )
+
+
+def pillow_available() -> bool:
+    return Image is not None
+
+
+def available_formats() -> List[str]:
+    """
+    The output formats this Pillow build can encode, best first.
+    """
+    if Image is None:
+        return []
+    Image.init()
+    formats = []
+    if "AVIF" in Image.SAVE:
+        formats.append("avif")
+    if features.check("webp"):
+        formats.append("webp")
+    return formats
+
+
+def _target_widths(original_width: int, widths: Sequence[int]) -> List[int]:
+    # Never upscale: widths above the original collapse into the original width
+    targets = {width for width in widths if width < original_width}
+    targets.add(min(original_width, max(widths, default=original_width)))
+    return sorted(targets)
+
+
+def optimize_image_file(source_path: str, output_dir: str, widths: Sequence[int], formats: Sequence[str]) -> Dict:
+    """
+    Writes <stem>-<width>.<format> variants of one image into output_dir.
+    Metadata (EXIF, ICC profiles, text chunks) is dropped. Runs in a worker
+    process, so it takes and returns plain values.
+    """
+    source = Path(source_path)
+    with Image.open(source) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    # A fresh image without .info, so nothing from the source is carried over
+    image = image.copy()
+    image.info = {}
+
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    variants = []
+    for width in _target_widths(image.width, widths):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            dest = output / f"{source.stem}-{width}.{fmt}"
+            tmp = dest.with_name(dest.name + ".tmp")
+            resized.save(tmp, format=fmt.upper(), **FORMATS[fmt])
+            os.replace(tmp, dest)
+            variants.append({"format": fmt, "width": width, "path": dest.as_posix(), "bytes": dest.stat().st_size})
+
+    return {
+        "source_path": source.as_posix(),
+        "width": image.width,
+        "height": image.height,
+        "original_bytes": source.stat().st_size,
+        "variants": variants,
+    }
+
+
+class ImageOptimizer:
+    """
+    Transcodes generated images into resized WebP (and AVIF, when Pillow
+    supports it) variants on a pool of worker processes, since resizing and
+    encoding are CPU-bound. Workers are spawned rather than forked, because
+    the parent already runs API and download threads.
+
+    An image whose file has not changed since it was last optimized (same
+    path, inode, size and mtime) and whose variants still exist is not
+    transcoded again, so repeated runs in one process (--watch) only
+    optimize new or regenerated images.
+    """
+
+    def __init__(self, widths: Sequence[int] = DEFAULT_WIDTHS, workers: Optional[int] = None):
+        self.widths = tuple(widths)
+        self.formats = available_formats()
+        self._done: Dict[Tuple, Dict] = {}
+        self._executor = None
+        if self.formats:
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers or os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self._executor is not None
+
+    async def optimize_async(self, image_paths: Dict[str, str]) -> Tuple[Dict[str, OptimizedImage], Dict[str, str]]:
+        """
+        Optimizes every image in image_paths (filename -> local path); the
+        variants are written next to each image. Returns (optimized, failures).
+        """
+        if not self.enabled or not image_paths:
+            return {}, {}
+        loop = asyncio.get_running_loop()
+        filenames = list(image_paths)
+        keys = {filename: self._source_key(image_paths[filename]) for filename in filenames}
+
+        async def optimize(filename: str) -> Dict:
+            previous = self._done.get(keys[filename])
+            if previous is not None and all(Path(variant["path"]).exists() for variant in previous["variants"]):
+                return previous
+            return await loop.run_in_executor(
+                self._executor,
+                optimize_image_file,
+                image_paths[filename],
+                Path(image_paths[filename]).parent.as_posix(),
+                self.widths,
+                self.formats,
+            )
+
+        results = await asyncio.gather(*(optimize(filename) for filename in filenames), return_exceptions=True)
+        optimized: Dict[str, OptimizedImage] = {}
+        failures: Dict[str, str] = {}
+        for filename, result in zip(filenames, results):
+            if isinstance(result, BaseException):
+                failures[filename] = f"{type(result).__name__}: {result}"
+                print(f"Could not optimize image '{filename}': {failures[filename]}")
+            else:
+                if keys[filename] is not None:
+                    self._done[keys[filename]] = result
+                optimized[filename] = OptimizedImage(filename=filename, **result)
+        return optimized, failures
+
+    def _source_key(self, path: str) -> Optional[Tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (Path(path).resolve().as_posix(), stat.st_ino, stat.st_size, stat.st_mtime_ns, self.widths, tuple(self.formats))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+def print_savings(optimized: Dict[str, OptimizedImage]):
+    """
+    Prints, per image, the original size against the largest variant of each format.
+    """
+    if not optimized:
+        return
+    print("\nImage optimization:")
+    total_before = total_after = 0
+    for filename, image in optimized.items():
+        best_format = image.best_format()
+        after = image.largest_bytes(best_format)
+        total_before += image.original_bytes
+        total_after += after
+        saved = 100 * (1 - after / image.original_bytes) if image.original_bytes else 0
+        widths = ", ".join(str(v.width) for v in image.by_format(best_format))
+        print(
+            f"  {filename:<28} {image.original_bytes:>10,} B -> {after:>9,} B {best_format} "
+            f"({saved:.0f}% smaller; widths {widths})"
+        )
+    if total_before:
+        print(f"  {'total':<28} {total_before:>10,} B -> {total_after:>9,} B ({100 * (1 - total_after / total_before):.0f}% smaller)")
@@ -0,0 +1,60 @@
+# webapp/services/image_size.py
+
+import struct
+from pathlib import Path
+from typing import Optional, Tuple
+
+# Enough of the file for the dimensions of PNG, GIF and WebP; JPEG is scanned further
+_HEADER_BYTES = 64
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        while marker[1] == 0xFF:  # fill bytes
+            marker = marker[1:] + f.read(1)
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker[1] in _JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+        f.seek(length - 2, 1)
+
+
+def read_image_size(path: Path) -> Optional[Tuple[int, int]]:
+    """
+    Returns (width, height) of a PNG, JPEG, GIF or WebP file by reading its
+    header, or None if the file is missing or in another format.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_HEADER_BYTES)
+            if header.startswith(b"\x89PNG\r\n\x1a\n") and header[12:16] == b"IHDR":
+                return struct.unpack(">II", header[16:24])
+            if header[:6] in (b"GIF87a", b"GIF89a"):
+                return struct.unpack("<HH", header[6:10])
+            if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+                chunk = header[12:16]
+                if chunk == b"VP8 ":
+                    width, height = struct.unpack("<HH", header[26:30])
+                    return width & 0x3FFF, height & 0x3FFF
+                if chunk == b"VP8L":
+                    bits = int.from_bytes(header[21:25], "little")
+                    return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+                if chunk == b"VP8X":
+                    return int.from_bytes(header[24:27], "little") + 1, int.from_bytes(header[27:30], "little") + 1
+                return None
+            if header[:2] == b"\xff\xd8":
+                return _jpeg_size(f)
+    except (OSError, struct.error):
+        return None
+    return None
@@ -0,0 +1,354 @@
+# webapp/services/job_server.py
+
+import json
+import time
+import signal
+import asyncio
+import threading
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from pydantic import ValidationError
+
+from services.batch_runner import BatchJob, BatchScheduler
+from services.checkpoint import new_run_id
+from services.job_queue import JOB_STATUSES, JobQueue
+
+JOB_KINDS = ("generate", "refine")
+# Payload fields passed through to BatchJob
+_JOB_FIELDS = ("details", "output_dir", "model", "spec_model", "refine_model", "iterations", "improvement", "refine_mode")
+
+
+class JobRequestError(Exception):
+    """
+    Raised for a job request the service cannot accept (answered with 400).
+    """
+
+
+class JobService:
+    """
+    Runs generation and refinement jobs from a JobQueue on a BatchScheduler,
+    up to `workers` at a time, in one long-lived process: the OpenAI client,
+    HTTP connections, caches and the image pool stay warm between jobs.
+
+    Files live under serve_dir: queue.db (the queue), specs/<job id>.json
+    (the final spec of every job, which refine jobs can start from),
+    specs/<job id>.input.json (the inline spec a refine job was submitted
+    with) and sites/<job id>/ (the default output directory of a job).
+    """
+
+    def __init__(self, scheduler: BatchScheduler, serve_dir: Path, workers: int = 2):
+        self.scheduler = scheduler
+        self.serve_dir = Path(serve_dir)
+        self.workers = max(1, workers)
+        self.queue = JobQueue(self.serve_dir / "queue.db")
+        self.draining = False
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        scheduler.on_progress = self.queue.set_step
+
+    def spec_path(self, job_id: str) -> Path:
+        return self.serve_dir / "specs" / f"{job_id}.json"
+
+    def submit(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validates a job request and queues it. Called from HTTP threads.
+        """
+        if self.draining:
+            raise JobRequestError("the service is shutting down and accepts no new jobs")
+        kind = payload.get("kind", "generate")
+        if kind not in JOB_KINDS:
+            raise JobRequestError(f"'kind' must be one of {', '.join(JOB_KINDS)}")
+        unknown = set(payload) - set(_JOB_FIELDS) - {"kind", "from_job", "spec", "spec_file"}
+        if unknown:
+            raise JobRequestError(f"unknown field(s): {', '.join(sorted(unknown))}")
+
+        if kind == "generate":
+            if not payload.get("details"):
+                raise JobRequestError("a generate job needs 'details'")
+        else:
+            sources = [name for name in ("from_job", "spec", "spec_file") if payload.get(name)]
+            if len(sources) != 1:
+                raise JobRequestError("a refine job needs exactly one of 'from_job', 'spec' or 'spec_file'")
+            if not payload.get("improvement"):
+                raise JobRequestError("a refine job needs 'improvement'")
+            if payload.get("from_job"):
+                source = self.queue.get(payload["from_job"])
+                if source is None or source["status"] != "done" or not self.spec_path(source["id"]).exists():
+                    raise JobRequestError(f"job {payload['from_job']} has not finished successfully")
+            elif payload.get("spec_file") and not Path(payload["spec_file"]).exists():
+                raise JobRequestError(f"spec file {payload['spec_file']} does not exist")
+        try:
+            # Checks the field types now rather than when the job runs
+            BatchJob(**{name: payload[name] for name in _JOB_FIELDS if payload.get(name) is not None}, output_dir=".")
+        except ValidationError as e:
+            raise JobRequestError(str(e))
+
+        job_id = new_run_id()
+        if payload.get("spec"):
+            # Inline specs are stored next to the results, so the queue row stays
+            # small; the file is written before the job can be claimed
+            input_path = self.serve_dir / "specs" / f"{job_id}.input.json"
+            input_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(input_path, "w", encoding="utf-8") as f:
+                json.dump(payload["spec"], f)
+            payload = {name: value for name, value in payload.items() if name != "spec"}
+            payload["spec_file"] = input_path.as_posix()
+        job = self.queue.enqueue(kind, payload, job_id)
+        self._notify()
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancels a queued job, or stops a running one. Called from HTTP threads.
+
+        A running job's pipeline task is cancelled: stages that have not
+        started are skipped and its images still waiting in the image pool are
+        dropped. A stage already running in a thread (e.g. an API call) cannot
+        be interrupted; it finishes in the background and its result is discarded.
+        """
+        job = self.queue.request_cancel(job_id)
+        if job is not None and job["status"] == "running" and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._cancel_local, job_id)
+        return job
+
+    def progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.queue.get(job_id)
+        if job is None:
+            return None
+        progress = {"id": job["id"], "status": job["status"], "step": job["step"], "attempts": job["attempts"]}
+        if job["status"] == "queued":
+            progress["position"] = sum(
+                1 for other in self.queue.list("queued", limit=10_000)
+                if (other["created_at"], other["id"]) < (job["created_at"], job["id"])
+            ) + 1
+        if job["started_at"]:
+            progress["elapsed_s"] = round((job["finished_at"] or time.time()) - job["started_at"], 1)
+        return progress
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "draining": self.draining,
+            "workers": self.workers,
+            "running": sorted(self._running),
+            "jobs": self.queue.counts(),
+        }
+
+    def _notify(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _cancel_local(self, job_id: str):
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+
+    def _batch_job(self, job: Dict[str, Any]) -> BatchJob:
+        payload = job["payload"]
+        fields = {name: payload[name] for name in _JOB_FIELDS if payload.get(name) is not None}
+        fields.setdefault("output_dir", self.serve_dir / "sites" / job["id"])
+        if job["kind"] == "refine":
+            fields.setdefault("iterations", 2)
+            if payload.get("from_job"):
+                fields["spec_file"] = self.spec_path(payload["from_job"])
+                # Refine the earlier job's site in place unless told otherwise
+                source = self.queue.get(payload["from_job"])
+                if payload.get("output_dir") is None and source is not None and source["result"]:
+                    fields["output_dir"] = source["result"]["output_dir"]
+            else:
+                fields["spec_file"] = payload["spec_file"]
+        return BatchJob(id=job["id"], output_spec=self.spec_path(job["id"]), **fields)
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        try:
+            record = await self.scheduler.run_job(self._batch_job(job))
+        except asyncio.CancelledError:
+            if job_id in self._cancelled:
+                self.queue.finish(job_id, "cancelled")
+                print(f"Job {job_id} cancelled.")
+            else:
+                # Stopped by shutdown: run it again after the restart
+                self.queue.requeue(job_id)
+                print(f"Job {job_id} interrupted by shutdown; it is queued again.")
+            return
+        except Exception as e:
+            self.queue.finish(job_id, "failed", error=f"{type(e).__name__}: {e}")
+            print(f"Job {job_id} failed: {e}")
+            return
+        finally:
+            self._running.pop(job_id, None)
+            self._cancelled.discard(job_id)
+            self._notify()
+        status = "done" if record["status"] == "ok" else "failed"
+        self.queue.finish(job_id, status, result=record, error=record.get("error"))
+        print(f"Job {job_id} {status} in {record['timings'].get('total', 0):.1f}s.")
+
+    async def run_workers(self, stop: asyncio.Event, drain_timeout: float):
+        """
+        Starts queued jobs while fewer than `workers` are running, until stop
+        is set. Then waits up to drain_timeout seconds for the running jobs;
+        jobs still running after that are stopped and queued again.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"Requeued {recovered} job(s) left running by the previous service.")
+
+        while not stop.is_set():
+            while len(self._running) < self.workers:
+                job = self.queue.claim_next()
+                if job is None:
+                    break
+                print(f"Job {job['id']} started ({job['kind']}).")
+                self._running[job["id"]] = asyncio.create_task(self._run(job))
+            # Cancellations flagged by another process sharing the queue
+            for job_id in self.queue.cancel_requested():
+                self._cancel_local(job_id)
+            self._wakeup.clear()
+            stop_wait = asyncio.ensure_future(stop.wait())
+            try:
+                await asyncio.wait([stop_wait, asyncio.ensure_future(self._wakeup.wait())], timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                stop_wait.cancel()
+
+        self.draining = True
+        running = list(self._running.values())
+        if running:
+            print(f"Draining: waiting up to {drain_timeout:.0f}s for {len(running)} running job(s)...")
+            _, pending = await asyncio.wait(running, timeout=drain_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+
+def _make_handler(service: JobService):
+    class JobRequestHandler(BaseHTTPRequestHandler):
+        """
+        POST /jobs                 queue a job ({"kind": "generate", "details": ...}
+                                   or {"kind": "refine", "from_job": ..., "improvement": ...})
+        GET  /jobs[?status=...]    list jobs, newest first
+        GET  /jobs/<id>            a job with its payload and result
+        GET  /jobs/<id>/progress   status, current step, queue position
+        POST /jobs/<id>/cancel     cancel a queued or running job (also DELETE /jobs/<id>)
+        GET  /health               queue counts and running jobs
+        """
+
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, payload: Any):
+            body = json.dumps(payload, indent=2).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _route(self) -> Tuple[str, ...]:
+            return tuple(part for part in urlparse(self.path).path.split("/") if part)
+
+        def do_GET(self):
+            route = self._route()
+            if route == ("health",):
+                self._send(200, service.health())
+            elif route == ("jobs",):
+                query = parse_qs(urlparse(self.path).query)
+                status = (query.get("status") or [None])[0]
+                if status is not None and status not in JOB_STATUSES:
+                    self._send(400, {"error": f"status must be one of {', '.join(JOB_STATUSES)}"})
+                    return
+                try:
+                    limit = int((query.get("limit") or ["100"])[0])
+                except ValueError:
+                    limit = 0
+                if limit < 1:
+                    self._send(400, {"error": "limit must be a positive integer"})
+                    return
+                self._send(200, {"jobs": service.queue.list(status, limit)})
+            elif len(route) == 2 and route[0] == "jobs":
+                job = service.queue.get(route[1])
+                self._send(200, job) if job else self._send(404, {"error": "no such job"})
+            elif len(route) == 3 and route[0] == "jobs" and route[2] == "progress":
+                progress = service.progress(route[1])
+                self._send(200, progress) if progress else self._send(404, {"error": "no such job"})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            route = self._route()
+            if route == ("jobs",):
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    if not isinstance(payload, dict):
+                        raise JobRequestError("the request body must be a JSON object")
+                    job = service.submit(payload)
+                except (ValueError, JobRequestError) as e:
+                    self._send(503 if service.draining else 400, {"error": str(e)})
+                    return
+                self._send(202, job)
+            elif len(route) == 3 and route[0] == "jobs" and route[2] == "cancel":
+                self._cancel(route[1])
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_DELETE(self):
+            route = self._route()
+            if len(route) == 2 and route[0] == "jobs":
+                self._cancel(route[1])
+            else:
+                self._send(404, {"error": "not found"})
+
+        def _cancel(self, job_id: str):
+            job = service.cancel(job_id)
+            self._send(200, job) if job else self._send(404, {"error": "no such job"})
+
+    return JobRequestHandler
+
+
+def serve(scheduler: BatchScheduler, serve_dir: Path, host: str, port: int, workers: int, drain_timeout: float) -> int:
+    """
+    Runs the job service until SIGINT or SIGTERM, then drains it: no new
+    jobs are accepted, running ones get drain_timeout seconds to finish,
+    and anything unfinished stays queued for the next start.
+    """
+    service = JobService(scheduler, serve_dir, workers)
+    http_server = ThreadingHTTPServer((host, port), _make_handler(service))
+    http_server.daemon_threads = True
+    http_thread = threading.Thread(target=http_server.serve_forever, name="job-api", daemon=True)
+
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, AttributeError, ValueError):
+                pass  # e.g. Windows: Ctrl+C raises KeyboardInterrupt instead
+        await service.run_workers(stop, drain_timeout)
+
+    http_thread.start()
+    bound_host, bound_port = http_server.server_address[:2]
+    print(f"Job service listening on http://{bound_host}:{bound_port} ({service.workers} workers, queue in {service.queue.db_path})")
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.draining = True
+        http_server.shutdown()
+        http_server.server_close()
+        scheduler.shutdown()
+        counts = service.queue.counts()
+        service.queue.close()
+    print(f"Job service stopped; {counts['queued']} job(s) left queued.")
+    return 0
@@ -0,0 +1,153 @@
+# webapp/services/json_stream.py
+
+import json
+from typing import Any, Callable, List, Optional
+
+
+class IncrementalJsonObjectParser:
+    """
+    Scans a JSON object as it arrives in arbitrary chunks and reports its
+    parts as soon as they are complete, without re-parsing what was seen:
+
+      - on_field(key, value) once each top-level field's value is complete;
+      - on_item(key, item) once each element of a top-level array is complete
+        (e.g. each image spec in "images", long before the object ends).
+
+    Only the characters of the current top-level value are kept around
+    for decoding; everything is decoded with json.loads once complete.
+    """
+
+    def __init__(
+        self,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        on_item: Optional[Callable[[str, Any], None]] = None,
+    ):
+        self.on_field = on_field
+        self.on_item = on_item
+        self._text = ""
+        self._pos = 0
+        self._stack: List[str] = []   # "{" or "[" for each open container
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False      # inside the top-level object, before a key
+        self._reading_key = False
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self.done = False
+
+    def feed(self, chunk: str):
+        self._text += chunk
+        text = self._text
+        while self._pos < len(text) and not self.done:
+            char = text[self._pos]
+            if self._in_string:
+                self._scan_string_char(char)
+            else:
+                self._scan_char(char)
+            self._pos += 1
+        self._compact()
+
+    def _depth(self) -> int:
+        return len(self._stack)
+
+    def _in_top_level_array(self) -> bool:
+        return self._depth() == 2 and self._stack[1] == "["
+
+    def _scan_string_char(self, char: str):
+        if self._escape:
+            self._escape = False
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            if self._reading_key:
+                self._reading_key = False
+                self._key = json.loads(self._text[self._string_start:self._pos + 1])
+            elif self._depth() == 1 and self._value_start == self._string_start:
+                self._emit_field(self._pos + 1)
+            elif self._in_top_level_array() and self._item_start == self._string_start:
+                self._emit_item(self._pos + 1)
+
+    def _scan_char(self, char: str):
+        depth = self._depth()
+        if char.isspace():
+            return
+        if char == '"':
+            self._in_string = True
+            self._string_start = self._pos
+            if depth == 1 and self._expect_key:
+                self._reading_key = True
+                self._expect_key = False
+            else:
+                self._mark_value_start()
+        elif char in "{[":
+            self._mark_value_start()
+            self._stack.append(char)
+            if depth == 0:
+                self._expect_key = char == "{"
+        elif char in "}]":
+            self._end_scalar()
+            self._stack.pop()
+            depth = self._depth()
+            if depth == 0:
+                self.done = True
+            elif depth == 1 and self._value_start is not None:
+                self._emit_field(self._pos + 1)
+            elif self._in_top_level_array() and self._item_start is not None:
+                self._emit_item(self._pos + 1)
+        elif char == ":":
+            pass
+        elif char == ",":
+            self._end_scalar()
+            if depth == 1:
+                self._expect_key = True
+        else:
+            # Start of a number, true, false or null
+            self._mark_value_start()
+
+    def _mark_value_start(self):
+        depth = self._depth()
+        if depth == 1 and self._value_start is None:
+            self._value_start = self._pos
+        elif self._in_top_level_array() and self._item_start is None:
+            self._item_start = self._pos
+
+    def _end_scalar(self):
+        """
+        Numbers and literals have no closing character; they end at `,`, `}` or `]`.
+        """
+        if self._in_top_level_array() and self._item_start is not None:
+            self._emit_item(self._pos)
+        elif self._depth() == 1 and self._value_start is not None:
+            self._emit_field(self._pos)
+
+    def _emit_field(self, end: int):
+        value = json.loads(self._text[self._value_start:end])
+        self._value_start = None
+        if self.on_field is not None:
+            self.on_field(self._key, value)
+
+    def _emit_item(self, end: int):
+        item = json.loads(self._text[self._item_start:end])
+        self._item_start = None
+        if self.on_item is not None:
+            self.on_item(self._key, item)
+
+    def _compact(self):
+        """
+        Drops the already-decoded prefix of the buffer.
+        """
+        keep_from = self._pos
+        for start in (self._value_start, self._item_start, self._string_start if self._in_string else None):
+            if start is not None:
+                keep_from = min(keep_from, start)
+        if keep_from > 0:
+            self._text = self._text[keep_from:]
+            self._pos -= keep_from
+            self._string_start -= keep_from
+            if self._value_start is not None:
+                self._value_start -= keep_from
+            if self._item_start is not None:
+                self._item_start -= keep_from
@@ -0,0 +1,96 @@
+# webapp/services/latency_stats.py
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_STATS_FILE = Path(".cache/latency.json")
+# Latencies kept per key; older ones roll off
+WINDOW = 200
+# Fewer samples than this give no percentile (too noisy to act on)
+MIN_SAMPLES = 10
+# Writes to disk are batched at most this often; save() flushes the rest
+SAVE_INTERVAL = 5.0
+
+
+class LatencyStats:
+    """
+    Rolling latencies of API calls, keyed by model and request type (e.g.
+    "gpt-4o-mini/WebsiteSpec"), persisted to a JSON file so percentiles
+    carry over between runs. Safe to use from several threads.
+    """
+
+    def __init__(self, path: Optional[Path] = None, window: int = WINDOW):
+        self.path = Path(path) if path is not None else None
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = self._load()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _load(self) -> Dict[str, List[float]]:
+        if self.path is None or not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {key: [float(value) for value in values][-self.window:] for key, values in data.items()}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"Ignoring unreadable latency stats {self.path}: {e}")
+            return {}
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            samples = self._samples.setdefault(key, [])
+            samples.append(round(seconds, 3))
+            del samples[:-self.window]
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def percentile(self, key: str, q: float) -> Optional[float]:
+        """
+        The q-th percentile (0-100) of the recent latencies of key, or None
+        while there are fewer than MIN_SAMPLES of them.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        rank = min(len(samples) - 1, max(0, round(q / 100 * (len(samples) - 1))))
+        return samples[rank]
+
+    def save(self):
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {key: list(values) for key, values in self._samples.items()}
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+_stats = LatencyStats()
+
+
+def get_latency_stats() -> LatencyStats:
+    return _stats
+
+
+def configure_latency_stats(path: Optional[Path]):
+    """
+    Keeps latency statistics in path (None: in memory only), starting from
+    the latencies already recorded there.
+    """
+    global _stats
+    _stats = LatencyStats(path)
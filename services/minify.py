@@ -0,0 +1,226 @@
+# webapp/services/minify.py
+
+import re
+from typing import List, Tuple
+
+from services.html_dom import Element, parse_html
+
+# Elements whose surrounding whitespace never renders, so it can be dropped entirely
+BLOCK_TAGS = {
+    "html", "head", "body", "title", "meta", "link", "script", "style", "noscript", "base",
+    "header", "footer", "main", "nav", "section", "article", "aside", "div", "p", "ul", "ol", "li",
+    "dl", "dt", "dd", "h1", "h2", "h3", "h4", "h5", "h6", "form", "fieldset", "table", "thead",
+    "tbody", "tfoot", "tr", "td", "th", "figure", "figcaption", "picture", "source", "blockquote",
+    "hr", "br", "pre", "address", "details", "summary", "dialog", "template", "svg", "video", "audio",
+}
+# Elements whose text content is kept byte for byte
+RAW_TEXT_TAGS = ("pre", "textarea", "script", "style")
+
+_HTML_COMMENT_RE = re.compile(r"<!--(?!\[if|<!|>).*?-->", re.DOTALL)
+_WHITESPACE_RE = re.compile(r"\s+")
+_JS_TYPES = ("", "text/javascript", "application/javascript", "module")
+
+# CSS punctuation that never needs whitespace on either side
+_CSS_TIGHT_BEFORE = set("{};,>~)")
+_CSS_TIGHT_AFTER = set("{};,>~:(")
+
+
+def minify_css(css: str) -> str:
+    """
+    Removes comments and unneeded whitespace from a stylesheet. Strings and
+    url() values are copied as they are; whitespace is only dropped next to
+    punctuation where CSS does not need it (so calc(1px + 2px) and
+    descendant selectors like `.a :hover` keep their meaning).
+    """
+    out: List[str] = []
+    i, n = 0, len(css)
+    pending_space = False
+
+    def emit(text: str):
+        nonlocal pending_space
+        if pending_space and out and out[-1][-1] not in _CSS_TIGHT_AFTER and text[0] not in _CSS_TIGHT_BEFORE:
+            out.append(" ")
+        pending_space = False
+        out.append(text)
+
+    while i < n:
+        ch = css[i]
+        if css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            pending_space = pending_space or bool(out)
+            continue
+        if ch in "\"'":
+            j = i + 1
+            while j < n and css[j] != ch:
+                j += 2 if css[j] == "\\" else 1
+            emit(css[i:j + 1])
+            i = j + 1
+            continue
+        if css.startswith("url(", i):
+            end = css.find(")", i)
+            end = n - 1 if end == -1 else end
+            emit(css[i:end + 1])
+            i = end + 1
+            continue
+        if ch.isspace():
+            while i < n and css[i].isspace():
+                i += 1
+            pending_space = bool(out)
+            continue
+        if ch == "}" and out and out[-1] == ";":
+            out.pop()  # the last declaration of a block needs no semicolon
+        emit(ch)
+        i += 1
+    return "".join(out)
+
+
+# Keywords after which a slash starts a regex literal rather than a division
+_REGEX_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "of", "instanceof", "new", "delete", "void", "throw", "yield", "await"}
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch in "_$"
+
+
+def _regex_allowed(previous: str) -> bool:
+    # A slash starts a regex literal at the start, after an operator or keyword, and divides otherwise
+    return previous == "" or previous in _REGEX_KEYWORDS or (len(previous) == 1 and previous in "(,=:[!&|?{};+-*%<>~^")
+
+
+def minify_js(js: str) -> str:
+    """
+    Conservative JS minification: removes comments, indentation and blank
+    lines and the spaces that do not separate two words, but keeps line
+    breaks so automatic semicolon insertion behaves exactly as before.
+    Strings, template literals and regex literals are copied unchanged.
+    """
+    out: List[str] = []
+    i, n = 0, len(js)
+    previous = ""  # last significant token, to tell a regex from a division
+
+    def last_char() -> str:
+        return out[-1][-1] if out else ""
+
+    while i < n:
+        ch = js[i]
+        if js.startswith("//", i):
+            end = js.find("\n", i)
+            i = n if end == -1 else end
+            continue
+        if js.startswith("/*", i):
+            end = js.find("*/", i + 2)
+            comment = js[i:n if end == -1 else end + 2]
+            i = n if end == -1 else end + 2
+            if "\n" in comment and out and last_char() != "\n":
+                out.append("\n")  # a multi-line comment counts as a line break for ASI
+            elif out and _is_word_char(last_char()) and i < n and _is_word_char(js[i]):
+                out.append(" ")
+            continue
+        if ch.isspace():
+            j = i
+            while j < n and js[j].isspace():
+                j += 1
+            following = js[j] if j < n else ""
+            if "\n" in js[i:j]:
+                if out and last_char() != "\n":
+                    out.append("\n")
+            elif (_is_word_char(last_char()) and _is_word_char(following)) or (last_char() in "+-" and following in "+-"):
+                out.append(" ")
+            i = j
+            continue
+        if ch in "\"'`":
+            j = i + 1
+            while j < n and js[j] != ch:
+                j += 2 if js[j] == "\\" else 1
+            out.append(js[i:j + 1])
+            previous = "x"
+            i = j + 1
+            continue
+        if ch == "/" and _regex_allowed(previous):
+            j, in_class = i + 1, False
+            while j < n and js[j] != "\n":
+                if js[j] == "\\":
+                    j += 2
+                    continue
+                if js[j] == "[":
+                    in_class = True
+                elif js[j] == "]":
+                    in_class = False
+                elif js[j] == "/" and not in_class:
+                    break
+                j += 1
+            j += 1
+            while j < n and js[j].isalpha():
+                j += 1  # flags
+            out.append(js[i:j])
+            previous = "x"
+            i = j
+            continue
+        if _is_word_char(ch):
+            j = i
+            while j < n and _is_word_char(js[j]):
+                j += 1
+            previous = js[i:j]
+            out.append(previous)
+            i = j
+            continue
+        out.append(ch)
+        previous = ch
+        i += 1
+    return "".join(out).strip()
+
+
+def minify_html(source: str) -> str:
+    """
+    Removes comments and collapses whitespace in an HTML document, working
+    from the parsed element offsets so attribute values and the contents of
+    <pre>, <textarea>, <script> and <style> are never touched by the
+    whitespace rules. Inline <style> and <script> blocks are minified as
+    CSS and JS. Whitespace next to block-level tags is removed; between
+    inline elements it is collapsed to one space, so text does not run together.
+    """
+    document = parse_html(source)
+    # (start, end, element, is_raw_text) for every tag and raw-text body in the document
+    spans: List[Tuple[int, int, Element, bool]] = []
+    for element in document.root.iter():
+        if element is document.root:
+            continue
+        spans.append((element.start, element.start_tag_end, element, False))
+        if element.end_tag_start > element.start_tag_end and element.tag in RAW_TEXT_TAGS:
+            spans.append((element.start_tag_end, element.end_tag_start, element, True))
+        if element.end > element.end_tag_start:
+            spans.append((element.end_tag_start, element.end, element, False))
+    spans.sort(key=lambda span: (span[0], span[1]))
+
+    pieces: List[str] = []
+    cursor = 0
+    previous_tag = None
+    for start, end, element, raw in spans:
+        if start < cursor:
+            continue  # inside a <pre> or <textarea> that was copied as is
+        pieces.append(_minify_text(source[cursor:start], previous_tag, element.tag))
+        body = source[start:end]
+        if raw and element.tag == "style":
+            body = minify_css(body)
+        elif raw and element.tag == "script" and (element.get("type") or "").strip().lower() in _JS_TYPES:
+            body = minify_js(body)
+        pieces.append(body)
+        cursor = end
+        previous_tag = element.tag
+    pieces.append(_minify_text(source[cursor:], previous_tag, None))
+    return "".join(pieces).strip()
+
+
+def _minify_text(text: str, before_tag, after_tag) -> str:
+    text = _HTML_COMMENT_RE.sub("", text)
+    if not text:
+        return ""
+    collapsed = _WHITESPACE_RE.sub(" ", text)
+    if collapsed == " " and (before_tag in BLOCK_TAGS or after_tag in BLOCK_TAGS or before_tag is None or after_tag is None):
+        return ""
+    if before_tag in BLOCK_TAGS or before_tag is None:
+        collapsed = collapsed.lstrip()
+    if after_tag in BLOCK_TAGS or after_tag is None:
+        collapsed = collapsed.rstrip()
+    return collapsed
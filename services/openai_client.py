@@ -0,0 +1,40 @@
+# webapp/services/openai_client.py
+
+import threading
+from typing import Optional
+
+# The openai package takes most of the startup time, so it is only imported
+# once a stage actually talks to the API (see get_client).
+_client = None
+_client_lock = threading.Lock()
+# Keyword arguments for the client, e.g. base_url to point the run at a local stand-in
+_client_options = {}
+
+
+def configure_client(base_url: Optional[str] = None):
+    """
+    Sets where the shared client sends requests (None keeps the default:
+    OPENAI_BASE_URL, or the OpenAI API). Call before the first request.
+    """
+    global _client
+    with _client_lock:
+        if base_url is not None:
+            _client_options["base_url"] = base_url
+        _client = None
+
+
+def get_client():
+    """
+    Returns the process-wide OpenAI client, creating it on first use.
+    Retries are handled by services.request_layer, not by the client.
+    The API key (and OPENAI_BASE_URL, if set) are read at that point, so
+    runs that never call the API work without them.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(max_retries=0, **_client_options)
+    return _client
+
@@ -0,0 +1,205 @@
+# webapp/services/pipeline.py
+
+import json
+import time
+import asyncio
+import hashlib
+import contextvars
+from pathlib import PurePath
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from services.tracing import span, track
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+# Maps a stage's input values to what its result depends on (see Pipeline)
+Fingerprint = Callable[[Dict[str, Any]], Any]
+# Stage name -> (fingerprint, outputs) of its last run
+Memo = Dict[str, Tuple[str, Dict[str, Any]]]
+
+
+class PipelineError(Exception):
+    """
+    Raised for an invalid pipeline (missing or duplicate outputs, cycles).
+    """
+
+
+def by_inputs(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fingerprint of a stage whose result depends only on its input values.
+    """
+    return inputs
+
+
+def fingerprint(value: Any) -> str:
+    """
+    A stable hash of a value built from pydantic models, containers,
+    paths and JSON scalars.
+    """
+    def plain(value: Any) -> Any:
+        if hasattr(value, "model_dump"):
+            return plain(value.model_dump())
+        if isinstance(value, dict):
+            return {str(key): plain(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [plain(item) for item in value]
+        if isinstance(value, (set, frozenset)):
+            return sorted(plain(item) for item in value)
+        if isinstance(value, PurePath):
+            return value.as_posix()
+        return value
+
+    payload = json.dumps(plain(value), sort_keys=True, default=repr)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Stage:
+    """
+    One step of a pipeline. func receives a dict with the values of its
+    inputs and returns a dict with a value for each of its outputs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: StageFunc,
+        inputs: Sequence[str] = (),
+        outputs: Sequence[str] = (),
+        fingerprint: Optional[Fingerprint] = None,
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.fingerprint = fingerprint
+
+
+def blocking(func: Callable[..., Dict[str, Any]], executor: Optional[Executor] = None) -> StageFunc:
+    """
+    Wraps a regular (blocking) function as a stage function that runs in a
+    worker thread (of executor, or the event loop's default one), with a
+    copy of the caller's context.
+    """
+    async def run(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, context.run, func, inputs)
+    return run
+
+
+class Pipeline:
+    """
+    A DAG of stages connected by named values. run() starts every stage as
+    soon as all of its inputs exist, so independent branches overlap and the
+    total time approaches the critical path instead of the sum of all stages.
+
+    With a memo (kept by the caller across runs), stages that have a
+    fingerprint are skipped when it matches their previous run, and their
+    previous outputs are used instead; memo records the new results.
+    on_stage, if given, is called with the name of each stage as it starts.
+    """
+
+    def __init__(self, memo: Optional[Memo] = None, on_stage: Optional[Callable[[str], None]] = None):
+        self.stages: List[Stage] = []
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.memo = memo
+        self.on_stage = on_stage
+        self.reused: List[str] = []
+
+    def add(
+        self,
+        name: str,
+        func: StageFunc,
+        inputs: Sequence[str] = (),
+        outputs: Sequence[str] = (),
+        fingerprint: Optional[Fingerprint] = None,
+    ) -> Stage:
+        stage = Stage(name, func, inputs, outputs, fingerprint)
+        self.stages.append(stage)
+        return stage
+
+    def validate(self, provided: Sequence[str] = ()):
+        producers: Dict[str, str] = {name: "<initial>" for name in provided}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise PipelineError(f"Value '{output}' is produced by both {producers[output]} and {stage.name}.")
+                producers[output] = stage.name
+        for stage in self.stages:
+            for name in stage.inputs:
+                if name not in producers:
+                    raise PipelineError(f"Stage {stage.name} needs '{name}', which no stage produces.")
+
+        # Kahn's algorithm over stage dependencies to reject cycles
+        remaining = {stage.name: {producers[name] for name in stage.inputs} - {"<initial>"} for stage in self.stages}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise PipelineError(f"Pipeline has a cycle between stages: {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    async def run(self, initial: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Runs all stages and returns every value produced. If a stage fails,
+        the stages still running are cancelled and the error is re-raised.
+        """
+        values: Dict[str, Any] = dict(initial or {})
+        self.validate(list(values))
+        ready = {name: asyncio.Event() for stage in self.stages for name in stage.outputs}
+        for name in values:
+            ready.setdefault(name, asyncio.Event()).set()
+        origin = time.perf_counter()
+
+        async def run_stage(stage: Stage):
+            for name in stage.inputs:
+                await ready[name].wait()
+            start = time.perf_counter()
+            inputs = {name: values[name] for name in stage.inputs}
+            key = None
+            if self.memo is not None and stage.fingerprint is not None:
+                key = fingerprint(stage.fingerprint(inputs))
+            previous = self.memo.get(stage.name) if key is not None else None
+            if previous is not None and previous[0] == key:
+                outputs = previous[1]
+                self.reused.append(stage.name)
+            else:
+                if self.on_stage is not None:
+                    self.on_stage(stage.name)
+                # Each stage task has its own context, so this names its timeline row
+                with track(stage.name), span(stage.name, "stage"):
+                    outputs = await stage.func(inputs)
+            end = time.perf_counter()
+            self.timings[stage.name] = {"start": start - origin, "end": end - origin}
+            missing = [name for name in stage.outputs if name not in (outputs or {})]
+            if missing:
+                raise PipelineError(f"Stage {stage.name} did not produce {', '.join(missing)}.")
+            if key is not None:
+                self.memo[stage.name] = (key, {name: outputs[name] for name in stage.outputs})
+            for name in stage.outputs:
+                values[name] = outputs[name]
+                ready[name].set()
+
+        tasks = [asyncio.create_task(run_stage(stage), name=stage.name) for stage in self.stages]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return values
+
+    def print_timings(self):
+        """
+        Prints when each stage ran, relative to the start of the run.
+        """
+        if not self.timings:
+            return
+        print("\nStage timings (seconds from start):")
+        for name, timing in sorted(self.timings.items(), key=lambda item: item[1]["start"]):
+            duration = timing["end"] - timing["start"]
+            note = "reused" if name in self.reused else f"{duration:.2f}s"
+            print(f"  {name:<24} {timing['start']:8.2f} -> {timing['end']:8.2f}  ({note})")
@@ -0,0 +1,145 @@
+# webapp/services/preview_server.py
+
+import json
+import threading
+from pathlib import Path
+from functools import partial
+from typing import List
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+LIVERELOAD_PATH = "/__livereload"
+# Comment lines sent to idle live-reload connections, so proxies keep them open
+HEARTBEAT_SECONDS = 15.0
+
+# Injected into every HTML page served; a change that only touches CSS
+# swaps the stylesheets in place, anything else reloads the page.
+LIVERELOAD_SCRIPT = """<script>
+(function () {
+  var source = new EventSource("%s");
+  source.addEventListener("reload", function (event) {
+    var files = JSON.parse(event.data);
+    if (files.length && files.every(function (file) { return /\\.css$/.test(file); })) {
+      document.querySelectorAll('link[rel="stylesheet"]').forEach(function (link) {
+        var url = new URL(link.href);
+        url.searchParams.set("livereload", Date.now());
+        link.href = url.href;
+      });
+    } else {
+      location.reload();
+    }
+  });
+})();
+</script>
+""" % LIVERELOAD_PATH
+
+
+class PreviewServer:
+    """
+    Serves a site directory over HTTP for previewing, and tells open pages
+    to reload (over Server-Sent Events) when notify() is called. The live
+    reload script is added to HTML responses only; files on disk are left as
+    they are.
+    """
+
+    def __init__(self, root: Path, host: str = "127.0.0.1", port: int = 8000):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._changed = threading.Condition()
+        self._version = 0
+        self._files: List[str] = []
+        self._closed = False
+        self._server = ThreadingHTTPServer((host, port), partial(_PreviewHandler, self, directory=str(self.root)))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="preview", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread.start()
+
+    def notify(self, files: List[str]):
+        """
+        Sends a reload event with the changed files (paths relative to the root).
+        """
+        with self._changed:
+            self._version += 1
+            self._files = list(files)
+            self._changed.notify_all()
+
+    def wait(self, version: int, timeout: float):
+        # Returns (version, files) once there is a newer version than `version`, or (version, None)
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version or self._closed, timeout)
+            if self._closed:
+                raise ConnectionAbortedError("preview server stopped")
+            if self._version == version:
+                return version, None
+            return self._version, self._files
+
+    def current_version(self) -> int:
+        with self._changed:
+            return self._version
+
+    def shutdown(self):
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _PreviewHandler(SimpleHTTPRequestHandler):
+    def __init__(self, preview: PreviewServer, *args, **kwargs):
+        self.preview = preview
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, *args):
+        pass
+
+    def end_headers(self):
+        # Always revalidate, so a reload shows the latest build
+        self.send_header("Cache-Control", "no-cache")
+        super().end_headers()
+
+    def do_GET(self):
+        if self.path == LIVERELOAD_PATH:
+            self._stream_events()
+            return
+        path = Path(self.translate_path(self.path))
+        if path.is_dir():
+            path = path / "index.html"
+        if path.suffix == ".html" and path.is_file():
+            self._send_html(path)
+            return
+        super().do_GET()
+
+    def _send_html(self, path: Path):
+        html = path.read_text(encoding="utf-8")
+        index = html.lower().rfind("</body>")
+        html = html + LIVERELOAD_SCRIPT if index < 0 else html[:index] + LIVERELOAD_SCRIPT + html[index:]
+        body = html.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "keep-alive")
+        self.end_headers()
+        version = self.preview.current_version()
+        try:
+            while True:
+                version, files = self.preview.wait(version, HEARTBEAT_SECONDS)
+                if files is None:
+                    self.wfile.write(b": heartbeat\n\n")
+                else:
+                    self.wfile.write(f"event: reload\ndata: {json.dumps(files)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+        except (ConnectionError, OSError):
+            pass
@@ -0,0 +1,170 @@
+# webapp/services/prompt_index.py
+
+import os
+import re
+import json
+import random
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+INDEX_FILENAME = "prompts.json"
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_MAX_ENTRIES = 20000
+
+# Words that change how a prompt reads but not what it depicts
+_STOPWORDS = frozenset(
+    "a an the of with and in on at for to from by into its his her their is are "
+    "image photo picture photograph".split()
+)
+_WORD = re.compile(r"[a-z0-9]+")
+
+# MinHash over 64 hash functions, split into 16 LSH bands of 4 rows: two
+# prompts share a band (and are compared) with probability 1 - (1 - s^4)^16,
+# about 0.98 at a Jaccard similarity s of 0.6 and 0.004 at 0.2.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Lowercases a prompt and keeps only its meaningful words, so prompts that
+    differ in punctuation, spacing or filler words normalize the same.
+    """
+    return " ".join(word for word in _WORD.findall(prompt.lower()) if word not in _STOPWORDS)
+
+
+def shingles(normalized: str, size: int = 2) -> FrozenSet[str]:
+    """
+    The set of word n-grams of a normalized prompt (the whole prompt if it
+    has fewer than `size` words).
+    """
+    words = normalized.split()
+    if len(words) < size:
+        return frozenset([normalized]) if normalized else frozenset()
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def minhash(items: FrozenSet[str]) -> Tuple[int, ...]:
+    """
+    A MinHash signature of items: for two sets, the fraction of equal
+    positions estimates their Jaccard similarity.
+    """
+    if not items:
+        return (0,) * NUM_PERM
+    hashes = [int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big") for item in items]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+class PromptIndex:
+    """
+    A persistent index of the prompts of generated images, used to find an
+    earlier image whose prompt is near-identical to a new one. Prompts are
+    compared by the Jaccard similarity of their word bigrams; MinHash
+    signatures and LSH buckets narrow a lookup down to a few candidates, so
+    it stays fast with many thousands of prompts.
+
+    Only images generated with the same model, size and quality match. Each
+    entry points to an ImageCache key; the index lives next to that cache in
+    prompts.json. Safe to share between the threads of the image pool.
+    """
+
+    def __init__(self, path: Path, threshold: float = DEFAULT_THRESHOLD, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # cache key -> entry, in insertion order (oldest first)
+        self._entries: Dict[str, Dict[str, str]] = {}
+        self._shingles: Dict[str, FrozenSet[str]] = {}
+        self._buckets: Dict[Tuple, Set[str]] = {}
+        for entry in self._load():
+            self._insert(entry)
+
+    def _load(self) -> List[Dict[str, str]]:
+        if not self.path.exists():
+            return []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)["entries"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable prompt index {self.path}: {e}")
+            return []
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": list(self._entries.values())}, f)
+        os.replace(tmp_path, self.path)
+
+    def _bucket_keys(self, entry: Dict[str, str], signature: Tuple[int, ...]) -> List[Tuple]:
+        settings = (entry["model"], entry["size"], entry["quality"])
+        return [settings + (band,) + signature[band * ROWS:(band + 1) * ROWS] for band in range(BANDS)]
+
+    def _insert(self, entry: Dict[str, str]):
+        key = entry["key"]
+        self._entries[key] = entry
+        self._shingles[key] = shingles(entry["prompt"])
+        for bucket in self._bucket_keys(entry, minhash(self._shingles[key])):
+            self._buckets.setdefault(bucket, set()).add(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for bucket in self._bucket_keys(entry, minhash(self._shingles.pop(key))):
+            members = self._buckets.get(bucket)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._buckets[bucket]
+
+    def find(self, prompt: str, model: str, size: str, quality: str, exclude: Tuple[str, ...] = ()) -> Optional[Tuple[str, float]]:
+        """
+        Returns (cache key, similarity) of the most similar indexed prompt
+        with the same settings, if its similarity reaches the threshold.
+        """
+        entry = {"prompt": normalize_prompt(prompt), "model": model, "size": size, "quality": quality}
+        wanted = shingles(entry["prompt"])
+        signature = minhash(wanted)
+        with self._lock:
+            candidates = set()
+            for bucket in self._bucket_keys(entry, signature):
+                candidates.update(self._buckets.get(bucket, ()))
+            scored = [(jaccard(wanted, self._shingles[key]), key) for key in candidates if key not in exclude]
+        if not scored:
+            return None
+        similarity, key = max(scored)
+        return (key, similarity) if similarity >= self.threshold else None
+
+    def add(self, key: str, prompt: str, model: str, size: str, quality: str):
+        """
+        Records that the image cached under key was generated from prompt.
+        """
+        with self._lock:
+            self._remove(key)
+            self._insert({"key": key, "prompt": normalize_prompt(prompt), "model": model, "size": size, "quality": quality})
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._save()
+
+    def discard(self, key: str):
+        """
+        Forgets an entry, e.g. because its image was evicted from the cache.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self._save()
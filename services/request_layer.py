@@ -0,0 +1,356 @@
+# webapp/services/request_layer.py
+
+import time
+import queue
+import random
+import threading
+import contextvars
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+from services.latency_stats import get_latency_stats
+from services.tracing import count, span
+
+T = TypeVar("T")
+
+
+def retryable_errors() -> Tuple[Type[Exception], ...]:
+    """
+    Errors worth retrying: rate limits, server errors, timeouts and dropped
+    connections. openai is imported here rather than at module level, so
+    offline runs never load it (it is already loaded by the time a request fails).
+    """
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+    )
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `capacity` tokens and refills at
+    capacity per minute. acquire() blocks until enough tokens are available,
+    so callers are spread out instead of bursting into a rate limit.
+    """
+
+    def __init__(self, per_minute: float):
+        if per_minute <= 0:
+            raise ValueError(f"a token bucket needs a positive rate, not {per_minute}")
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        # A request larger than the whole bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def adjust(self, amount: float):
+        """
+        Corrects an earlier estimate once the real cost is known
+        (positive takes more tokens, negative gives some back).
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RequestBudget:
+    """
+    Rate limits and retry policy for one kind of API call ("chat" or "images").
+    With hedge_percentile set, a call still running after that percentile of
+    its recent latencies gets a second, identical request (see call_with_retry).
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: Optional[float] = None,
+        timeout: float = 300.0,
+        max_retries: int = 5,
+        max_backoff: float = 60.0,
+        hedge_percentile: Optional[float] = None,
+    ):
+        self.configure(requests_per_minute, tokens_per_minute, timeout, max_retries, max_backoff, hedge_percentile)
+        self._paused_until = 0.0
+        self._pause_lock = threading.Lock()
+
+    def configure(self, requests_per_minute, tokens_per_minute, timeout, max_retries, max_backoff, hedge_percentile=None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.hedge_percentile = hedge_percentile
+
+    def pause(self, seconds: float):
+        """
+        Holds back every caller of this budget, e.g. after a 429 with Retry-After.
+        """
+        with self._pause_lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def wait_turn(self, estimated_tokens: float):
+        while True:
+            with self._pause_lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(remaining)
+        self.requests.acquire(1)
+        if self.tokens is not None and estimated_tokens:
+            self.tokens.acquire(estimated_tokens)
+
+    def refund(self, estimated_tokens: float):
+        """
+        Gives back the tokens wait_turn reserved for a request that used
+        none of them (it failed, or was never sent).
+        """
+        if self.tokens is not None and estimated_tokens:
+            self.tokens.adjust(-estimated_tokens)
+
+
+BUDGETS: Dict[str, RequestBudget] = {
+    "chat": RequestBudget(requests_per_minute=500, tokens_per_minute=200_000, timeout=300.0),
+    "images": RequestBudget(requests_per_minute=50, timeout=120.0),
+}
+
+
+def configure_budget(
+    kind: str,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    timeout: Optional[float] = None,
+    max_retries: Optional[int] = None,
+    hedge_percentile: Optional[float] = None,
+):
+    """
+    Overrides the limits of one budget (e.g. from command-line flags).
+    Arguments left as None keep their current value.
+    """
+    budget = BUDGETS[kind]
+    budget.configure(
+        requests_per_minute if requests_per_minute is not None else budget.requests.capacity,
+        tokens_per_minute if tokens_per_minute is not None else (budget.tokens.capacity if budget.tokens else None),
+        timeout if timeout is not None else budget.timeout,
+        max_retries if max_retries is not None else budget.max_retries,
+        budget.max_backoff,
+        hedge_percentile if hedge_percentile is not None else budget.hedge_percentile,
+    )
+
+
+def estimate_chat_tokens(messages: List[Dict], expected_output_tokens: int = 2000) -> int:
+    """
+    Rough token estimate for a chat request (about four characters per token),
+    used to reserve tokens-per-minute capacity before the call.
+    """
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in messages)
+    return prompt_chars // 4 + expected_output_tokens
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def _latency_key(kwargs: Dict[str, Any]) -> Optional[str]:
+    # Model plus response format (the schema of structured chat outputs),
+    # since a full spec and a small patch take very different times
+    model = kwargs.get("model")
+    if model is None:
+        return None
+    response_format = kwargs.get("response_format")
+    name = getattr(response_format, "__name__", response_format)
+    return f"{model}/{name}" if isinstance(name, str) else model
+
+
+def _timed_call(func: Callable[..., T], args, kwargs, latency_key: Optional[str]) -> T:
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    if latency_key is not None:
+        get_latency_stats().record(latency_key, time.perf_counter() - start)
+    return result
+
+
+def _hedged_call(kind: str, budget: RequestBudget, func: Callable[..., T], args, kwargs, latency_key: Optional[str], estimated_tokens: float, info: Dict) -> T:
+    """
+    Calls func and, if it has not returned after the budget's hedge
+    percentile of recent latencies for latency_key, sends the same request
+    again and returns whichever answers first. The losing request cannot be
+    interrupted mid-flight; it finishes in the background and its result is
+    dropped (its tokens are counted as "<kind>.hedge_wasted_tokens"). A
+    hedge that has not been sent yet when the first request answers is
+    skipped and the rate limit capacity reserved for it is given back; a
+    losing request that got an answer is charged its real token usage, and
+    one that failed is not charged at all.
+    Without enough latency samples there is no hedging.
+    """
+    delay = None
+    if budget.hedge_percentile is not None and latency_key is not None:
+        delay = get_latency_stats().percentile(latency_key, budget.hedge_percentile)
+    if delay is None:
+        return _timed_call(func, args, kwargs, latency_key)
+
+    outcomes: "queue.Queue[Tuple[str, Any, Optional[BaseException]]]" = queue.Queue()
+    winner_lock = threading.Lock()
+    winner: List[str] = []
+
+    def attempt(label: str):
+        try:
+            result = _timed_call(func, args, kwargs, latency_key)
+        except BaseException as e:
+            with winner_lock:
+                answered = bool(winner)
+                if not answered:
+                    outcomes.put((label, None, e))
+            if answered:
+                # Failed after the other request won: its reservation was never used
+                budget.refund(estimated_tokens)
+            return
+        with winner_lock:
+            won = not winner
+            winner.append(label)
+            if won:
+                outcomes.put((label, result, None))
+        if won:
+            return
+        usage = getattr(result, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            count(f"{kind}.hedge_wasted_tokens", usage.total_tokens)
+            # The winner's usage settles one reservation in call_with_retry;
+            # this one settles the other (reserved when the hedge was sent)
+            if budget.tokens is not None and estimated_tokens:
+                budget.tokens.adjust(usage.total_tokens - estimated_tokens)
+
+    def start(label: str):
+        # Each attempt keeps the caller's context (trace track, usage tracking)
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(attempt, label), name=f"{kind}-{label}", daemon=True).start()
+
+    start("primary")
+    running = 1
+    try:
+        outcome = outcomes.get(timeout=delay)
+    except queue.Empty:
+        budget.wait_turn(estimated_tokens)
+        try:
+            outcome = outcomes.get_nowait()
+            # Answered while the hedge waited for its turn: give its reservation back
+            budget.requests.adjust(-1)
+            budget.refund(estimated_tokens)
+        except queue.Empty:
+            info["hedged_after_s"] = round(delay, 3)
+            count(f"{kind}.hedges")
+            start("hedge")
+            running = 2
+            outcome = outcomes.get()
+    running -= 1
+    label, result, error = outcome
+    if error is not None and running:
+        # One request failed; the other may still succeed. The failed one's
+        # reservation goes back here (call_with_retry settles the other)
+        budget.refund(estimated_tokens)
+        label, result, error = outcomes.get()
+    if error is not None:
+        raise error
+    if label == "hedge":
+        info["hedge_won"] = True
+        count(f"{kind}.hedge_wins")
+    return result
+
+
+def call_with_retry(
+    kind: str,
+    func: Callable[..., T],
+    *args,
+    estimated_tokens: float = 0,
+    latency_key: Optional[str] = None,
+    hedge: bool = True,
+    **kwargs,
+) -> T:
+    """
+    Calls func(*args, timeout=<budget timeout>, **kwargs) under the rate limits
+    of the given budget, retrying rate limits and transient errors with
+    exponential backoff and full jitter. A Retry-After header, when present,
+    sets the delay and pauses every other caller of the same budget too.
+    Each call is traced as a "<kind>.request" span, and the token usage of
+    the result is added to the "<kind>.prompt_tokens" and
+    "<kind>.completion_tokens" counters.
+
+    The latency of every successful request is recorded under latency_key
+    (by default "<model>/<response format>") in the latency statistics,
+    which also decide when a slow call is hedged (see _hedged_call). Pass
+    hedge=False for calls with side effects while they run, like streams
+    that feed callbacks.
+    """
+    budget = BUDGETS[kind]
+    kwargs.setdefault("timeout", budget.timeout)
+    if latency_key is None:
+        latency_key = _latency_key(kwargs)
+    attempt = 0
+    with span(f"{kind}.request", "api", model=kwargs.get("model")) as info:
+        while True:
+            waited = time.perf_counter()
+            budget.wait_turn(estimated_tokens)
+            info["rate_limit_wait_s"] = round(info.get("rate_limit_wait_s", 0) + time.perf_counter() - waited, 3)
+            try:
+                if hedge:
+                    result = _hedged_call(kind, budget, func, args, kwargs, latency_key, estimated_tokens, info)
+                else:
+                    result = _timed_call(func, args, kwargs, latency_key)
+            except retryable_errors() as e:
+                # The failed attempt's tokens go back; the retry reserves its own
+                budget.refund(estimated_tokens)
+                attempt += 1
+                info["retries"] = attempt
+                if attempt > budget.max_retries:
+                    raise
+                delay = _retry_after_seconds(e)
+                if delay is not None:
+                    budget.pause(delay)
+                else:
+                    delay = random.uniform(0, min(budget.max_backoff, 2 ** attempt))
+                print(f"{kind} request failed ({type(e).__name__}); retry {attempt} of {budget.max_retries} in {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                budget.refund(estimated_tokens)
+                raise
+
+            usage = getattr(result, "usage", None)
+            if usage is not None:
+                for field in ("prompt_tokens", "completion_tokens"):
+                    tokens = getattr(usage, field, None) or 0
+                    if tokens:
+                        info[field] = tokens
+                        count(f"{kind}.{field}", tokens)
+            if budget.tokens is not None and usage is not None and getattr(usage, "total_tokens", None):
+                budget.tokens.adjust(usage.total_tokens - estimated_tokens)
+            return result
+
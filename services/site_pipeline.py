@@ -0,0 +1,311 @@
+# webapp/services/site_pipeline.py
+
+import json
+import hashlib
+from pathlib import Path
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from generators.website_generator import generate_website_spec, generate_website_spec_stream, ImageSpec, WebsiteSpec
+from generators.image_generator import ImageJobPool
+from generators.image_planner import ImagePlan, plan_image, plan_images, print_image_plans
+from generators.refiner import refine_spec
+from integrators.asset_integrator import integrate_images
+from integrators.page_hints import add_page_hints, print_page_hints
+from integrators.picture_integrator import use_responsive_images
+from services.asset_builder import BuildOptions, build_assets, print_size_table
+from services.checkpoint import CheckpointStore
+from services.completion_cache import CompletionCache
+from services.file_manager import write_website_file, write_website_files
+from services.image_optimizer import ImageOptimizer, print_savings
+from services.pipeline import Memo, Pipeline, blocking, by_inputs
+
+
+def spec_version(iteration: int) -> str:
+    """
+    Name of the pipeline value holding the spec after `iteration` refinements.
+    """
+    return f"spec_{iteration}"
+
+
+def build_site_pipeline(
+    args,
+    completion_cache: Optional[CompletionCache],
+    image_pool: Optional[ImageJobPool],
+    checkpoint: Optional[CheckpointStore] = None,
+    optimizer: Optional[ImageOptimizer] = None,
+    memo: Optional[Memo] = None,
+    chat_executor: Optional[Executor] = None,
+    on_stage: Optional[Callable[[str], None]] = None,
+    print_spec: bool = True,
+) -> Pipeline:
+    """
+    Builds the single-site pipeline for parsed command-line arguments:
+
+        spec -> refine_1 -> ... -> refine_N -> save_spec
+                                            -> images -> optimize_images -> integrate -> hints -> build -> write
+
+    Every intermediate spec version also feeds a prefetch stage that starts
+    its image jobs right away, so images whose prompt survives the remaining
+    refinements are already done (or running) when the final spec arrives.
+    Jobs for prompts a later version changes or drops are superseded in the
+    image pool. --no-speculative-images turns the prefetch stages off.
+
+    Unless --no-image-planning is set, each image is generated at the model,
+    size and quality its estimated rendered size calls for (see
+    generators.image_planner).
+
+    With an optimizer, the generated images are transcoded into responsive
+    WebP/AVIF variants and their <img> tags become <picture> elements.
+
+    --minify, --critical-css and --precompress turn on the build stage
+    (see services.asset_builder).
+
+    With a checkpoint store, every spec version and finished image is saved
+    as soon as it exists, and the ones already saved (by an earlier attempt
+    of the same run) are reused instead of being generated again.
+
+    With a memo from an earlier run of the same arguments (--watch), the
+    spec, refine, save_spec and build stages are skipped when their inputs
+    did not change. The other stages are incremental on their own: the
+    image pool reuses jobs whose prompt is unchanged, the optimizer skips
+    unchanged images and only changed files are written.
+
+    Batch and serve jobs (see services.batch_runner) run one such pipeline
+    each, with their spec and refine stages on a shared chat_executor.
+    on_stage is called as each stage starts; print_spec=False leaves the
+    final spec out of the output.
+    """
+    pipeline = Pipeline(memo, on_stage)
+    iterations = max(1, args.iterations)
+    final_spec = spec_version(iterations - 1)
+
+    def checkpointed(version: str, generate):
+        # Wraps a blocking spec stage so it resumes from, and saves to, the checkpoint
+        def stage(inputs: Dict[str, Any]) -> Dict[str, Any]:
+            if checkpoint is not None:
+                website_spec = checkpoint.load_spec(version)
+                if website_spec is not None:
+                    print(f"Resuming with checkpointed {version}.")
+                    return {version: website_spec}
+            website_spec = generate(inputs)
+            if checkpoint is not None:
+                checkpoint.save_spec(version, website_spec)
+            return {version: website_spec}
+        return stage
+
+    # Images submitted while the spec streamed in: filename -> (prompt, plan).
+    # They were planned from the filename alone; as long as the prompt is
+    # unchanged their plan is kept, so the job already running is collected
+    # instead of being superseded by a plan made from the full markup.
+    streamed_plans: Dict[str, Tuple[str, Optional[ImagePlan]]] = {}
+
+    def plans_for(website_spec: WebsiteSpec) -> Dict[str, ImagePlan]:
+        plans = {} if args.no_image_planning else plan_images(website_spec)
+        for image_spec in website_spec.images:
+            streamed = streamed_plans.get(image_spec.filename)
+            if streamed is None or streamed[0] != image_spec.prompt:
+                continue
+            if streamed[1] is None:
+                plans.pop(image_spec.filename, None)
+            else:
+                plans[image_spec.filename] = streamed[1]
+        return plans
+
+    def submit_image(image_spec: ImageSpec, plan: Optional[ImagePlan] = None) -> Future:
+        future = image_pool.submit(image_spec, args.images_dir, plan)
+        if checkpoint is not None:
+            future.add_done_callback(lambda done: _checkpoint_image(checkpoint, image_spec, done))
+        return future
+
+    def submit_streamed(image_spec: ImageSpec) -> Future:
+        # Only the filename is known this early, so plan from name hints
+        plan = None if args.no_image_planning else plan_image(image_spec)
+        streamed_plans[image_spec.filename] = (image_spec.prompt, plan)
+        return submit_image(image_spec, plan)
+
+    def load_or_generate(inputs: Dict[str, Any]) -> WebsiteSpec:
+        if args.spec_file and args.spec_file.exists():
+            print(f"Loading existing website spec from {args.spec_file}")
+            with open(args.spec_file, "r", encoding="utf-8") as f:
+                return WebsiteSpec(**json.load(f))
+
+        spec_model = args.spec_model or args.model
+        print(f"Generating initial website spec from GPT using model: {spec_model}")
+        if args.stream_spec:
+            website_spec = generate_website_spec_stream(
+                args.details,
+                spec_model,
+                on_image=submit_streamed if image_pool is not None else None,
+                on_file=lambda field, content: write_website_file(args.output_dir, field, content),
+                cache=completion_cache,
+            )
+        else:
+            website_spec = generate_website_spec(args.details, spec_model, completion_cache)
+        return website_spec
+
+    def spec_source(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        # What the first spec version is made from
+        spec_file = None
+        if args.spec_file and args.spec_file.exists():
+            spec_file = hashlib.sha256(args.spec_file.read_bytes()).hexdigest()
+        return {"spec_file": spec_file, "details": args.details, "model": args.spec_model or args.model}
+
+    pipeline.add(
+        "spec",
+        blocking(checkpointed(spec_version(0), load_or_generate), chat_executor),
+        outputs=[spec_version(0)],
+        fingerprint=spec_source,
+    )
+
+    def refine_stage(iteration: int):
+        def refine(inputs: Dict[str, Any]) -> WebsiteSpec:
+            print(f"\n--- Refinement Iteration {iteration} of {iterations - 1} ---")
+            return refine_spec(
+                inputs[spec_version(iteration - 1)],
+                args.improvement,
+                args.refine_model or args.model,
+                mode=args.refine_mode,
+                cache=completion_cache,
+                section_concurrency=args.section_concurrency,
+            )
+        return refine
+
+    for iteration in range(1, iterations):
+        pipeline.add(
+            f"refine_{iteration}",
+            blocking(checkpointed(spec_version(iteration), refine_stage(iteration)), chat_executor),
+            inputs=[spec_version(iteration - 1)],
+            outputs=[spec_version(iteration)],
+            fingerprint=by_inputs,
+        )
+
+    if image_pool is not None and not args.no_speculative_images:
+        def prefetch_stage(version: str):
+            async def prefetch(inputs: Dict[str, Any]) -> Dict[str, Any]:
+                website_spec = inputs[version]
+                plans = plans_for(website_spec)
+                image_pool.retain(website_spec.images, args.images_dir)
+                for image_spec in website_spec.images:
+                    if checkpoint is None or not checkpoint.can_restore(image_spec):
+                        submit_image(image_spec, plans.get(image_spec.filename))
+                return {}
+            return prefetch
+
+        # The final version is submitted by the images stage itself
+        for iteration in range(0, iterations - 1):
+            pipeline.add(f"prefetch_images_{iteration}", prefetch_stage(spec_version(iteration)), inputs=[spec_version(iteration)])
+
+    def save_spec(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        spec_dict = inputs[final_spec].model_dump()
+        if print_spec:
+            print("\nWebsite spec after all iterations:")
+            print(json.dumps(spec_dict, indent=2))
+        if args.output_spec:
+            args.output_spec.parent.mkdir(parents=True, exist_ok=True)
+            with open(args.output_spec, "w", encoding="utf-8") as f:
+                json.dump(spec_dict, f, indent=2)
+            print(f"Final WebsiteSpec saved to {args.output_spec}")
+        return {}
+
+    pipeline.add("save_spec", blocking(save_spec), inputs=[final_spec], fingerprint=by_inputs)
+
+    async def images(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        if image_pool is None:
+            print("Skipping image generation step...")
+            return {"image_paths": {}, "image_plans": {}, "image_failures": {}}
+        website_spec = inputs[final_spec]
+        plans = plans_for(website_spec)
+        if not args.no_image_planning:
+            print_image_plans(website_spec.images, plans, " ".join(image_pool.settings()))
+            if checkpoint is not None:
+                checkpoint.record_report("image_plans", [plan.model_dump() for plan in plans.values()])
+        image_pool.retain(website_spec.images, args.images_dir)
+
+        image_paths: Dict[str, str] = {}
+        pending = []
+        for image_spec in website_spec.images:
+            restored = checkpoint.restore_image(image_spec, Path(args.images_dir)) if checkpoint is not None else None
+            if restored is not None:
+                image_paths[image_spec.filename] = restored.as_posix()
+            else:
+                submit_image(image_spec, plans.get(image_spec.filename))
+                pending.append(image_spec)
+        if image_paths:
+            print(f"Restored {len(image_paths)} images from the checkpoint.")
+
+        # Jobs started for earlier versions are reused if their prompt is unchanged
+        generated, failures = await image_pool.collect_async(pending, args.images_dir, plans=plans)
+        image_paths.update(generated)
+        for filename, reason in failures.items():
+            print(f"Image '{filename}' was not generated: {reason}")
+        return {"image_paths": image_paths, "image_plans": plans, "image_failures": failures}
+
+    pipeline.add("images", images, inputs=[final_spec], outputs=["image_paths", "image_plans", "image_failures"])
+
+    async def optimize_images(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        if optimizer is None:
+            return {"optimized_images": {}}
+        optimized, _ = await optimizer.optimize_async(inputs["image_paths"])
+        print_savings(optimized)
+        return {"optimized_images": optimized}
+
+    pipeline.add("optimize_images", optimize_images, inputs=["image_paths"], outputs=["optimized_images"])
+
+    def integrate(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        updated_spec, integration_report = integrate_images(inputs[final_spec], inputs["image_paths"], site_root=args.output_dir)
+        for field, counts in integration_report.rewritten.items():
+            for filename, count in counts.items():
+                print(f"Rewrote {count} reference(s) to '{filename}' in {field}.")
+        for filename in integration_report.unreferenced:
+            print(f"Warning: generated image '{filename}' is not referenced by the website code.")
+        updated_spec, pictures = use_responsive_images(updated_spec, inputs["optimized_images"], site_root=args.output_dir)
+        if pictures:
+            print(f"Rewrote {pictures} <img> tag(s) into responsive <picture> elements.")
+        return {"integrated_spec": updated_spec}
+
+    pipeline.add("integrate", blocking(integrate), inputs=[final_spec, "image_paths", "optimized_images"], outputs=["integrated_spec"])
+
+    def hints(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        if args.no_page_hints:
+            return {"site_spec": inputs["integrated_spec"]}
+        updated_spec, report = add_page_hints(inputs["integrated_spec"], site_root=args.output_dir)
+        print_page_hints(report)
+        return {"site_spec": updated_spec}
+
+    pipeline.add("hints", blocking(hints), inputs=["integrated_spec"], outputs=["site_spec"])
+
+    build_options = BuildOptions(minify=args.minify, critical_css=args.critical_css, precompress=args.precompress)
+
+    def build(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        if not build_options.enabled:
+            return {"built_spec": inputs["site_spec"]}
+        built_spec = build_assets(inputs["site_spec"], build_options)
+        print_size_table(inputs["site_spec"], built_spec, build_options.precompress)
+        return {"built_spec": built_spec}
+
+    pipeline.add("build", blocking(build), inputs=["site_spec"], outputs=["built_spec"], fingerprint=by_inputs)
+
+    def write(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        written = write_website_files(
+            inputs["built_spec"],
+            args.output_dir,
+            hashed_assets=args.hashed_assets,
+            precompress=build_options.precompress,
+        )
+        return {"written": written}
+
+    pipeline.add("write", blocking(write), inputs=["built_spec"], outputs=["written"])
+    return pipeline
+
+
+def _checkpoint_image(checkpoint: CheckpointStore, image_spec: ImageSpec, future: Future):
+    """
+    Done-callback of an image job: saves the finished image to the checkpoint.
+    """
+    if future.cancelled() or future.exception() is not None or not future.result():
+        return
+    try:
+        checkpoint.save_image(image_spec, Path(future.result()))
+    except OSError as e:
+        print(f"Could not checkpoint image '{image_spec.filename}': {e}")
@@ -0,0 +1,163 @@
+# webapp/services/tracing.py
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Beyond this many events the trace file stops growing; the summary keeps counting
+MAX_EVENTS = 200_000
+
+# Name of the timeline row the current code belongs to (a pipeline stage, a batch job, ...)
+_current_track: ContextVar[Optional[str]] = ContextVar("current_track", default=None)
+
+
+class Tracer:
+    """
+    Collects spans (named, timed sections of work) and counters for one
+    process. Spans become complete ("X") events and counters "C" events of
+    a Chrome trace, which chrome://tracing and https://ui.perfetto.dev open.
+
+    Each span is drawn on a row per (track, thread), so stages running
+    concurrently on the event loop, and the worker threads they use, do
+    not overlap on one row.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self.spans: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+        self._rows: Dict[Tuple[Optional[str], int], int] = {}
+        self._lock = threading.Lock()
+
+    def _micros(self, seconds: float) -> float:
+        return round((seconds - self.origin) * 1_000_000, 1)
+
+    def _row(self) -> int:
+        # Called with the lock held
+        key = (_current_track.get(), threading.get_ident())
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = len(self._rows) + 1
+            thread = threading.current_thread()
+            label = key[0] or thread.name
+            if key[0] and thread is not threading.main_thread():
+                label = f"{key[0]} ({thread.name})"
+            self.events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": row, "args": {"name": label}})
+        return row
+
+    def _append(self, event: Dict[str, Any]):
+        # Called with the lock held
+        if len(self.events) >= MAX_EVENTS:
+            self.dropped += 1
+            return
+        event["pid"] = self.pid
+        event["tid"] = self._row()
+        self.events.append(event)
+
+    def add_span(self, name: str, category: str, start: float, end: float, args: Dict[str, Any]):
+        with self._lock:
+            stats = self.spans.setdefault((category, name), {"calls": 0, "seconds": 0.0, "max": 0.0})
+            stats["calls"] += 1
+            stats["seconds"] += end - start
+            stats["max"] = max(stats["max"], end - start)
+            self._append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": self._micros(start),
+                "dur": round((end - start) * 1_000_000, 1),
+                "args": args,
+            })
+
+    def count(self, name: str, amount: float = 1):
+        with self._lock:
+            total = self.counters[name] = self.counters.get(name, 0) + amount
+            self._append({"name": name, "ph": "C", "ts": self._micros(time.perf_counter()), "args": {"value": total}})
+
+    def write(self, path: Path):
+        """
+        Writes the events collected so far as a Chrome trace (JSON object format).
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            trace = {
+                "traceEvents": list(self.events),
+                "displayTimeUnit": "ms",
+                "otherData": {"counters": dict(self.counters), "dropped_events": self.dropped},
+            }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f)
+
+    def print_summary(self):
+        """
+        Prints the calls made (everything but pipeline stages, which
+        Pipeline.print_timings already shows) and the counters.
+        """
+        with self._lock:
+            spans = {key: dict(stats) for key, stats in self.spans.items() if key[0] != "stage"}
+            counters = dict(self.counters)
+        if not spans and not counters:
+            return
+        if spans:
+            print("\nCalls:")
+            print(f"  {'span':<32}{'calls':>8}{'total s':>10}{'avg s':>10}{'max s':>10}")
+            for (category, name), stats in sorted(spans.items(), key=lambda item: -item[1]["seconds"]):
+                average = stats["seconds"] / stats["calls"]
+                print(f"  {name:<32}{stats['calls']:>8}{stats['seconds']:>10.2f}{average:>10.2f}{stats['max']:>10.2f}")
+        if counters:
+            print("\nCounters:")
+            for name, value in sorted(counters.items()):
+                print(f"  {name:<32}{value:>16,.0f}")
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+@contextmanager
+def span(name: str, category: str = "call", **args) -> Iterator[Dict[str, Any]]:
+    """
+    Times the block as one span. The yielded dict is stored with the span,
+    so the block can add what it learned (bytes, tokens, cache hit, ...).
+    A span that ends with an exception records the exception type.
+    """
+    start = time.perf_counter()
+    try:
+        yield args
+    except BaseException as e:
+        args["error"] = type(e).__name__
+        raise
+    finally:
+        _tracer.add_span(name, category, start, time.perf_counter(), args)
+
+
+@contextmanager
+def track(name: str) -> Iterator[None]:
+    """
+    Draws the spans made inside the block (and in threads started with a copy
+    of this context) on their own timeline row named after the block.
+    """
+    token = _current_track.set(name)
+    try:
+        yield
+    finally:
+        _current_track.reset(token)
+
+
+def count(name: str, amount: float = 1):
+    """
+    Adds amount to a named counter (e.g. "chat.prompt_tokens").
+    """
+    _tracer.count(name, amount)
@@ -0,0 +1,39 @@
+# webapp/services/usage.py
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+# Token counts of the job currently running in this context (None when not tracking)
+_current_usage: ContextVar[Optional[Dict[str, int]]] = ContextVar("current_usage", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[Dict[str, int]]:
+    """
+    Collects the token usage of every chat completion made inside the block
+    (including from threads started with a copy of this context) into the
+    yielded dict. Each asyncio task has its own context, so concurrent batch
+    jobs get separate totals.
+    """
+    totals = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    token = _current_usage.set(totals)
+    try:
+        yield totals
+    finally:
+        _current_usage.reset(token)
+
+
+def record_usage(usage) -> None:
+    """
+    Adds a completion's `usage` object to the current totals, if any are being tracked.
+    """
+    totals = _current_usage.get()
+    if totals is None:
+        return
+    totals["requests"] += 1
+    if usage is None:
+        return
+    totals["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+    totals["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+    totals["total_tokens"] += getattr(usage, "total_tokens", 0) or 0
@@ -0,0 +1,136 @@
+# webapp/services/watcher.py
+
+import os
+import time
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from generators.image_generator import ImageJobPool, STAGING_DIRNAME
+from services.completion_cache import CompletionCache
+from services.file_manager import MANIFEST_FILENAME
+from services.image_optimizer import ImageOptimizer
+from services.pipeline import Memo
+from services.preview_server import PreviewServer
+from services.site_pipeline import build_site_pipeline
+from services.tracing import get_tracer
+
+FileState = Dict[str, Tuple[int, int]]
+# Changed files named in a rebuild summary; the rest are counted
+MAX_LISTED = 8
+
+
+def _stat(paths: List[Path]) -> Dict[Path, Optional[Tuple[int, int]]]:
+    state = {}
+    for path in paths:
+        try:
+            stat = path.stat()
+            state[path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            state[path] = None
+    return state
+
+
+def _snapshot(root: Path) -> FileState:
+    """
+    (mtime, size) of every file of a built site, to tell which ones a rebuild changed.
+    """
+    files: FileState = {}
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if name != STAGING_DIRNAME]
+        for filename in filenames:
+            if filename == MANIFEST_FILENAME:
+                continue
+            path = Path(directory) / filename
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files[path.relative_to(root).as_posix()] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def _changed_files(before: FileState, after: FileState) -> List[str]:
+    return sorted(name for name in set(before) | set(after) if before.get(name) != after.get(name))
+
+
+def watch_site(
+    args,
+    completion_cache: Optional[CompletionCache],
+    image_pool: Optional[ImageJobPool],
+    optimizer: Optional[ImageOptimizer] = None,
+) -> int:
+    """
+    Builds the site, then rebuilds it whenever the spec file or the details
+    file changes (checked by polling every args.watch_interval seconds),
+    until Ctrl+C. Rebuilds share one pipeline memo, image pool and optimizer,
+    so only the work an edit affects is redone (see build_site_pipeline).
+    Unless --no-preview is set, the site is served with live reload.
+
+    A failed rebuild (e.g. a spec file saved halfway through an edit) is
+    reported and the watch goes on.
+    """
+    watched = [path for path in (args.spec_file, args.details_file) if path is not None]
+    memo: Memo = {}
+    builds = 0
+
+    preview = None
+    if not args.no_preview:
+        preview = PreviewServer(args.output_dir, args.preview_host, args.preview_port)
+        preview.start()
+
+    def rebuild():
+        nonlocal builds
+        if args.details_file is not None:
+            args.details = args.details_file.read_text(encoding="utf-8")
+        before = _snapshot(args.output_dir)
+        start = time.perf_counter()
+        pipeline = build_site_pipeline(args, completion_cache, image_pool, None, optimizer, memo=memo)
+        try:
+            asyncio.run(pipeline.run())
+        except Exception as e:
+            print(f"\nRebuild failed: {type(e).__name__}: {e}")
+            print("Waiting for the next change...")
+            return
+        pipeline.print_timings()
+        changed = _changed_files(before, _snapshot(args.output_dir))
+        reran = [stage.name for stage in pipeline.stages if stage.fingerprint is not None and stage.name not in pipeline.reused]
+        listed = ", ".join(changed[:MAX_LISTED]) + (f" and {len(changed) - MAX_LISTED} more" if len(changed) > MAX_LISTED else "")
+        print(
+            f"\n{'Rebuilt' if builds else 'Built'} in {time.perf_counter() - start:.2f}s "
+            f"(reused {len(pipeline.reused)} stage(s){', reran ' + ', '.join(reran) if reran else ''}); "
+            f"{len(changed)} file(s) changed{': ' + listed if changed else ''}."
+        )
+        builds += 1
+        if preview is not None and changed:
+            preview.notify(changed)
+
+    rebuild()
+    get_tracer().print_summary()
+    if preview is not None:
+        print(f"\nPreview with live reload: {preview.url}")
+    print(f"Watching {', '.join(path.as_posix() for path in watched)} for changes (Ctrl+C to stop)...")
+
+    state = _stat(watched)
+    try:
+        while True:
+            time.sleep(args.watch_interval)
+            current = _stat(watched)
+            if current == state:
+                continue
+            # Wait until the files stop changing, as editors often save in steps
+            while True:
+                time.sleep(args.watch_interval)
+                settled = _stat(watched)
+                if settled == current:
+                    break
+                current = settled
+            state = current
+            print(f"\nChange detected in {', '.join(path.as_posix() for path in watched)}; rebuilding...")
+            rebuild()
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        if preview is not None:
+            preview.shutdown()
+    return 0
@@ -0,0 +1,9 @@
+# webapp/tests/conftest.py
+
+import sys
+from pathlib import Path
+
+# The modules import each other from the repository root (as main.py does)
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
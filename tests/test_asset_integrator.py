@@ -0,0 +1,88 @@
+# webapp/tests/test_asset_integrator.py
+
+from pathlib import Path
+
+import pytest
+
+from generators.website_generator import WebsiteSpec
+from integrators.asset_integrator import integrate_images
+
+SAVED = {"hero.png": "site/images/hero.png", "hero-large.png": "site/images/hero-large.png"}
+
+
+def integrate(html: str = "", css: str = "", js: str = ""):
+    spec = WebsiteSpec(html=html, css=css, js=js, images=[])
+    return integrate_images(spec, SAVED, site_root=Path("site"))
+
+
+@pytest.mark.parametrize("html, expected", [
+    ('<img src="hero.png">', '<img src="images/hero.png">'),
+    ("<img src='./img/hero.png'>", "<img src='images/hero.png'>"),
+    ("<img src=hero.png alt=x>", "<img src=images/hero.png alt=x>"),
+    ('<a href="/assets/hero.png">', '<a href="images/hero.png">'),
+    ('<video poster="hero.png">', '<video poster="images/hero.png">'),
+    ('<img src="{{ images/hero.png }}">', '<img src="images/hero.png">'),
+    ('<img srcset="hero.png 1x, hero-large.png 2x">', '<img srcset="images/hero.png 1x, images/hero-large.png 2x">'),
+    ('<div style="background: url(\'hero.png\')">', '<div style="background: url(\'images/hero.png\')">'),
+    ("<style>.a { background: url(hero.png); }</style>", "<style>.a { background: url(images/hero.png); }</style>"),
+    ("<script>img.src = 'hero.png';</script>", "<script>img.src = 'images/hero.png';</script>"),
+    ("<p>{{hero.png}}</p>", "<p>images/hero.png</p>"),
+    ('<meta property="og:image" content="hero.png">', '<meta property="og:image" content="images/hero.png">'),
+])
+def test_html_references_are_rewritten(html, expected):
+    updated, report = integrate(html=html)
+    assert updated.html == expected
+    assert report.rewritten["html"]
+
+
+@pytest.mark.parametrize("html", [
+    "<p>see hero.png here</p>",
+    "<p>The file is called hero.png, as in\nhero.png.</p>",
+    '<img src="photo.jpg" alt="hero.png">',
+    '<img src="photo.jpg" title=hero.png>',
+    '<div content="hero.png"></div>',
+    '<meta name="description" content="A page about hero.png">',
+    '<a href="https://example.com/hero.png">',
+    '<img src="superhero.png">',
+    "<script>console.log('uploading hero.png now');</script>",
+    "<style>.a::after { content: 'hero.png'; }</style>",
+])
+def test_other_mentions_are_left_alone(html):
+    updated, report = integrate(html=html)
+    assert updated.html == html
+    assert report.rewritten["html"] == {}
+    assert report.unreferenced == sorted(SAVED)
+
+
+def test_css_rewrites_only_urls():
+    css = ".a { background: url(\"images/hero.png\"); }\n.b::after { content: \"hero.png\"; }"
+    updated, report = integrate(css=css)
+    assert updated.css == ".a { background: url(\"images/hero.png\"); }\n.b::after { content: \"hero.png\"; }"
+    assert report.rewritten["css"] == {"hero.png": 1}
+
+
+def test_js_rewrites_whole_strings_and_urls():
+    js = "a.src = `hero.png`; b.style.backgroundImage = 'url(hero-large.png)'; alert(\"hero.png loaded\");"
+    updated, report = integrate(js=js)
+    assert updated.js == (
+        "a.src = `images/hero.png`; b.style.backgroundImage = 'url(images/hero-large.png)'; alert(\"hero.png loaded\");"
+    )
+    assert report.rewritten["js"] == {"hero.png": 1, "hero-large.png": 1}
+
+
+def test_a_quoted_greater_than_sign_does_not_end_the_tag():
+    html = '<img data-caption="a > b" src="hero.png">'
+    updated, _ = integrate(html=html)
+    assert updated.html == '<img data-caption="a > b" src="images/hero.png">'
+
+
+def test_rewriting_twice_changes_nothing():
+    html = '<img src="hero.png" srcset="hero-large.png 2x"><style>.a{background:url(hero.png)}</style>'
+    once, _ = integrate(html=html)
+    twice, _ = integrate(html=once.html)
+    assert twice.html == once.html
+
+
+def test_unreferenced_images_are_reported():
+    _, report = integrate(html='<img src="hero.png">')
+    assert report.unreferenced == ["hero-large.png"]
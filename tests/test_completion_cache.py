@@ -0,0 +1,97 @@
+# webapp/tests/test_completion_cache.py
+
+import os
+import json
+
+from pydantic import BaseModel
+
+from services import completion_cache
+from services.completion_cache import CompletionCache, completion_cache_key
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class OtherAnswer(BaseModel):
+    value: int
+
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+def test_key_depends_on_model_messages_and_schema():
+    key = completion_cache_key("gpt-4o", MESSAGES, Answer)
+    assert key == completion_cache_key("gpt-4o", [dict(message) for message in MESSAGES], Answer)
+    assert key != completion_cache_key("gpt-4o-mini", MESSAGES, Answer)
+    assert key != completion_cache_key("gpt-4o", [{"role": "user", "content": "Hello!"}], Answer)
+    assert key != completion_cache_key("gpt-4o", MESSAGES, OtherAnswer)
+
+
+def test_put_then_get(tmp_path):
+    cache = CompletionCache(tmp_path)
+    assert cache.get("abc") is None
+    cache.put("abc", '{"text": "hi"}', model="gpt-4o")
+    assert cache.get("abc") == '{"text": "hi"}'
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_expired_entries_are_misses(tmp_path, monkeypatch):
+    cache = CompletionCache(tmp_path, ttl_seconds=60)
+    now = 1_000_000.0
+    monkeypatch.setattr(completion_cache.time, "time", lambda: now)
+    cache.put("abc", "{}")
+    now += 61
+    assert cache.get("abc") is None
+    assert not (tmp_path / "abc.json").exists()
+
+
+def test_replay_serves_expired_entries(tmp_path, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(completion_cache.time, "time", lambda: now)
+    CompletionCache(tmp_path, ttl_seconds=60).put("abc", "{}")
+    now += 3600
+    assert CompletionCache(tmp_path, ttl_seconds=60, replay=True).get("abc") == "{}"
+
+
+def test_no_ttl_never_expires(tmp_path, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(completion_cache.time, "time", lambda: now)
+    cache = CompletionCache(tmp_path, ttl_seconds=None)
+    cache.put("abc", "{}")
+    now += 10 * 365 * 24 * 3600
+    assert cache.get("abc") == "{}"
+
+
+def entry_size(tmp_path, key: str) -> int:
+    return (tmp_path / f"{key}.json").stat().st_size
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = CompletionCache(tmp_path, max_bytes=10_000)
+    payload = json.dumps("x" * 100)
+    for age, key in enumerate(["old", "middle", "new"]):
+        cache.put(key, payload)
+        # Older entries get older mtimes
+        os.utime(tmp_path / f"{key}.json", (1000 + age, 1000 + age))
+    # Reading "old" makes it the most recently used
+    assert cache.get("old") == payload
+    cache.max_bytes = 3 * entry_size(tmp_path, "old")
+    cache.put("newest", payload)
+    assert cache.get("middle") is None
+    assert cache.get("old") == payload
+    assert cache.get("new") == payload
+    assert cache.get("newest") == payload
+
+
+def test_entry_larger_than_the_budget_is_kept(tmp_path):
+    cache = CompletionCache(tmp_path, max_bytes=10)
+    cache.put("big", json.dumps("x" * 100))
+    assert cache.get("big") is not None
+
+
+def test_unreadable_entry_is_dropped(tmp_path):
+    cache = CompletionCache(tmp_path)
+    (tmp_path / "bad.json").write_text("{not json", encoding="utf-8")
+    assert cache.get("bad") is None
+    assert not (tmp_path / "bad.json").exists()
@@ -0,0 +1,113 @@
+# webapp/tests/test_file_manager.py
+
+import gzip
+
+import pytest
+
+from generators.website_generator import WebsiteSpec
+from services.file_manager import (
+    MANIFEST_FILENAME,
+    atomic_write_bytes,
+    load_manifest,
+    site_relative,
+    write_website_file,
+    write_website_files,
+)
+
+HTML = '<html><head><link rel="stylesheet" href="./styles.css"></head><body><script src="main.js"></script></body></html>'
+
+
+def spec(css: str = "body { margin: 0; }", js: str = "console.log(1);", html: str = HTML) -> WebsiteSpec:
+    return WebsiteSpec(html=html, css=css, js=js, images=[])
+
+
+def names(paths):
+    return sorted(path.name for path in paths)
+
+
+def test_first_write_writes_everything_and_records_it(tmp_path):
+    written = write_website_files(spec(), tmp_path)
+    assert names(written) == ["index.html", "main.js", "styles.css"]
+    manifest = load_manifest(tmp_path)
+    assert sorted(manifest) == ["index.html", "main.js", "styles.css"]
+    assert manifest["styles.css"]["size"] == len("body { margin: 0; }")
+
+
+def test_unchanged_files_are_not_rewritten(tmp_path):
+    write_website_files(spec(), tmp_path)
+    mtime = (tmp_path / "index.html").stat().st_mtime_ns
+    written = write_website_files(spec(css="body { margin: 1px; }"), tmp_path)
+    assert names(written) == ["styles.css"]
+    assert (tmp_path / "index.html").stat().st_mtime_ns == mtime
+
+
+def test_a_file_edited_on_disk_is_rewritten(tmp_path):
+    write_website_files(spec(), tmp_path)
+    (tmp_path / "main.js").write_text("tampered", encoding="utf-8")
+    written = write_website_files(spec(), tmp_path)
+    assert names(written) == ["main.js"]
+    assert (tmp_path / "main.js").read_text(encoding="utf-8") == "console.log(1);"
+
+
+def test_a_touched_but_identical_file_is_kept(tmp_path):
+    write_website_files(spec(), tmp_path)
+    (tmp_path / "main.js").write_text("console.log(1);", encoding="utf-8")
+    assert write_website_files(spec(), tmp_path) == []
+
+
+def test_hashed_assets_are_linked_and_old_names_removed(tmp_path):
+    write_website_files(spec(), tmp_path)
+    write_website_files(spec(), tmp_path, hashed_assets=True)
+    files = sorted(path.name for path in tmp_path.iterdir() if path.name != MANIFEST_FILENAME)
+    assert len(files) == 3 and "styles.css" not in files and "main.js" not in files
+    css_name = next(name for name in files if name.startswith("styles."))
+    js_name = next(name for name in files if name.startswith("main."))
+    html = (tmp_path / "index.html").read_text(encoding="utf-8")
+    assert f'href="{css_name}"' in html and f'src="{js_name}"' in html
+
+    # A new stylesheet gets a new name, and the old one goes away
+    write_website_files(spec(css="body { margin: 2px; }"), tmp_path, hashed_assets=True)
+    assert not (tmp_path / css_name).exists()
+    assert (tmp_path / js_name).exists()
+
+
+def test_precompressed_siblings_are_tracked(tmp_path):
+    write_website_files(spec(), tmp_path, precompress=True)
+    assert gzip.decompress((tmp_path / "styles.css.gz").read_bytes()) == b"body { margin: 0; }"
+    assert "styles.css.gz" in load_manifest(tmp_path)
+    write_website_files(spec(), tmp_path)
+    assert not (tmp_path / "styles.css.gz").exists()
+
+
+def test_drafts_are_replaced_by_the_final_write(tmp_path):
+    write_website_file(tmp_path, "css", "draft")
+    assert "styles.css" in load_manifest(tmp_path)
+    write_website_files(spec(), tmp_path, hashed_assets=True)
+    assert not (tmp_path / "styles.css").exists()
+
+
+def test_atomic_write_keeps_the_mode_and_leaves_no_temp_files(tmp_path):
+    path = tmp_path / "sub" / "file.txt"
+    atomic_write_bytes(path, b"one")
+    assert path.stat().st_mode & 0o777 == 0o644
+    path.chmod(0o600)
+    atomic_write_bytes(path, b"two")
+    assert path.read_bytes() == b"two"
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert [p.name for p in path.parent.iterdir()] == ["file.txt"]
+
+
+def test_unreadable_manifest_counts_as_empty(tmp_path):
+    (tmp_path / MANIFEST_FILENAME).write_text("{oops", encoding="utf-8")
+    assert load_manifest(tmp_path) == {}
+
+
+@pytest.mark.parametrize("reference, expected", [
+    ("styles.css", "styles.css"),
+    ("./styles.css", "styles.css"),
+    ("css/../styles.css", "styles.css"),
+    ("../styles.css", "../styles.css"),
+    ("/styles.css", "/styles.css"),
+])
+def test_site_relative(reference, expected):
+    assert site_relative(reference) == expected
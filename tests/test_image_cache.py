@@ -0,0 +1,111 @@
+# webapp/tests/test_image_cache.py
+
+import os
+import json
+
+from services import image_cache
+from services.image_cache import INDEX_FILENAME, ImageCache, image_cache_key
+
+
+def image(tmp_path, name: str, size: int = 100) -> "os.PathLike":
+    path = tmp_path / "source" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(name.encode("utf-8").ljust(size, b"."))
+    return path
+
+
+def test_key_depends_on_every_setting():
+    key = image_cache_key("dall-e-3", "a cat", "1024x1024", "standard")
+    assert key == image_cache_key("dall-e-3", "a cat", "1024x1024", "standard")
+    assert len({
+        key,
+        image_cache_key("dall-e-2", "a cat", "1024x1024", "standard"),
+        image_cache_key("dall-e-3", "a dog", "1024x1024", "standard"),
+        image_cache_key("dall-e-3", "a cat", "1792x1024", "standard"),
+        image_cache_key("dall-e-3", "a cat", "1024x1024", "hd"),
+    }) == 5
+
+
+def test_put_then_get(tmp_path):
+    cache = ImageCache(tmp_path / "cache")
+    source = image(tmp_path, "cat.png")
+    cached = cache.put("k1", source)
+    assert cached == tmp_path / "cache" / "k1.png"
+    assert cache.get("k1") == cached
+    assert cached.read_bytes() == source.read_bytes()
+    assert cache.get("missing") is None
+    assert not list((tmp_path / "cache").glob("*.tmp"))
+
+
+def test_cached_files_keep_the_source_permissions(tmp_path):
+    source = image(tmp_path, "cat.png")
+    os.chmod(source, 0o644)
+    cached = ImageCache(tmp_path / "cache").put("k1", source)
+    assert cached.stat().st_mode & 0o777 == 0o644
+
+
+def test_index_survives_a_restart_and_forgets_removed_files(tmp_path):
+    cache = ImageCache(tmp_path / "cache")
+    cache.put("k1", image(tmp_path, "a.png"))
+    cache.put("k2", image(tmp_path, "b.png"))
+    (tmp_path / "cache" / "k2.png").unlink()
+    reopened = ImageCache(tmp_path / "cache")
+    assert reopened.get("k1") is not None
+    assert reopened.get("k2") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(image_cache.time, "time", lambda: now)
+    cache = ImageCache(tmp_path / "cache", max_bytes=300)
+    for key in ("old", "middle", "new"):
+        cache.put(key, image(tmp_path, f"{key}.png"))
+        now += 1
+    now += 1
+    assert cache.get("old") is not None  # now the most recently used
+    cache.put("newest", image(tmp_path, "newest.png"))
+    assert cache.get("middle") is None
+    assert not (tmp_path / "cache" / "middle.png").exists()
+    assert all(cache.get(key) is not None for key in ("old", "new", "newest"))
+
+
+def test_file_larger_than_the_budget_is_not_cached(tmp_path):
+    cache = ImageCache(tmp_path / "cache", max_bytes=50)
+    assert cache.put("big", image(tmp_path, "big.png", size=100)) is None
+    assert cache.get("big") is None
+
+
+def test_hits_are_saved_in_batches_and_on_flush(tmp_path, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(image_cache.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(image_cache.time, "time", lambda: 5000.0 + clock[0])
+    cache = ImageCache(tmp_path / "cache")
+    cache.put("k1", image(tmp_path, "a.png"))
+
+    def saved_last_used() -> float:
+        with open(tmp_path / "cache" / INDEX_FILENAME, "r", encoding="utf-8") as f:
+            return json.load(f)["k1"]["last_used"]
+
+    clock[0] = 1.0
+    cache.get("k1")
+    assert saved_last_used() == 5000.0  # not written yet
+    clock[0] = 1.0 + image_cache.SAVE_INTERVAL
+    cache.get("k1")
+    assert saved_last_used() == 5000.0 + clock[0]
+    clock[0] += 1
+    cache.get("k1")
+    cache.flush()
+    assert saved_last_used() == 5000.0 + clock[0]
+
+
+def test_link_into_replaces_the_destination_without_writing_through_it(tmp_path):
+    cache = ImageCache(tmp_path / "cache")
+    cache.put("cat", image(tmp_path, "cat.png"))
+    cache.put("dog", image(tmp_path, "dog.png"))
+    dest = tmp_path / "site" / "images" / "pet.png"
+    assert cache.link_into("cat", dest) == dest
+    # dest may now be a hard link to the cat entry; relinking must not overwrite it
+    cache.link_into("dog", dest)
+    assert dest.read_bytes() == (tmp_path / "cache" / "dog.png").read_bytes()
+    assert (tmp_path / "cache" / "cat.png").read_bytes().startswith(b"cat.png")
+    assert cache.link_into("missing", tmp_path / "other.png") is None
@@ -0,0 +1,134 @@
+# webapp/tests/test_job_queue.py
+
+import threading
+
+import pytest
+
+from services.job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(tmp_path / "queue.db")
+    yield queue
+    queue.close()
+
+
+def test_jobs_are_claimed_oldest_first(queue):
+    first = queue.enqueue("generate", {"details": "one"})
+    second = queue.enqueue("generate", {"details": "two"})
+    assert first["status"] == "queued"
+    claimed = queue.claim_next()
+    assert claimed["id"] == first["id"]
+    assert claimed["status"] == "running"
+    assert claimed["attempts"] == 1
+    assert queue.claim_next()["id"] == second["id"]
+    assert queue.claim_next() is None
+
+
+def test_enqueue_with_a_given_id(queue):
+    job = queue.enqueue("refine", {"spec_file": "x.json"}, job_id="job-1")
+    assert job["id"] == "job-1"
+    assert queue.get("job-1")["payload"] == {"spec_file": "x.json"}
+
+
+def test_a_job_is_claimed_by_one_worker_only(queue):
+    for number in range(20):
+        queue.enqueue("generate", {"n": number})
+    claimed, lock = [], threading.Lock()
+
+    def worker():
+        while True:
+            job = queue.claim_next()
+            if job is None:
+                return
+            with lock:
+                claimed.append(job["id"])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(claimed) == len(set(claimed)) == 20
+
+
+def test_finish_stores_the_result(queue):
+    job = queue.enqueue("generate", {})
+    queue.claim_next()
+    queue.set_step(job["id"], "images")
+    assert queue.get(job["id"])["step"] == "images"
+    queue.finish(job["id"], "done", result={"status": "ok"})
+    done = queue.get(job["id"])
+    assert done["status"] == "done"
+    assert done["result"] == {"status": "ok"}
+    assert done["finished_at"] is not None
+    with pytest.raises(ValueError):
+        queue.finish(job["id"], "running")
+
+
+def test_steps_are_only_recorded_while_running(queue):
+    job = queue.enqueue("generate", {})
+    queue.set_step(job["id"], "spec")
+    assert queue.get(job["id"])["step"] is None
+
+
+def test_cancel_a_queued_job(queue):
+    job = queue.enqueue("generate", {})
+    cancelled = queue.request_cancel(job["id"])
+    assert cancelled["status"] == "cancelled"
+    assert queue.claim_next() is None
+
+
+def test_cancel_a_running_job_flags_it(queue):
+    job = queue.enqueue("generate", {})
+    queue.claim_next()
+    flagged = queue.request_cancel(job["id"])
+    assert flagged["status"] == "running"
+    assert flagged["cancel_requested"] is True
+    assert queue.cancel_requested() == [job["id"]]
+    queue.finish(job["id"], "cancelled")
+    assert queue.cancel_requested() == []
+
+
+def test_finished_jobs_cannot_be_cancelled(queue):
+    job = queue.enqueue("generate", {})
+    queue.claim_next()
+    queue.finish(job["id"], "done")
+    assert queue.request_cancel(job["id"])["status"] == "done"
+    assert queue.request_cancel("no-such-job") is None
+
+
+def test_requeue_keeps_the_place_in_the_queue(queue):
+    first = queue.enqueue("generate", {})
+    queue.claim_next()
+    queue.enqueue("generate", {})
+    queue.requeue(first["id"])
+    again = queue.claim_next()
+    assert again["id"] == first["id"]
+    assert again["attempts"] == 2
+
+
+def test_running_jobs_are_recovered_after_a_restart(tmp_path):
+    queue = JobQueue(tmp_path / "queue.db")
+    job = queue.enqueue("generate", {"details": "x"})
+    queue.claim_next()
+    queue.close()
+
+    reopened = JobQueue(tmp_path / "queue.db")
+    try:
+        assert reopened.recover() == 1
+        assert reopened.get(job["id"])["status"] == "queued"
+        assert reopened.claim_next()["payload"] == {"details": "x"}
+    finally:
+        reopened.close()
+
+
+def test_list_and_counts(queue):
+    ids = [queue.enqueue("generate", {"n": n}, job_id=f"job-{n}")["id"] for n in range(3)]
+    queue.claim_next()
+    assert [job["id"] for job in queue.list()] == list(reversed(ids))
+    assert [job["id"] for job in queue.list("queued")] == ["job-2", "job-1"]
+    assert len(queue.list(limit=1)) == 1
+    counts = queue.counts()
+    assert counts["queued"] == 2 and counts["running"] == 1 and counts["done"] == 0
@@ -0,0 +1,75 @@
+# webapp/tests/test_json_stream.py
+
+import json
+
+import pytest
+
+from services.json_stream import IncrementalJsonObjectParser
+
+DOCUMENT = {
+    "images": [
+        {"filename": "images/hero.png", "prompt": "a \"quoted\" prompt, with {braces} and [brackets]"},
+        {"filename": "images/café.png", "prompt": "back\\slash ☃ and a newline\n"},
+    ],
+    "html": "<p class=\"a\">{{hero.png}}</p>",
+    "css": "a { color: red; }",
+    "count": 12.5,
+    "ok": True,
+    "missing": None,
+    "tags": ["one", 2, False, {"nested": [1, 2]}],
+    "meta": {"a": {"b": [1, {"c": "}"}]}},
+}
+
+
+def parse(text: str, chunk_size: int):
+    events = []
+    parser = IncrementalJsonObjectParser(
+        on_field=lambda key, value: events.append(("field", key, value)),
+        on_item=lambda key, item: events.append(("item", key, item)),
+    )
+    for start in range(0, len(text), chunk_size):
+        parser.feed(text[start:start + chunk_size])
+    return parser, events
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 100_000])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_fields_and_items_match_json_loads(chunk_size, indent):
+    text = json.dumps(DOCUMENT, indent=indent, ensure_ascii=chunk_size % 2 == 0)
+    parser, events = parse(text, chunk_size)
+    assert parser.done
+    fields = {key: value for kind, key, value in events if kind == "field"}
+    assert fields == DOCUMENT
+    assert [key for kind, key, _ in events if kind == "field"] == list(DOCUMENT)
+    assert [item for kind, key, item in events if kind == "item" and key == "images"] == DOCUMENT["images"]
+    assert [item for kind, key, item in events if kind == "item" and key == "tags"] == DOCUMENT["tags"]
+
+
+def test_each_item_is_reported_as_soon_as_it_is_complete():
+    text = json.dumps({"images": [{"filename": "a.png"}, {"filename": "b.png"}], "html": "<p></p>"})
+    first_end = text.index("}") + 1
+    parser, events = parse(text[:first_end], 1)
+    assert events == [("item", "images", {"filename": "a.png"})]
+    assert not parser.done
+
+
+def test_scalar_field_ends_at_the_next_comma_or_brace():
+    parser, events = parse('{"a": 1', 1)
+    assert events == []
+    parser.feed("0, ")
+    assert events == [("field", "a", 10)]
+    parser.feed('"b": true}')
+    assert events[-1] == ("field", "b", True)
+    assert parser.done
+
+
+def test_text_after_the_object_is_ignored():
+    parser, events = parse('{"a": "x"} trailing', 4)
+    assert parser.done
+    assert events == [("field", "a", "x")]
+
+
+def test_buffer_only_holds_the_current_value():
+    parser = IncrementalJsonObjectParser()
+    parser.feed('{"a": "' + "x" * 1000 + '", "b": ')
+    assert len(parser._text) < 20
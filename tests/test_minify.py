@@ -0,0 +1,52 @@
+# webapp/tests/test_minify.py
+
+from services.minify import minify_css, minify_html, minify_js
+
+
+def test_css_drops_comments_and_the_last_semicolon():
+    assert minify_css("/* header */\n.a {\n  color: red;\n  margin: 0;\n}\n") == ".a{color:red;margin:0}"
+
+
+def test_css_keeps_strings_urls_and_meaningful_spaces():
+    css = '.a :hover { width: calc(1px + 2px); content: "a  b"; background: url( x.png ); }'
+    assert minify_css(css) == '.a :hover{width:calc(1px + 2px);content:"a  b";background:url( x.png )}'
+
+
+def test_js_keeps_line_breaks_for_semicolon_insertion():
+    assert minify_js("let a = 1\nlet b = 2  // two\n") == "let a=1\nlet b=2"
+
+
+def test_js_keeps_strings_templates_and_regexes():
+    js = "const r = /a  b/g; const s = `x  ${a}`; const t = 'y  z';"
+    assert minify_js(js) == "const r=/a  b/g;const s=`x  ${a}`;const t='y  z';"
+
+
+def test_js_keeps_unary_operators_apart():
+    assert minify_js("x = a + +b - -c;") == "x=a+ +b- -c;"
+
+
+def test_js_division_is_not_a_regex():
+    assert minify_js("x = a / 2 / b; // c") == "x=a/2/b;"
+
+
+def test_html_collapses_whitespace_and_drops_comments():
+    html = "<!-- note --><div>\n  <p> a  <b>b</b>  <i>c</i> </p>\n</div>"
+    assert minify_html(html) == "<div><p>a <b>b</b> <i>c</i></p></div>"
+
+
+def test_html_keeps_pre_and_conditional_comments():
+    html = "<pre>  x\n y</pre>\n<!--[if IE]>x<![endif]-->"
+    assert minify_html(html) == html.replace("\n<!--", "<!--")
+
+
+def test_html_minifies_inline_styles_and_scripts_only_when_they_are_code():
+    html = (
+        "<style> .a { margin : 0 ; } </style>"
+        "<script> var  x = 1 ; </script>"
+        '<script type="text/template"> a  b </script>'
+    )
+    assert minify_html(html) == (
+        "<style>.a{margin :0}</style>"
+        "<script>var x=1;</script>"
+        '<script type="text/template"> a  b </script>'
+    )
@@ -0,0 +1,118 @@
+# webapp/tests/test_page_hints.py
+
+import json
+from pathlib import Path
+
+import pytest
+
+from generators.website_generator import WebsiteSpec
+from integrators.page_hints import add_page_hints
+from services.html_dom import parse_html
+from services.image_size import read_image_size
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SITE_ROOT = REPO_ROOT / "output_website"
+
+# Bundled sample spec -> (hero image, images below the fold, local script)
+SAMPLES = {
+    "website_spec.json": (
+        "images/hero_grandmother.jpg",
+        ["images/memorable_moment1.jpg", "images/memorable_moment2.jpg"],
+        "script.js",
+    ),
+    "refined_website_spec.json": (
+        "images/grandma-smiling.png",
+        ["images/wedding-day.png", "images/family-reunion.png", "images/business-launch.png"],
+        "scripts.js",
+    ),
+}
+
+
+def load_sample(name: str) -> WebsiteSpec:
+    with open(REPO_ROOT / name, "r", encoding="utf-8") as f:
+        return WebsiteSpec(**json.load(f))
+
+
+@pytest.fixture(params=sorted(SAMPLES))
+def sample(request):
+    spec = load_sample(request.param)
+    updated, report = add_page_hints(spec, site_root=SITE_ROOT)
+    return SAMPLES[request.param], spec, updated, report
+
+
+def images_by_src(html: str):
+    return {img.get("src"): img for img in parse_html(html).find_all("img")}
+
+
+def test_hero_is_preloaded_with_high_priority(sample):
+    (hero, _, _), _, updated, report = sample
+    assert report.hero == hero
+    document = parse_html(updated.html)
+    preloads = [
+        link for link in document.find_all("link")
+        if link.get("rel") == "preload" and link.get("as") == "image"
+    ]
+    assert len(preloads) == 1
+    assert preloads[0].get("href") == hero
+    assert preloads[0].get("fetchpriority") == "high"
+    hero_img = images_by_src(updated.html)[hero]
+    assert hero_img.get("fetchpriority") == "high"
+    assert hero_img.get("loading") != "lazy"
+
+
+def test_preload_comes_before_the_stylesheet(sample):
+    _, _, updated, _ = sample
+    head = parse_html(updated.html).find("head")
+    links = [el for el in head.children if el.tag == "link"]
+    assert links[0].get("rel") == "preload"
+    assert any(link.get("rel") == "stylesheet" for link in links[1:])
+
+
+def test_images_below_the_fold_are_lazy(sample):
+    (hero, below, _), _, updated, report = sample
+    assert report.lazy == below
+    for src, img in images_by_src(updated.html).items():
+        if src in below:
+            assert img.get("loading") == "lazy"
+            assert img.get("decoding") == "async"
+        else:
+            assert img.get("loading") is None
+
+
+def test_image_sizes_come_from_the_files(sample):
+    _, spec, updated, report = sample
+    images = images_by_src(updated.html)
+    assert sorted(report.sized) == sorted(images)
+    for src, img in images.items():
+        width, height = read_image_size(SITE_ROOT / src)
+        assert img.get("width") == str(width)
+        assert img.get("height") == str(height)
+
+
+def test_local_scripts_are_deferred(sample):
+    (_, _, script), _, updated, report = sample
+    assert report.deferred == [script]
+    scripts = parse_html(updated.html).find_all("script")
+    assert [el.get("src") for el in scripts if "defer" in el.attrs] == [script]
+
+
+def test_css_and_js_are_unchanged(sample):
+    _, spec, updated, _ = sample
+    assert updated.css == spec.css
+    assert updated.js == spec.js
+    assert updated.images == spec.images
+
+
+def test_second_pass_changes_nothing(sample):
+    _, _, updated, _ = sample
+    again, report = add_page_hints(updated, site_root=SITE_ROOT)
+    assert again.html == updated.html
+    assert report.hero is None
+    assert report.lazy == report.sized == report.deferred == []
+
+
+def test_without_site_root_no_sizes_are_added():
+    spec = load_sample("website_spec.json")
+    updated, report = add_page_hints(spec)
+    assert report.sized == []
+    assert all(img.get("width") is None for img in images_by_src(updated.html).values())
@@ -0,0 +1,81 @@
+# webapp/tests/test_prompt_index.py
+
+from services.prompt_index import INDEX_FILENAME, PromptIndex, jaccard, normalize_prompt, shingles
+
+SETTINGS = ("dall-e-3", "1024x1024", "standard")
+PROMPT = "A photo of a red bicycle leaning against a brick wall at sunset"
+
+
+def test_normalize_drops_case_punctuation_and_filler_words():
+    assert normalize_prompt("An IMAGE of the Red bicycle, at sunset!") == "red bicycle sunset"
+    assert normalize_prompt(PROMPT) == normalize_prompt("red  bicycle leaning against brick wall sunset.")
+
+
+def test_shingles_and_jaccard():
+    assert shingles("red bicycle sunset") == frozenset({"red bicycle", "bicycle sunset"})
+    assert shingles("bicycle") == frozenset({"bicycle"})
+    assert jaccard(frozenset(), frozenset()) == 1.0
+    assert jaccard(frozenset({"a", "b"}), frozenset({"b", "c"})) == 1 / 3
+
+
+def test_a_reworded_prompt_is_found(tmp_path):
+    index = PromptIndex(tmp_path / INDEX_FILENAME)
+    index.add("k1", PROMPT, *SETTINGS)
+    assert index.find("Picture of the red bicycle leaning against a brick wall, sunset", *SETTINGS) == ("k1", 1.0)
+
+
+def test_a_different_prompt_is_not_found(tmp_path):
+    index = PromptIndex(tmp_path / INDEX_FILENAME)
+    index.add("k1", PROMPT, *SETTINGS)
+    assert index.find("A blue sailboat on a calm lake at dawn", *SETTINGS) is None
+
+
+def test_matches_need_the_same_settings(tmp_path):
+    index = PromptIndex(tmp_path / INDEX_FILENAME)
+    index.add("k1", PROMPT, *SETTINGS)
+    assert index.find(PROMPT, "dall-e-3", "1792x1024", "standard") is None
+    assert index.find(PROMPT, "dall-e-3", "1024x1024", "hd") is None
+
+
+def test_threshold(tmp_path):
+    prompt = "red bicycle leaning against brick wall sunset"
+    close = "red bicycle leaning against brick wall dusk"
+    strict = PromptIndex(tmp_path / "strict.json", threshold=0.95)
+    loose = PromptIndex(tmp_path / "loose.json", threshold=0.5)
+    for index in (strict, loose):
+        index.add("k1", prompt, *SETTINGS)
+    assert strict.find(close, *SETTINGS) is None
+    assert loose.find(close, *SETTINGS) == ("k1", 5 / 7)
+
+
+def test_exclude_and_discard(tmp_path):
+    index = PromptIndex(tmp_path / INDEX_FILENAME)
+    index.add("k1", PROMPT, *SETTINGS)
+    assert index.find(PROMPT, *SETTINGS, exclude=("k1",)) is None
+    index.discard("k1")
+    index.discard("missing")
+    assert index.find(PROMPT, *SETTINGS) is None
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    index = PromptIndex(tmp_path / INDEX_FILENAME, max_entries=2)
+    index.add("k1", "red bicycle", *SETTINGS)
+    index.add("k2", "blue sailboat", *SETTINGS)
+    index.add("k3", "green forest", *SETTINGS)
+    assert index.find("red bicycle", *SETTINGS) is None
+    assert index.find("green forest", *SETTINGS) == ("k3", 1.0)
+
+
+def test_entries_persist(tmp_path):
+    path = tmp_path / "cache" / INDEX_FILENAME
+    PromptIndex(path).add("k1", PROMPT, *SETTINGS)
+    assert PromptIndex(path).find(PROMPT, *SETTINGS) == ("k1", 1.0)
+
+
+def test_an_unreadable_index_starts_empty(tmp_path, capsys):
+    path = tmp_path / INDEX_FILENAME
+    path.write_text("not json", encoding="utf-8")
+    index = PromptIndex(path)
+    assert "Ignoring unreadable prompt index" in capsys.readouterr().out
+    index.add("k1", PROMPT, *SETTINGS)
+    assert PromptIndex(path).find(PROMPT, *SETTINGS) == ("k1", 1.0)
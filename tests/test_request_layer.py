@@ -0,0 +1,184 @@
+# webapp/tests/test_request_layer.py
+
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from services import latency_stats, request_layer
+from services.latency_stats import LatencyStats
+from services.request_layer import RequestBudget, TokenBucket, call_with_retry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Frozen unless advanced, so buckets only refill when a test says so
+    fake = FakeClock()
+    monkeypatch.setattr(request_layer.time, "monotonic", fake)
+    return fake
+
+
+@pytest.fixture
+def budget(clock, monkeypatch):
+    budget = RequestBudget(requests_per_minute=600, tokens_per_minute=10_000, max_retries=2)
+    monkeypatch.setitem(request_layer.BUDGETS, "chat", budget)
+    # ConnectionError stands in for the OpenAI errors worth retrying; no backoff wait
+    monkeypatch.setattr(request_layer, "retryable_errors", lambda: (ConnectionError,))
+    monkeypatch.setattr(request_layer.random, "uniform", lambda low, high: 0.0)
+    monkeypatch.setattr(latency_stats, "_stats", LatencyStats())
+    return budget
+
+
+def completion(total_tokens: int):
+    return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=total_tokens // 2, completion_tokens=total_tokens - total_tokens // 2, total_tokens=total_tokens))
+
+
+class FakeClient:
+    """
+    Answers calls in turn from a script: an exception is raised, anything
+    else is returned after the given delay.
+    """
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, timeout=None):
+        with self._lock:
+            step = self.script[min(self.calls, len(self.script) - 1)]
+            self.calls += 1
+        delay, outcome = step
+        time.sleep(delay)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def spent(budget: RequestBudget) -> float:
+    return round(budget.tokens.capacity - budget.tokens.tokens, 3)
+
+
+# Token bucket
+
+def test_bucket_rejects_a_rate_that_is_not_positive():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+    with pytest.raises(ValueError):
+        TokenBucket(-5)
+
+
+def test_bucket_refills_at_its_rate_up_to_capacity(clock):
+    bucket = TokenBucket(60)
+    bucket.acquire(60)
+    assert bucket.tokens == 0
+    clock.advance(10)
+    bucket.adjust(0)
+    assert bucket.tokens == pytest.approx(10)
+    clock.advance(3600)
+    bucket.adjust(0)
+    assert bucket.tokens == bucket.capacity
+
+
+def test_bucket_adjust_settles_an_estimate(clock):
+    bucket = TokenBucket(1000)
+    bucket.acquire(300)
+    bucket.adjust(100 - 300)  # the request used 100 tokens, not 300
+    assert bucket.tokens == pytest.approx(900)
+    bucket.adjust(-10_000)
+    assert bucket.tokens == bucket.capacity
+
+
+def test_bucket_waits_for_tokens(clock, monkeypatch):
+    bucket = TokenBucket(60)
+    bucket.acquire(60)
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock.advance(seconds)
+
+    monkeypatch.setattr(request_layer.time, "sleep", fake_sleep)
+    bucket.acquire(5)
+    assert sum(sleeps) == pytest.approx(5)
+    assert all(seconds <= 1.0 for seconds in sleeps)
+
+
+# Retries
+
+def test_retry_gives_back_the_tokens_of_failed_attempts(budget):
+    client = FakeClient((0, ConnectionError("reset")), (0, ConnectionError("reset")), (0, completion(120)))
+    result = call_with_retry("chat", client, estimated_tokens=500, hedge=False)
+    assert result.usage.total_tokens == 120
+    assert client.calls == 3
+    assert spent(budget) == 120
+
+
+def test_exhausted_retries_charge_nothing(budget):
+    client = FakeClient((0, ConnectionError("reset")))
+    with pytest.raises(ConnectionError):
+        call_with_retry("chat", client, estimated_tokens=500, hedge=False)
+    assert client.calls == budget.max_retries + 1
+    assert spent(budget) == 0
+
+
+def test_other_errors_are_not_retried_and_charge_nothing(budget):
+    client = FakeClient((0, ValueError("bad request")), (0, completion(120)))
+    with pytest.raises(ValueError):
+        call_with_retry("chat", client, estimated_tokens=500, hedge=False)
+    assert client.calls == 1
+    assert spent(budget) == 0
+
+
+# Hedging
+
+def hedge_after(budget: RequestBudget, seconds: float):
+    budget.hedge_percentile = 50
+    for _ in range(latency_stats.MIN_SAMPLES):
+        latency_stats.get_latency_stats().record("model/Spec", seconds)
+
+
+def test_fast_call_is_not_hedged(budget):
+    hedge_after(budget, 0.2)
+    client = FakeClient((0, completion(100)))
+    call_with_retry("chat", client, estimated_tokens=500, latency_key="model/Spec")
+    assert client.calls == 1
+    assert spent(budget) == 100
+
+
+def test_hedge_wins_and_both_requests_are_charged_their_usage(budget):
+    hedge_after(budget, 0.05)
+    client = FakeClient((0.5, completion(100)), (0, completion(80)))
+    result = call_with_retry("chat", client, estimated_tokens=500, latency_key="model/Spec")
+    assert result.usage.total_tokens == 80
+    time.sleep(0.6)  # the losing primary finishes in the background
+    assert client.calls == 2
+    assert spent(budget) == 180
+
+
+def test_failed_primary_is_not_charged_when_the_hedge_answers(budget):
+    hedge_after(budget, 0.05)
+    client = FakeClient((0.2, ValueError("dropped")), (0.3, completion(80)))
+    result = call_with_retry("chat", client, estimated_tokens=500, latency_key="model/Spec")
+    assert result.usage.total_tokens == 80
+    assert spent(budget) == 80
+
+
+def test_losing_request_that_fails_is_not_charged(budget):
+    hedge_after(budget, 0.05)
+    client = FakeClient((0.4, ValueError("dropped")), (0, completion(80)))
+    call_with_retry("chat", client, estimated_tokens=500, latency_key="model/Spec")
+    time.sleep(0.5)
+    assert spent(budget) == 80
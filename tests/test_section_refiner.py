@@ -0,0 +1,109 @@
+# webapp/tests/test_section_refiner.py
+
+from generators.section_refiner import (
+    SectionSpec,
+    _merge_css,
+    _merge_images,
+    _rule_applies,
+    _rule_names,
+    _section_names,
+    find_sections,
+)
+from generators.website_generator import ImageSpec
+from services.css_rules import parse_css
+from services.html_dom import parse_html
+
+CSS = """body { margin: 0; }
+.hero { color: red; }
+.footer { color: gray; }
+"""
+
+
+def section(css: str, html: str = "<section></section>", images=()) -> SectionSpec:
+    return SectionSpec(html=html, css=css, images=list(images))
+
+
+def merge(results, section_rules):
+    return _merge_css(CSS, parse_css(CSS), section_rules, results)
+
+
+def test_rule_changed_by_its_section_is_replaced():
+    new_css, conflicts, overrides = merge([section(".hero { color: blue; }"), section(".footer { color: gray; }")], [[1], [2]])
+    assert ".hero { color: blue; }" in new_css
+    assert ".hero { color: red; }" not in new_css
+    assert conflicts == overrides == []
+
+
+def test_rule_not_sent_to_a_section_is_applied_and_reported():
+    # Section 0 was only given .hero, but also restyled the shared body rule
+    results = [section(".hero { color: red; }\nbody { margin: 0 auto; }"), section(".footer { color: gray; }")]
+    new_css, conflicts, overrides = merge(results, [[1], [2]])
+    assert "body { margin: 0 auto; }" in new_css
+    assert "body { margin: 0; }" not in new_css
+    assert conflicts == []
+    assert len(overrides) == 1 and "'body'" in overrides[0] and "[0]" in overrides[0]
+
+
+def test_unsent_rule_conflicting_with_another_section_keeps_the_original():
+    results = [section("body { margin: 1px; }"), section("body { margin: 2px; }")]
+    new_css, conflicts, overrides = merge(results, [[0], [2]])
+    assert "body { margin: 0; }" in new_css
+    assert len(conflicts) == 1 and "'body'" in conflicts[0]
+    assert overrides == []
+
+
+def test_agreeing_sections_update_a_shared_rule():
+    results = [section("body { margin: 4px; }"), section("body  {  margin: 4px; }")]
+    new_css, conflicts, _ = merge(results, [[0, 1], [0, 2]])
+    assert "body { margin: 4px; }" in new_css
+    assert conflicts == []
+
+
+def test_new_rules_are_appended_once():
+    results = [section(".badge { color: gold; }"), section(".badge { color: gold; }")]
+    new_css, conflicts, _ = merge(results, [[1], [2]])
+    assert new_css.count(".badge") == 1
+    assert new_css.startswith(CSS.rstrip())
+    assert conflicts == []
+
+
+def test_failed_sections_change_nothing():
+    new_css, conflicts, overrides = merge([None, None], [[1], [2]])
+    assert new_css == CSS
+    assert conflicts == overrides == []
+
+
+def test_tag_only_selectors_apply_to_sections_containing_the_tags():
+    document = parse_html("<body><header><h1>Hi</h1></header><section class='about'><p>x</p></section></body>")
+    header, about = find_sections(document)
+    rule = parse_css("header h1 { font-size: 2em; }")[0]
+    assert _rule_applies(_rule_names(rule), _section_names(header))
+    assert not _rule_applies(_rule_names(rule), _section_names(about))
+    class_rule = parse_css(".about p { margin: 0; }")[0]
+    assert _rule_applies(_rule_names(class_rule), _section_names(about))
+    assert not _rule_applies(_rule_names(class_rule), _section_names(header))
+
+
+def test_merged_images_follow_the_refined_sections():
+    hero = ImageSpec(filename="images/hero.png", prompt="a hero")
+    team = ImageSpec(filename="images/team.png", prompt="a team")
+    logo = ImageSpec(filename="images/logo.png", prompt="a logo")
+    new_team = ImageSpec(filename="images/team.png", prompt="a smiling team")
+    extra = ImageSpec(filename="images/extra.png", prompt="more")
+    results = [section("", images=[]), section("", images=[new_team, extra]), None]
+    merged, conflicts = _merge_images([hero, team, logo], [[hero], [team], [logo]], results)
+    # Section 0 dropped its image; section 2 failed, so its image stays
+    assert [img.filename for img in merged] == ["images/team.png", "images/logo.png", "images/extra.png"]
+    assert merged[0].prompt == "a smiling team"
+    assert conflicts == []
+
+
+def test_an_image_changed_by_two_sections_keeps_the_first():
+    hero = ImageSpec(filename="images/hero.png", prompt="a hero")
+    results = [
+        section("", images=[ImageSpec(filename="images/hero.png", prompt="first")]),
+        section("", images=[ImageSpec(filename="images/hero.png", prompt="second")]),
+    ]
+    merged, conflicts = _merge_images([hero], [[hero], [hero]], results)
+    assert [img.prompt for img in merged] == ["first"]
+    assert len(conflicts) == 1
@@ -0,0 +1,76 @@
+# webapp/tests/test_site_pipeline.py
+
+import json
+import asyncio
+import argparse
+from pathlib import Path
+
+from generators import image_generator
+from generators.image_generator import ImageJobPool
+from generators.image_planner import plan_image, plan_images
+from generators.website_generator import WebsiteSpec
+from services import site_pipeline
+from services.site_pipeline import build_site_pipeline
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def pipeline_args(output_dir: Path) -> argparse.Namespace:
+    return argparse.Namespace(
+        iterations=1,
+        details="a family history site",
+        spec_file=None,
+        output_spec=None,
+        model="gpt-4o-mini",
+        spec_model=None,
+        refine_model=None,
+        improvement="",
+        refine_mode="full",
+        section_concurrency=4,
+        stream_spec=True,
+        no_image_planning=False,
+        no_speculative_images=False,
+        no_page_hints=True,
+        minify=False,
+        critical_css=False,
+        precompress=False,
+        hashed_assets=False,
+        output_dir=output_dir,
+        images_dir=output_dir / "images",
+    )
+
+
+def test_streamed_image_is_generated_once(tmp_path, monkeypatch):
+    with open(REPO_ROOT / "refined_website_spec.json", "r", encoding="utf-8") as f:
+        spec = WebsiteSpec(**json.load(f))
+    hero = spec.images[0]
+    # The filename says nothing about the size, but the markup does
+    assert plan_image(hero) is None
+    assert plan_images(spec)[hero.filename].size != "1024x1024"
+
+    def fake_stream(details, model_name, on_image=None, on_file=None, cache=None):
+        for image_spec in spec.images:
+            on_image(image_spec)
+        return spec
+
+    generations = []
+
+    def fake_generate(image_spec, output_dir, size, quality, model, *rest):
+        generations.append((image_spec.filename, model, size, quality))
+        output_dir.mkdir(parents=True, exist_ok=True)
+        path = output_dir / Path(image_spec.filename).name
+        path.write_bytes(b"image")
+        return path
+
+    monkeypatch.setattr(site_pipeline, "generate_website_spec_stream", fake_stream)
+    monkeypatch.setattr(image_generator, "generate_and_save_image", fake_generate)
+
+    args = pipeline_args(tmp_path / "site")
+    with ImageJobPool(args.images_dir, concurrency=2) as pool:
+        values = asyncio.run(build_site_pipeline(args, None, pool, print_spec=False).run())
+
+    filenames = [filename for filename, *_ in generations]
+    assert sorted(filenames) == sorted(image.filename for image in spec.images)
+    assert (hero.filename, "dall-e-3", "1024x1024", "standard") in generations
+    assert set(values["image_paths"]) == {image.filename for image in spec.images}
+    assert values["image_failures"] == {}
@@ -0,0 +1,80 @@
+# webapp/tests/test_spec_patch.py
+
+from types import SimpleNamespace
+
+import pytest
+
+from generators.website_generator import (
+    CompletionRefused,
+    ImageSpec,
+    PatchApplyError,
+    SpecEdit,
+    SpecPatch,
+    WebsiteSpec,
+    _parsed_result,
+    apply_spec_patch,
+)
+
+SPEC = WebsiteSpec(
+    html="<h1>Hello</h1>\n<p>Hello again</p>",
+    css="h1 { color: red; }",
+    js="console.log('hi');",
+    images=[ImageSpec(filename="images/hero.png", prompt="a hero")],
+)
+
+
+def patch(*edits, images=None):
+    return SpecPatch(edits=[SpecEdit(file=f, search=s, replace=r) for f, s, r in edits], images=images or SPEC.images)
+
+
+def test_edits_apply_in_order_to_each_file():
+    updated = apply_spec_patch(SPEC, patch(
+        ("html", "<h1>Hello</h1>", "<h1>Welcome</h1>"),
+        ("html", "Welcome", "Welcome home"),
+        ("css", "red", "navy"),
+    ))
+    assert updated.html == "<h1>Welcome home</h1>\n<p>Hello again</p>"
+    assert updated.css == "h1 { color: navy; }"
+    assert updated.js == SPEC.js
+
+
+def test_images_are_replaced_by_the_patch_list():
+    images = [ImageSpec(filename="images/team.png", prompt="a team")]
+    assert apply_spec_patch(SPEC, patch(images=images)).images == images
+
+
+@pytest.mark.parametrize("edit, message", [
+    (("html", "", "x"), "empty search"),
+    (("html", "Goodbye", "x"), "matches 0 times"),
+    (("html", "Hello", "Hi"), "matches 2 times"),
+])
+def test_bad_edits_raise_and_leave_the_spec_alone(edit, message):
+    original = SPEC.model_copy(deep=True)
+    with pytest.raises(PatchApplyError, match=message):
+        apply_spec_patch(SPEC, patch(("css", "red", "blue"), edit))
+    assert SPEC == original
+
+
+def test_an_edit_can_depend_on_an_earlier_one():
+    # The second search text only exists after the first edit
+    updated = apply_spec_patch(SPEC, patch(("js", "'hi'", "'hi', 'there'"), ("js", "'there'", "'you'")))
+    assert updated.js == "console.log('hi', 'you');"
+
+
+def completion(parsed=None, refusal=None, finish_reason="stop"):
+    message = SimpleNamespace(parsed=parsed, refusal=refusal)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)])
+
+
+def test_parsed_result_is_returned():
+    assert _parsed_result(completion(parsed=SPEC), "gpt-4o") is SPEC
+
+
+@pytest.mark.parametrize("kwargs, reason", [
+    ({"refusal": "I can't help with that."}, "refused: I can't help with that."),
+    ({"finish_reason": "length"}, "cut off"),
+    ({"finish_reason": "content_filter"}, "content_filter"),
+])
+def test_missing_parsed_result_raises(kwargs, reason):
+    with pytest.raises(CompletionRefused, match=reason):
+        _parsed_result(completion(**kwargs), "gpt-4o")
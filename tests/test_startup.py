@@ -0,0 +1,66 @@
+# webapp/tests/test_startup.py
+
+import os
+import sys
+import subprocess
+from pathlib import Path
+from typing import Dict
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Packages only network stages need; the offline path must not import them
+DEFERRED_MODULES = ("openai", "requests", "httpx")
+# Import time budget of main.py in milliseconds; STARTUP_BUDGET_MS overrides it on slow machines
+BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 500))
+RUNS = 3
+
+
+def measure_imports(module: str = "main") -> Dict[str, int]:
+    """
+    Imports the module in a fresh interpreter under `python -X importtime`,
+    without OpenAI credentials, and returns the cumulative import time in
+    microseconds of every module it loaded.
+    """
+    env = {name: value for name, value in os.environ.items() if not name.startswith("OPENAI_")}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, f"Importing {module} failed:\n{result.stderr}"
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def fastest_run() -> Dict[str, int]:
+    runs = [measure_imports() for _ in range(RUNS)]
+    return min(runs, key=lambda times: times.get("main", 0))
+
+
+def test_network_packages_are_imported_lazily():
+    times = measure_imports()
+    eager = sorted({name.split(".")[0] for name in times if name.split(".")[0] in DEFERRED_MODULES})
+    assert not eager, f"importing main loads {', '.join(eager)}; these must be imported only when a stage needs the network"
+
+
+def test_startup_is_within_budget():
+    times = fastest_run()
+    total_ms = times.get("main", 0) / 1000
+    slowest = sorted(
+        ((name, micros) for name, micros in times.items() if name.split(".")[0] in ("generators", "integrators", "services")),
+        key=lambda item: -item[1],
+    )[:5]
+    report = "\n".join(f"  {name:<36}{micros / 1000:>8.1f} ms" for name, micros in slowest)
+    assert total_ms <= BUDGET_MS, (
+        f"import time of main.py is {total_ms:.0f} ms, over the budget of {BUDGET_MS:.0f} ms; slowest modules:\n{report}"
+    )